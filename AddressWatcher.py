@@ -0,0 +1,119 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the address watcher, used to wait for an adapter
+to get its address (eg from DHCP) without polling on a fixed interval.
+
+The watcher listens to the kernel's address change notifications: a
+NETLINK_ROUTE socket subscribed to the v4 and v6 address groups on linux,
+a PF_ROUTE socket on mac (and the BSDs). Each notification re-evaluates the
+caller's condition, so a wait finishes as soon as the address is assigned.
+Where neither is available (windows, jython) the condition is polled.
+
+host_addresses() lists every address of the host from the ip/ifconfig/
+ipconfig output (or only those of one adapter), and wait_for_network()
+combines both with the NetworkTable to wait until the host, or one of its
+adapters, has an address on a named network. Networks can share a range
+(Management and Untrusted do), so a wait for an adapter that is being
+brought up must look at that adapter only.
+'''
+import select
+import socket
+import subprocess
+import sys
+import time
+import logging
+
+import NetworkTable
+
+LOGGER = logging.getLogger("automation")
+
+AF_NETLINK         = 16
+NETLINK_ROUTE      = 0
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+AF_ROUTE = 17
+
+def _event_socket():
+    """Returns a socket that becomes readable whenever an address of the host
+    changes, or None if there is no such facility here"""
+    try:
+        if sys.platform.startswith('linux'):
+            sock = socket.socket(AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            return sock
+        if sys.platform == 'darwin' or 'bsd' in sys.platform:
+            return socket.socket(AF_ROUTE, socket.SOCK_RAW, 0)
+    except (socket.error, AttributeError, TypeError), exc:
+        LOGGER.debug('No address change notifications: %s' % exc)
+    return None
+
+def host_addresses(adapter=None):
+    """Returns every v4 and v6 address currently assigned to the host, or
+    to the named adapter only"""
+    if adapter is not None:
+        if sys.platform.startswith('win'):
+            cmd = 'netsh interface ip show addresses "%s" & ' \
+                  'netsh interface ipv6 show addresses "%s"' %(adapter, adapter)
+        elif sys.platform.startswith('linux'):
+            cmd = 'ip addr show dev "%s" || ifconfig "%s"' %(adapter, adapter)
+        else:
+            cmd = 'ifconfig "%s"' % adapter
+    elif sys.platform.startswith('win'):
+        cmd = 'ipconfig'
+    elif sys.platform.startswith('linux'):
+        cmd = 'ip addr || ifconfig -a'
+    else:
+        cmd = 'ifconfig -a'
+    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    return NetworkTable.addresses_in(process.communicate()[0])
+
+class AddressWatcher(object):
+    '''
+    Waits for a condition on the host addresses to become true.
+
+        poll_interval - how often the condition is re-evaluated when no
+                        notification arrives (it is also the only way to
+                        notice changes where notifications are unavailable)
+    '''
+
+    def __init__(this, poll_interval=5.0):
+        this.poll_interval = poll_interval
+
+    def wait(this, check, timeout):
+        """Wait until check() returns something true, and return it. Returns
+        the last (false) result of check() if timeout seconds passed."""
+        deadline = time.time() + timeout
+        # listen before the first check, so no change can slip in between
+        sock = _event_socket()
+        try:
+            while True:
+                result = check()
+                remaining = deadline - time.time()
+                if result or remaining <= 0:
+                    return result
+                wait = min(remaining, this.poll_interval)
+                if sock is None:
+                    time.sleep(wait)
+                    continue
+                (readable, w, x) = select.select([sock], [], [], wait)
+                while readable:
+                    # only the fact that something changed matters, drain
+                    # the burst of notifications and look at the addresses
+                    # again
+                    sock.recv(65536)
+                    (readable, w, x) = select.select([sock], [], [], 0)
+        finally:
+            if sock is not None:
+                sock.close()
+
+def wait_for_network(name, timeout, table=None, adapter=None):
+    """Wait until the host (or the named adapter, if given) has an address
+    on the named config network. Returns the address, or None if there was
+    none within timeout."""
+    if table is None:
+        table = NetworkTable.get_table()
+    return AddressWatcher().wait(
+            lambda: table.address_on(name, host_addresses(adapter)), timeout)
@@ -0,0 +1,293 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the incremental checkpoint format used to persist
+the progress of a test run between full saves of the runner state.
+
+A save directory (results/<name>/) holds, next to save_state.pickle and
+summary.pickle:
+
+    checkpoint.journal  - an append only journal of binary records. Each
+                          record is a '!II' (length, crc32) header followed
+                          by a pickled (key, record, time) triple. Every
+                          append is flushed and fsync'ed, so it survives a
+                          crash.
+    checkpoint.snapshot - the journal compacted into one dictionary holding
+                          the latest record per key. Written to a temporary
+                          file, fsync'ed and renamed into place.
+    checkpoint.summary  - a small pickled dictionary of the summary values
+                          changed since the last full save (the resultSetId
+                          and uploadError of setuploadresult), which getsaves
+                          shows over those of summary.pickle.
+    checkpoint.generation - the number of full saves of the state so far.
+
+Saving a testcase result is one append (O(1)) instead of rewriting the
+whole state (O(suite)). Loading replays the snapshot plus the journal on
+top of save_state.pickle. A torn record at the end of the journal (from a
+crash in the middle of an append) is detected by its crc and ignored.
+
+The runner still saves its full state now and then (eg at the end of a run),
+and that state already holds every result checkpointed before it. Each
+record is therefore stamped with the generation it was made in, and every
+full save is followed by saved(), which starts a new generation, drops the
+summary and compacts the journal. Records of older generations are ignored
+when loading and dropped when compacting, so they never roll the newer full
+state back. A crash between a full save and saved() only replays records the
+full state already holds.
+'''
+import cPickle
+import os
+import struct
+import threading
+import zlib
+
+JOURNAL_FILE  = 'checkpoint.journal'
+SNAPSHOT_FILE = 'checkpoint.snapshot'
+SUMMARY_FILE  = 'checkpoint.summary'
+GENERATION_FILE = 'checkpoint.generation'
+
+HEADER = struct.Struct('!II')
+
+# The testcase attributes saved with each testcase record
+TESTCASE_FIELDS = ['result', 'startTime', 'finishTime', 'log', 'resultData']
+
+# The resultState attributes saved with an upload result record
+RESULT_STATE_FIELDS = ['uploadState', 'resultSetId', 'uploadError',
+                       'uploadedBy']
+
+# Maps testcase results onto the runner counters they are counted in
+RESULT_COUNTERS = {'pass'  : 'passCount',
+                   'fail'  : 'failCount',
+                   'block' : 'blockCount',
+                   'crash' : 'crashCount',
+                   'error' : 'errorCount'}
+
+def _replace(src, dst):
+    """Atomically rename src over dst"""
+    if os.name == 'nt' and os.path.exists(dst):
+        # rename does not replace an existing file on windows
+        os.remove(dst)
+    os.rename(src, dst)
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    fp = open(tmp_path, 'wb')
+    try:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+    finally:
+        fp.close()
+    _replace(tmp_path, path)
+
+def read_summary(save_dir):
+    """Returns the checkpoint summary of save_dir, or an empty dictionary
+    if there is none"""
+    try:
+        fp = open(os.path.join(save_dir, SUMMARY_FILE), 'rb')
+        try:
+            return cPickle.load(fp)
+        finally:
+            fp.close()
+    except (IOError, EOFError, cPickle.UnpicklingError):
+        return {}
+
+class Checkpoint(object):
+    '''
+    The incremental checkpoint of one save directory.
+
+        save_dir      - the directory holding the save state
+        compact_after - compact the journal once it holds this many records
+    '''
+
+    def __init__(this, save_dir, compact_after=256):
+        this.save_dir      = save_dir
+        this.compact_after = compact_after
+        this.journal_path  = os.path.join(save_dir, JOURNAL_FILE)
+        this.snapshot_path = os.path.join(save_dir, SNAPSHOT_FILE)
+        this.summary_path  = os.path.join(save_dir, SUMMARY_FILE)
+        this.generation_path = os.path.join(save_dir, GENERATION_FILE)
+        this.lock          = threading.Lock()
+        this.__generation  = None
+        this.__journal     = None
+        this.__count       = None
+        this.__valid_size  = 0
+
+    def append(this, key, record):
+        """Durably add a record to the journal. Only the latest record for
+        each key is kept when the journal is compacted."""
+        with this.lock:
+            data = cPickle.dumps((key, record, this.__current()),
+                                 cPickle.HIGHEST_PROTOCOL)
+            if this.__journal is None:
+                if not os.path.isdir(this.save_dir):
+                    os.makedirs(this.save_dir)
+                this.__count = len(this.__read_journal())
+                this.__journal = open(this.journal_path, 'ab')
+                # drop a torn record, so new records are not appended
+                # behind something the reader will stop at
+                this.__journal.truncate(this.__valid_size)
+            this.__journal.write(HEADER.pack(len(data),
+                                             zlib.crc32(data) & 0xffffffff))
+            this.__journal.write(data)
+            this.__journal.flush()
+            os.fsync(this.__journal.fileno())
+            this.__count += 1
+            if this.__count >= this.compact_after:
+                this.__compact()
+
+    def save_testcase(this, testcase):
+        """Checkpoint the result of a single testcase"""
+        record = dict([(field, getattr(testcase, field, None))
+                       for field in TESTCASE_FIELDS])
+        this.append(('testcase', testcase.friendlyName), record)
+
+    def save_result_state(this, result_state):
+        """Checkpoint the upload state of the results"""
+        record = dict([(field, getattr(result_state, field, None))
+                       for field in RESULT_STATE_FIELDS])
+        this.append(('resultState', None), record)
+
+    def save_summary(this, summary):
+        """Atomically replace the summary with the given dictionary"""
+        with this.lock:
+            _write_atomic(this.summary_path,
+                          cPickle.dumps(summary, cPickle.HIGHEST_PROTOCOL))
+
+    def records(this):
+        """Returns a dictionary of the latest record for every key, from the
+        snapshot and the journal, leaving out the records older than the
+        full save state"""
+        with this.lock:
+            return dict([(key, record) for (key, (record, stamp))
+                         in this.__latest().items()])
+
+    def generation(this):
+        """Returns the number of full saves of the state. Records made in
+        an older generation are already part of the full state."""
+        with this.lock:
+            return this.__current()
+
+    def saved(this):
+        """Start a new generation, once the full state was saved: the
+        records and summary so far are part of it"""
+        with this.lock:
+            if not os.path.isdir(this.save_dir):
+                os.makedirs(this.save_dir)
+            this.__generation = this.__current() + 1
+            _write_atomic(this.generation_path, str(this.__generation))
+            try:
+                os.remove(this.summary_path)
+            except OSError:
+                pass
+            this.__compact()
+
+    def compact(this):
+        """Fold the journal into the snapshot"""
+        with this.lock:
+            this.__compact()
+
+    def close(this):
+        with this.lock:
+            if this.__journal is not None:
+                this.__journal.close()
+                this.__journal = None
+
+    def replay(this, runner, find=None):
+        """Apply the checkpointed records onto the runner's loaded suite and
+        state, keeping the result counters consistent. Testcases are looked
+        up with find(name) if given, or the suite's findTestCase() otherwise.
+        Returns the number of records applied."""
+        if find is None and runner.suite is not None:
+            find = runner.suite.findTestCase
+        applied = 0
+        for (key, record) in this.records().items():
+            (kind, name) = key
+            if kind == 'resultState':
+                for field, value in record.items():
+                    setattr(runner.DATA['resultState'], field, value)
+                applied += 1
+            elif kind == 'testcase' and runner.suite is not None:
+                try:
+                    testcase = find(name)
+                except AttributeError:
+                    continue
+                this.__count_result(runner, testcase.result, -1)
+                for field, value in record.items():
+                    setattr(testcase, field, value)
+                this.__count_result(runner, testcase.result, 1)
+                applied += 1
+        return applied
+
+    def __count_result(this, runner, result, delta):
+        counter = RESULT_COUNTERS.get(str(result).lower())
+        if counter is None:
+            return
+        runner.DATA[counter]   += delta
+        runner.DATA['runCount'] += delta
+
+    def __current(this):
+        if this.__generation is None:
+            try:
+                fp = open(this.generation_path, 'rb')
+                try:
+                    this.__generation = int(fp.read())
+                finally:
+                    fp.close()
+            except (IOError, ValueError):
+                this.__generation = 0
+        return this.__generation
+
+    def __latest(this):
+        # the latest (record, generation) of every key made since the last
+        # full save
+        generation = this.__current()
+        records = this.__read_snapshot()
+        for (key, record, stamp) in this.__read_journal():
+            records[key] = (record, stamp)
+        return dict([(key, value) for (key, value) in records.items()
+                     if value[1] >= generation])
+
+    def __read_snapshot(this):
+        try:
+            fp = open(this.snapshot_path, 'rb')
+            try:
+                return cPickle.load(fp)
+            finally:
+                fp.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return {}
+
+    def __read_journal(this):
+        records = []
+        this.__valid_size = 0
+        try:
+            fp = open(this.journal_path, 'rb')
+        except IOError:
+            return records
+        try:
+            while True:
+                header = fp.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                (length, crc) = HEADER.unpack(header)
+                data = fp.read(length)
+                if len(data) < length or \
+                   zlib.crc32(data) & 0xffffffff != crc:
+                    # torn write at the end of the journal
+                    break
+                records.append(cPickle.loads(data))
+                this.__valid_size += HEADER.size + length
+        finally:
+            fp.close()
+        return records
+
+    def __compact(this):
+        _write_atomic(this.snapshot_path,
+                      cPickle.dumps(this.__latest(), cPickle.HIGHEST_PROTOCOL))
+        # the snapshot is durable, start a fresh journal
+        if this.__journal is not None:
+            this.__journal.close()
+        _write_atomic(this.journal_path, '')
+        this.__journal = open(this.journal_path, 'ab')
+        this.__count = 0
@@ -0,0 +1,172 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the engine used to clean up the installers and
+results folders. Nothing is deleted on the caller's thread: each entry is
+first renamed aside (which is atomic on the same file system), so it
+disappears from view immediately, and the actual deletion happens on a pool
+of background threads.
+
+The engine also implements the retention policy for saved results:
+
+    keep_saves - always keep the newest N save directories
+    keep_days  - always keep save directories modified in the last X days
+    max_bytes  - once the above are applied, remove the oldest save
+                 directories until the results folder fits in this size
+'''
+import os
+import shutil
+import threading
+import time
+import logging
+import Queue
+
+LOGGER = logging.getLogger("automation")
+
+TRASH_PREFIX = '.trash-'
+
+def _tree_size(path):
+    """Returns the number of bytes used by the files under path"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+class CleanupEngine(object):
+    '''
+    Renames files and directories aside and deletes them in the background.
+
+        workers - the number of background deletion threads
+    '''
+
+    def __init__(this, workers=4):
+        this.workers  = workers
+        this.queue    = Queue.Queue()
+        this.lock     = threading.Lock()
+        this.counter  = 0
+        this.threads  = []
+
+    def pending(this):
+        """Returns the (approximate) number of queued background jobs"""
+        return this.queue.qsize()
+
+    def submit(this, func, *args):
+        """Run func(*args) on one of the background threads"""
+        this.__start_workers()
+        this.queue.put((func, args))
+
+    def trash(this, path):
+        """Atomically move path out of the way and queue it for deletion.
+        Returns the path it was moved to."""
+        with this.lock:
+            this.counter += 1
+            counter = this.counter
+        (parent, base) = os.path.split(path)
+        trash_path = os.path.join(parent, '%s%d-%d-%s' \
+                %(TRASH_PREFIX, int(time.time()), counter, base))
+        try:
+            os.rename(path, trash_path)
+        except OSError, exc:
+            # Windows refuses to rename directories holding open files, in
+            # that case just delete it in place in the background.
+            LOGGER.debug("Could not rename %s aside: %s" %(path, repr(exc)))
+            trash_path = path
+        this.submit(this.__delete, trash_path)
+        return trash_path
+
+    def empty(this, dir_path, keep=()):
+        """Trash every entry in dir_path, except the names in keep. Returns
+        the names of the entries that were trashed."""
+        if not os.path.exists(dir_path):
+            return []
+        trashed = []
+        for name in os.listdir(dir_path):
+            path = os.path.join(dir_path, name)
+            if name.startswith(TRASH_PREFIX):
+                # left over from a previous run that was interrupted
+                this.submit(this.__delete, path)
+            elif name not in keep:
+                this.trash(path)
+                trashed.append(name)
+        return trashed
+
+    def apply_retention(this, results_dir, keep_saves=None, keep_days=None,
+                        max_bytes=None, keep=()):
+        """Trash the save directories in results_dir that are not protected
+        by the retention policy (see the module documentation). Directories
+        named in keep are never removed. Returns the trashed names."""
+        if not os.path.isdir(results_dir):
+            return []
+
+        saves = []
+        for name in os.listdir(results_dir):
+            path = os.path.join(results_dir, name)
+            if name.startswith(TRASH_PREFIX) or not os.path.isdir(path):
+                continue
+            saves.append((os.path.getmtime(path), name))
+        # newest first
+        saves.sort(reverse=True)
+
+        now = time.time()
+        protected = set(keep)
+        if keep_saves is not None:
+            protected.update([name for (mtime, name) in saves[:keep_saves]])
+        if keep_days is not None:
+            protected.update([name for (mtime, name) in saves
+                              if now - mtime < keep_days * 86400])
+
+        doomed = []
+        remaining = []
+        for (mtime, name) in saves:
+            if (keep_saves is not None or keep_days is not None) and \
+               name not in protected:
+                doomed.append(name)
+            else:
+                remaining.append(name)
+
+        if max_bytes is not None:
+            sizes = dict([(name, _tree_size(os.path.join(results_dir, name)))
+                          for name in remaining])
+            total = sum(sizes.values())
+            # drop the oldest saves first, but never the newest one
+            for name in reversed(remaining[1:]):
+                if total <= max_bytes:
+                    break
+                if name in keep:
+                    continue
+                doomed.append(name)
+                total -= sizes[name]
+
+        for name in doomed:
+            this.trash(os.path.join(results_dir, name))
+        return doomed
+
+    def __start_workers(this):
+        with this.lock:
+            this.threads = [t for t in this.threads if t.isAlive()]
+            while len(this.threads) < this.workers:
+                t = threading.Thread(target=this.__work,
+                                     name='CleanupEngine-%d' % len(this.threads))
+                t.setDaemon(True)
+                t.start()
+                this.threads.append(t)
+
+    def __work(this):
+        while True:
+            (func, args) = this.queue.get()
+            try:
+                func(*args)
+            except Exception, exc:
+                LOGGER.exception(exc)
+
+    def __delete(this, path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
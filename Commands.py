@@ -71,13 +71,34 @@ import subprocess
 import sys
 import thread
 import cPickle
+import weakref
 
 import cfg
+import AddressWatcher
+import Checkpoint
+import CleanupEngine
+import Compression
+import DurationStore
+import HostRegistry
+import InstallerCache
 import Kickstart
+import KickstartPipeline
+import LazySuite
+import LogStore
+import ModuleReloader
+import NetworkTable
+import ParallelExecutor
+import ResponseEncoding
 import ServiceRunnerCore
-import HostInfo
+import SnapshotJobs
+import SuiteIndex
+import SvnUpdater
+import TestcaseRun
+import WorkerPool
+import XmlResponse
+import HostInfoCache
 
-HOST_INFO = HostInfo.HostInfo()
+HOST_INFO = HostInfoCache.get_host_info()
 
 if HOST_INFO.isMac():
    import NetConfig
@@ -91,6 +112,256 @@ def ssl_server_trust_prompt( trust_dict ):
 def svn_credentials (realm, username, may_save):
     return True, "<user name>", "<password>", False
 
+def _is_true(value):
+    """Interpret an optional command argument as a boolean flag"""
+    return str(value).lower() in ['1', 'true', 'yes', 'on']
+
+_INSTALLER_CACHE = None
+def _installer_cache():
+    """Returns the installer cache shared by every command"""
+    global _INSTALLER_CACHE
+    if _INSTALLER_CACHE is None:
+        _INSTALLER_CACHE = InstallerCache.InstallerCache(
+                os.path.join(os.getcwd(), 'installer_cache'))
+    return _INSTALLER_CACHE
+
+_DURATION_STORE = None
+def _duration_store():
+    """Returns the testcase duration store shared by every command"""
+    global _DURATION_STORE
+    if _DURATION_STORE is None:
+        _DURATION_STORE = DurationStore.DurationStore(
+                getattr(cfg, 'DURATIONS_FILE',
+                        os.path.join(os.getcwd(), 'durations.json')))
+    return _DURATION_STORE
+
+_HOST_REGISTRY = None
+def _host_registry():
+    """Returns the hosts registry of this service, behind the hosts file
+    cfg.HOSTS_FILE if there is one"""
+    global _HOST_REGISTRY
+    if _HOST_REGISTRY is None:
+        _HOST_REGISTRY = HostRegistry.HostRegistry(
+                getattr(cfg, 'HOST_REGISTRY_FILE',
+                        os.path.join(os.getcwd(), 'host_registry.json')),
+                getattr(cfg, 'HOSTS_FILE', None))
+    return _HOST_REGISTRY
+
+_SNAPSHOT_JOBS = None
+def _snapshot_jobs():
+    """Returns the tracker of the snapshot jobs submitted to this service"""
+    global _SNAPSHOT_JOBS
+    if _SNAPSHOT_JOBS is None:
+        _SNAPSHOT_JOBS = SnapshotJobs.JobTracker(workers=1)
+    return _SNAPSHOT_JOBS
+
+def _vm_manager_call(method, name):
+    import VMManager
+    vmManager = VMManager.VMManager()
+    return getattr(vmManager, method)(name)
+
+def _harvest_durations(runner):
+    """Record the durations of the loaded suite's finished testcases"""
+    if getattr(runner, 'suite', None) is None:
+        return
+    try:
+        _duration_store().harvest(list(runner.suite))
+    except Exception, exc:
+        runner.logger.exception(exc)
+
+def _schedule(runner, testcases, args):
+    """Apply the optional order, shard and durations arguments to a list of
+    testcases. Raises ValueError if any of them is invalid."""
+    store = _duration_store()
+    if args.get('order'):
+        testcases = store.order(testcases, args['order'])
+    if args.get('shard'):
+        (index, count) = DurationStore.parse_shard(args['shard'])
+        if args.get('durations'):
+            # every runner balances the shards on the same frozen durations
+            if not os.path.isfile(args['durations']):
+                raise ValueError('No durations file %s' % args['durations'])
+            store = DurationStore.DurationStore(args['durations'])
+        else:
+            # balance on the shared store's file as it is now (the runners
+            # share cfg.DURATIONS_FILE), not on this runner's copy of it
+            store = DurationStore.DurationStore(store.path)
+        testcases = store.shard(testcases, index, count)
+        runner.logger.info('Shard %s: %d testcases, about %ds'
+                %(args['shard'], len(testcases), store.predict(testcases)))
+    return testcases
+
+def _checkpoint(runner):
+    """Returns the incremental checkpoint of the loaded suite's save
+    directory, or None if the suite has no result data directory"""
+    suite = getattr(runner, 'suite', None)
+    if suite is None or not getattr(suite, 'resultDataDir', None):
+        return None
+    checkpoint = getattr(runner, 'CHECKPOINT', None)
+    if checkpoint is None or checkpoint.save_dir != suite.resultDataDir:
+        if checkpoint is not None:
+            checkpoint.close()
+        checkpoint = Checkpoint.Checkpoint(suite.resultDataDir)
+        runner.CHECKPOINT = checkpoint
+    return checkpoint
+
+def _save_state(runner):
+    """Save the full runner state, and start a new checkpoint generation
+    since the records so far are part of it"""
+    runner.saveState()
+    checkpoint = _checkpoint(runner)
+    if checkpoint is not None:
+        checkpoint.saved()
+
+def _fold_checkpoint(runner):
+    """Save the full state if the checkpoint holds records, before the
+    runner core runs testcases: its own full saves do not start a new
+    checkpoint generation, so older records would roll them back"""
+    checkpoint = _checkpoint(runner)
+    if checkpoint is not None and checkpoint.records():
+        _save_state(runner)
+
+def _load_lazy_suite(runner, module):
+    """Load only the manifest of a suite. Returns False if the suite source
+    could not be found, or its testcases could not be told from it, in which
+    case it should be loaded normally."""
+    path = LazySuite.find_module_file(module, [cfg.TESTSUITE_DIR])
+    if path is None:
+        return False
+
+    def loader():
+        (rv, err) = _load_suite(runner, module)
+        if rv is not True:
+            raise RuntimeError('Failed to load suite %s: %s' %(module, err))
+        return runner.suite
+
+    suite = LazySuite.LazySuite(module, path, [cfg.TESTCASE_DIR], loader)
+    if not len(suite):
+        return False
+    _close_worker_pool(runner)
+    runner.suite = suite
+    runner.DATA['testCount'] = len([t for t in suite if t.enabled])
+    runner.setState(runner.STATE_SUITE_LOADED)
+    return True
+
+def _materialize_suite(runner):
+    """Make sure the loaded suite is fully loaded before it is run"""
+    if isinstance(runner.suite, LazySuite.LazySuite):
+        runner.suite.materialize()
+    _compact_logs(runner)
+
+def _compact_logs(runner):
+    """Keep the testcase logs of the loaded suite in compact log stores"""
+    if runner.suite is None or (isinstance(runner.suite, LazySuite.LazySuite)
+                                and not runner.suite.materialized()):
+        return
+    for testcase in runner.suite:
+        LogStore.compact(testcase)
+
+def _find_testcase(runner, name):
+    """Look up a testcase of the loaded suite through the suite's index,
+    which is (re)built the first time it is needed for a newly loaded suite.
+    Raises AttributeError if there is no such testcase."""
+    index = getattr(runner, 'SUITE_INDEX', None)
+    if index is None or index.suite is not runner.suite:
+        index = SuiteIndex.SuiteIndex(runner.suite)
+        runner.SUITE_INDEX = index
+    return index.find(name)
+
+def _worker_pool(runner, size):
+    """Returns a pool of process isolated workers for the loaded suite,
+    starting one if there is none of at least size workers. Raises
+    WorkerPool.WorkerError if workers are not supported here."""
+    pool = getattr(runner, 'WORKER_POOL', None)
+    module = runner.DATA['suiteModule']
+    if pool is not None and pool.size >= size and \
+       pool.suite_module == module:
+        return pool
+    _close_worker_pool(runner)
+    source = None
+    if WorkerPool.is_path(module):
+        # a suite given as a path is found the way the runner loads it
+        source = LazySuite.find_module_file(module, [cfg.TESTSUITE_DIR])
+        if source is None:
+            raise WorkerPool.WorkerError('Cannot find the source of suite %s'
+                                         % module)
+    runner.WORKER_POOL = WorkerPool.WorkerPool(size, module,
+            getattr(cfg, 'WORKER_RUN_TESTCASE', WorkerPool.RUN_TESTCASE),
+            suite_source=source)
+    return runner.WORKER_POOL
+
+def _close_worker_pool(runner):
+    """Stop the worker processes, their preloaded modules are out of date"""
+    pool = getattr(runner, 'WORKER_POOL', None)
+    if pool is not None:
+        runner.WORKER_POOL = None
+        pool.close()
+
+def _workers(args):
+    """Returns the number of testcases to run at once, from the optional
+    workers argument. Raises ValueError if it is not a positive number."""
+    try:
+        workers = int(args.get('workers') or 1)
+    except ValueError:
+        raise ValueError('Invalid workers "%s"' % args.get('workers'))
+    if workers < 1:
+        raise ValueError('Invalid workers "%s"' % args.get('workers'))
+    return workers
+
+def _testcase_run(runner):
+    """Returns the function to run a single testcase in the service with,
+    for the parallel executor: the runner core's own if it has one"""
+    return getattr(runner, 'run_testcase', None) or TestcaseRun.run_testcase
+
+def _run_parallel(runner, testcases, workers, done_state, run):
+    """Run testcases on the parallel executor with run, checkpointing and
+    recording the duration of each result"""
+    def finished(testcase):
+        checkpoint = _checkpoint(runner)
+        if checkpoint is not None:
+            checkpoint.save_testcase(testcase)
+        _duration_store().record(testcase)
+    runner.PARALLEL_EXECUTOR = ParallelExecutor.ParallelExecutor(runner,
+            testcases, workers, run, done_state, finished,
+            lambda: _save_state(runner))
+    runner.PARALLEL_EXECUTOR.start()
+
+def _isolated_run(runner, args, workers):
+    """Returns the function to run testcases in worker processes with if
+    the isolate argument was given, or None to run them in the service.
+    Raises WorkerPool.WorkerError if workers are not supported here."""
+    if not _is_true(args.get('isolate')):
+        return None
+    return _worker_pool(runner, workers).run
+
+def _parallel_executor(runner):
+    """Returns the parallel executor of the current run, if there is one"""
+    executor = getattr(runner, 'PARALLEL_EXECUTOR', None)
+    if executor is not None and runner.suite is not None:
+        return executor
+    return None
+
+def _load_suite(runner, module):
+    """Load a suite through the runner, recording every module imported
+    along the way so a later reload only has to re-import what changed"""
+    _close_worker_pool(runner)
+    reloader = ModuleReloader.ModuleReloader([cfg.BASEDIR])
+    previous = getattr(runner, 'MODULE_RELOADER', None)
+    reloader.begin()
+    try:
+        result = runner.load(module)
+    finally:
+        reloader.end()
+        # modules imported by an earlier load are not new this time around,
+        # keep their original stamps so changes since then are not missed
+        if previous is not None:
+            reloader.adopt(previous)
+    runner.MODULE_RELOADER = reloader
+    # the runner returns (rv, err)
+    if result[0] is True:
+        _compact_logs(runner)
+    return result
+
 class BaseCommand(object):
     """This class is the Base class which all command objects derive from.
     This will be used with reflection to allow us to respond to commands
@@ -113,6 +384,26 @@ class BaseCommand(object):
         """
         pass
 
+    def _respond(this, msg, data, xml):
+        """Acknowledge with a structured (json compatible) response, encoded
+        as negotiated through the optional 'accept' argument. xml is called
+        with data to build the XML response, only if XML is what the client
+        gets."""
+        encoding = ResponseEncoding.negotiate(this.args.get('accept'))
+        msg.code = 'ack'
+        if encoding == ResponseEncoding.XML:
+            msg.data = xml(data)
+        else:
+            msg.data = ResponseEncoding.encode(data, encoding)
+        this._compress(msg)
+
+    def _compress(this, msg):
+        """Compress a large response, if the client accepts a compression
+        through the optional 'compress' argument"""
+        algorithm = Compression.negotiate(this.args.get('compress'))
+        if algorithm is not None and msg.data:
+            msg.data = Compression.compress(msg.data, algorithm)
+
     def _parse_args(this,args,expected):
         """This method is responsible for parsing the arguments that are
         passed to individual commands. The problem is that protocol 00 and 01
@@ -187,6 +478,50 @@ class BaseCommand(object):
         else:
             raise RuntimeError('args data type %s not supported' %type(args))
 
+class protocol_command(BaseCommand):
+    """Returns the response encodings and compressions this service supports
+    <accept> <compress>
+    Any command which returns structured data (status, getcases, hostinfo,
+    ...) can encode its response as something more compact than XML. The
+    client lists the encodings it accepts, in order of preference, in the
+    'accept' argument of the request (eg "msgpack,json"), and gets the first
+    one the service supports. A response which is not XML starts with a
+    "#<encoding>" line.
+
+    Large responses (getfile, caseinfo, getcases, getsaves, ...) are
+    compressed if the client lists the compressions it accepts in the
+    'compress' argument (eg "lz4,zlib"). A compressed response starts with a
+    "#<compression>" line, and is decompressed before it is decoded.
+
+    This command returns the supported encodings, most compact first, the
+    supported compressions, fastest first, and how well the compressed
+    responses sent so far compressed:
+      <protocol>
+        <encodings>msgpack,json,xml</encodings>
+        <compressions>lz4,zlib</compressions>
+        <compressed payloads="12" rawBytes="..." sentBytes="..." seconds="..."/>
+      </protocol>
+    """
+    name = 'protocol'
+    def __init__(this,user,args=None):
+        this.user = user
+        this.args = this._parse_args(args,[])
+
+    def do_command(this, msg):
+        this._respond(msg, {'encodings'   : ResponseEncoding.supported(),
+                            'compressions': Compression.supported(),
+                            'compressed'  : Compression.METRICS.as_dict()},
+                      this.__xml)
+
+    def __xml(this, data):
+        compressed = ''.join([' %s="%s"' %(key, value) for (key, value)
+                              in sorted(data['compressed'].items())])
+        return XmlResponse.XmlResponse().open('protocol') \
+                .element('encodings', ','.join(data['encodings']), '  ') \
+                .element('compressions', ','.join(data['compressions']), '  ') \
+                .raw('  <compressed%s/>\n' % compressed) \
+                .close('protocol').getvalue()
+
 class history_command(BaseCommand):
     """Show a history of the last 20 commands recieved
 
@@ -200,13 +535,13 @@ class history_command(BaseCommand):
         this.args = this._parse_args(args,[])
 
     def do_command(this, msg, history):
-        xml = "<history>\n"
+        xml = XmlResponse.XmlResponse().open('history')
         for cmd in history:
-            xml += "  <command>%s %s %s</command>\n" \
-                    %(cmd.user, cmd.name, cmd.args)
-        xml += "</history>\n"
+            xml.element('command', '%s %s %s' %(cmd.user, cmd.name, cmd.args),
+                        '  ')
+        xml.close('history')
         msg.code = 'ack'
-        msg.data = xml
+        msg.data = xml.getvalue()
 
 class quit_command(BaseCommand):
     """Tell the service to exit immediatley
@@ -226,13 +561,18 @@ class quit_command(BaseCommand):
         msg.code = 'ack'
 
 class svnupdate_command(BaseCommand):
-    """SVN update the code, and restart the service
-    <revision>
+    """SVN update the code, and restart the service if needed
+    <revision> <dry_run>
     This command will perform an SVN update on the local copy of the
     automation code. The code will be updated to the given revision if
-    specified, otherwise it'll be updated to HEAD. The service runner
-    will be automatically restarted after update.
+    specified, otherwise it'll be updated to HEAD. An svn cleanup is only
+    run when the working copy needs one. The response lists every changed
+    path and the imported modules they belong to, and the service runner
+    is only restarted if one of those modules is in use by the service.
         revision - (optional) specifies which revision to update to.
+
+        dry_run  - (optional) if true, report what would change (including
+                   whether a restart would be needed) without updating.
     """
     name = 'svnupdate'
     def __init__(this,user,args=None):
@@ -242,62 +582,47 @@ class svnupdate_command(BaseCommand):
 
     def do_command(this, msg):
         expected_revision = this.args.get('revision')
-        if HOST_INFO.isMac():
-            try:
-                if expected_revision is None:
-                    cmd = 'svn update %s'% cfg.BASEDIR
-                else:
-                    cmd = 'svn update %s -r %s'% (cfg.BASEDIR,expected_revision)
-                cleanup_cmd = 'svn cleanup %s'% cfg.BASEDIR
-                output = subprocess.check_output(cleanup_cmd,shell=True) 
-                output = subprocess.check_output(cmd,shell=True)
-
-                revision = re.search('revision\s(\d+).', output).group(1)
-                msg.code = 'ack'
-                msg.data = "<revision>%s</revision>" % revision
-                # Create and initialize a restart_command object to be used
-                # during do_post_socket_send_actions.
-                this.__restart_command = restart_command(this.user)
-                this.__restart_command.do_command(msg)
-
-            except Exception, e:
-                this.runner.logger.exception(
-                 'Unable to run svn update command: "%s"' % cmd)
-                msg.code  = 'cer'
-                msg.error = 'Error during SVN update.%s' % (repr(e))
-        else:
-            try:
-                import pysvn
-            except ImportError, e:
-                msg.code = 'cer'
-                msg.error = repr(e)
-                return
+        dry_run = _is_true(this.args.get('dry_run'))
 
-            svn_client = pysvn.Client()
-            # Assigning callback asked by pysvn.
-            svn_client.callback_ssl_server_trust_prompt = ssl_server_trust_prompt
-            svn_client.callback_get_login = svn_credentials # This is not required if we get read permission without login.
-            
-            svn_client.cleanup(cfg.BASEDIR)
-            # If a revision has not been specified update to HEAD.
-            if expected_revision is None:
-                to_revision = pysvn.Revision(pysvn.opt_revision_kind.head)
-            else:
-                to_revision = pysvn.Revision(pysvn.opt_revision_kind.number, 
-                                         int(expected_revision))
-            revision = svn_client.update(cfg.BASEDIR, revision=to_revision)[0].number
-            # Negative numbers indicate an SVN update error code.
-            if revision < 0:
-                msg.code  = 'cer'
-                msg.error = 'Error(%d) during SVN update.' % revision
+        # The svn command line client is used on Mac, pysvn everywhere else.
+        updater = SvnUpdater.SvnUpdater(cfg.BASEDIR,
+                                        use_pysvn=not HOST_INFO.isMac())
+        try:
+            if dry_run:
+                (revision, paths) = updater.pending_changes(expected_revision)
             else:
-                msg.code = 'ack'
-                msg.data = "<revision>%d</revision>" % revision
+                (revision, paths) = updater.update(expected_revision)
+        except Exception, e:
+            this.runner.logger.exception('Unable to run svn update on %s' \
+                    % cfg.BASEDIR)
+            msg.code  = 'cer'
+            msg.error = 'Error during SVN update.%s' % (repr(e))
+            return
+
+        modules = updater.changed_modules(paths)
+        this.runner.logger.info('svnupdate: %d paths changed, %d loaded ' \
+                'modules affected' % (len(paths), len(modules)))
+
+        xml = XmlResponse.XmlResponse()
+        xml.element('revision', revision)
+        xml.element('dryRun', dry_run)
+        xml.element('restart', len(modules) > 0)
+        xml.open('changed')
+        for path in paths:
+            xml.element('path', path, '  ')
+        xml.close('changed')
+        xml.open('modules')
+        for module in modules:
+            xml.element('module', module, '  ')
+        xml.close('modules')
+        msg.code = 'ack'
+        msg.data = xml.getvalue()
 
-                # Create and initialize a restart_command object to be used
-                # during do_post_socket_send_actions.
-                this.__restart_command = restart_command(this.user)
-                this.__restart_command.do_command(msg)
+        if not dry_run and len(modules) > 0:
+            # Create and initialize a restart_command object to be used
+            # during do_post_socket_send_actions.
+            this.__restart_command = restart_command(this.user)
+            this.__restart_command.do_command(msg)
 
     def do_post_socket_send_actions(this):
         if this.__restart_command:
@@ -431,22 +756,28 @@ class hostinfo_command(BaseCommand):
         this.user = user
         this.args = this._parse_args(args,[])
 
+    # the order of the hostinfo elements
+    FIELDS = ['system', 'arch', 'patch', 'version', 'hardware', 'uid']
+
     def do_command(this, msg):
-        xml = "<hostinfo>\n" +\
-              "  <system>%s</system>\n"     %HOST_INFO.os +\
-              "  <arch>%s</arch>\n"         %HOST_INFO.arch +\
-              "  <patch>%s</patch>\n"       %HOST_INFO.patch +\
-              "  <version>%s</version>\n"   %HOST_INFO.version +\
-              "  <hardware>%s</hardware>\n" %HOST_INFO.hardware
+        info = {'system'   : HOST_INFO.os,
+                'arch'     : HOST_INFO.arch,
+                'patch'    : HOST_INFO.patch,
+                'version'  : HOST_INFO.version,
+                'hardware' : HOST_INFO.hardware}
 
         # UID is only available for Android platforms.
         if HOST_INFO.isAndroid():
-            xml += "  <uid>%s</uid>\n" % HOST_INFO.uid
+            info['uid'] = HOST_INFO.uid
 
-        xml += "</hostinfo>\n"
+        this._respond(msg, info, this.__xml)
 
-        msg.code = 'ack'
-        msg.data = xml
+    def __xml(this, info):
+        xml = XmlResponse.XmlResponse().open('hostinfo')
+        for field in this.FIELDS:
+            if field in info:
+                xml.element(field, info[field], '  ')
+        return xml.close('hostinfo').getvalue()
 
 class status_command(BaseCommand):
     """Returns a summary of the current automation state
@@ -481,33 +812,47 @@ class status_command(BaseCommand):
         elif this.runner.DATA['startTime'] != 0:
             elapsed = int(time.time() - this.runner.DATA['startTime'])
 
-        status = \
-            "<status>\n" +\
-            "  <state>%s</state>\n" %this.runner.DATA['state'] + \
-            "  <locked>%s</locked>\n" %str(this.runner.DATA['locked']) + \
-            "  <executedBy>%s</executedBy>\n" %str(this.runner.DATA['executedBy']) + \
-            "  <message><![CDATA[%s]]></message>\n"%this.runner.DATA['state_msg']+\
-            "  <suite>%s</suite>\n" %suiteName + \
-            "  <product_name><![CDATA[%s]]></product_name>\n" %productName + \
-            "  <product_codename><![CDATA[%s]]></product_codename>\n" %productCodename + \
-            "  <product_version>%s</product_version>\n" %productVersion + \
-            "  <testcase>%s</testcase>\n" %testcase +\
-            "  <testCount>%d</testCount>\n" %this.runner.DATA['testCount'] +\
-            "  <runCount>%d</runCount>\n" %this.runner.DATA['runCount'] +\
-            "  <passCount>%d</passCount>\n" %this.runner.DATA['passCount'] +\
-            "  <failCount>%d</failCount>\n" %this.runner.DATA['failCount'] +\
-            "  <blockCount>%d</blockCount>\n" %this.runner.DATA['blockCount'] +\
-            "  <crashCount>%d</crashCount>\n" %this.runner.DATA['crashCount'] +\
-            "  <errorCount>%d</errorCount>\n" %this.runner.DATA['errorCount'] +\
-            "  <startTime>%d</startTime>\n" %this.runner.DATA['startTime'] +\
-            "  <finishTime>%d</finishTime>\n" %this.runner.DATA['finishTime'] +\
-            "  <elapsedTime>%d</elapsedTime>\n" %elapsed +\
-            "  <resultState>\n" +\
-            str(this.runner.DATA['resultState']) +\
-            "  </resultState>\n" +\
-            "</status>\n"
-        msg.code = 'ack'
-        msg.data = status
+        data = this.runner.DATA
+        status = {'state'            : data['state'],
+                  'locked'           : data['locked'],
+                  'executedBy'       : data['executedBy'],
+                  'message'          : data['state_msg'],
+                  'suite'            : suiteName,
+                  'product_name'     : productName,
+                  'product_codename' : productCodename,
+                  'product_version'  : productVersion,
+                  'testcase'         : testcase,
+                  'elapsedTime'      : elapsed,
+                  'resultState'      : dict([(field,
+                          getattr(data['resultState'], field, None))
+                          for field in Checkpoint.RESULT_STATE_FIELDS])}
+        for counter in this.COUNTERS:
+            status[counter] = int(data[counter])
+        this._respond(msg, status, this.__xml)
+
+    # the numeric status values
+    COUNTERS = ['testCount', 'runCount', 'passCount', 'failCount',
+                'blockCount', 'crashCount', 'errorCount', 'startTime',
+                'finishTime']
+
+    def __xml(this, status):
+        xml = XmlResponse.XmlResponse().open('status')
+        xml.element('state', status['state'], '  ')
+        xml.element('locked', status['locked'], '  ')
+        xml.element('executedBy', status['executedBy'], '  ')
+        xml.cdata('message', status['message'], '  ')
+        xml.element('suite', status['suite'], '  ')
+        xml.cdata('product_name', status['product_name'], '  ')
+        xml.cdata('product_codename', status['product_codename'], '  ')
+        xml.element('product_version', status['product_version'], '  ')
+        xml.element('testcase', status['testcase'], '  ')
+        for counter in this.COUNTERS:
+            xml.element(counter, status[counter], '  ')
+        xml.element('elapsedTime', status['elapsedTime'], '  ')
+        xml.open('resultState', '  ')
+        xml.raw(str(this.runner.DATA['resultState']))
+        xml.close('resultState', '  ')
+        return xml.close('status').getvalue()
 
 class uploadstatus_command(BaseCommand):
     """Responds with the current (or last) upload status
@@ -534,27 +879,71 @@ class uploadresults_command(BaseCommand):
     checksumed upon copy completion. The results will then be imported into
     the results database by the dashboard service. This process can take a
     very long time for large test suites, and thes status of the upload can
-    be checked using the uploadstatus command.
+    be checked using the uploadstatus command. The command is acknowledged
+    right away, the test network adapter is brought up as the first stage of
+    the upload.
 
         import_type - a string representing the type of upload this
                       will be: 'pending', 'testing', 'official'
     """
     name = 'uploadresults'
+
+    # seconds to wait for the test network adapter to get its address
+    ADAPTER_TIMEOUT = 120
+
     def __init__(this,user,args=None):
         this.user = user
         this.args = this._parse_args(args,['import_type'])
         this.ENABLED_ADAPTER = [config._config.TEST_NET_ADAPTER]
+
+    def prepare_adapters(this):
+        """Enable the test network adapters, and wait for them to get an
+        address on the untrusted network"""
         for adapter in this.ENABLED_ADAPTER:
            testnet = NetDevice.NetDevice(adapter)
+           # only this adapter's addresses count, the management adapter
+           # is on the same range as the untrusted network
+           present = AddressWatcher.wait_for_network('Untrusted', 0,
+                                                     adapter=adapter)
            testnet.enable()
+           if present is None:
+              # returns as soon as the address shows up, rather than on
+              # the next poll of the adapter
+              AddressWatcher.wait_for_network('Untrusted',
+                      this.ADAPTER_TIMEOUT, adapter=adapter)
+           # confirm on the adapter itself (which raises its usual error if
+           # it has no address), this is immediate once it got one
            testnet.waitForIP(config._config.NETWORKS.Untrusted.Prefix)
            if HOST_INFO.isMac():
               NET_CONFIG.setHighestPriorityService(testnet.servicename)
            if HOST_INFO.isLinux():
               mgmt = NetDevice.NetDevice(config._config.MANAGEMENT_ADAPTER)
               mgmt.disable()
-              
-           
+
+    def upload(this):
+        """The upload job: prepare the adapters, then start the ftp"""
+        start = time.time()
+        try:
+            this.runner.DATA['state_msg'] = 'Upload: preparing adapters'
+            this.prepare_adapters()
+        except Exception, exc:
+            this.runner.logger.exception(exc)
+            this.runner.DATA['resultState'].uploadError = \
+                    'Failed to prepare the test network adapter: %s' % exc
+            this.runner.DATA['state_msg'] = \
+                    this.runner.DATA['resultState'].uploadError
+            this.runner.setState(this.runner.DATA['PREVIOUS_STATE'])
+            unlock_command('admin','').do_command(
+                    ServiceRunnerCore.ResponseMsg('ack','unlock'))
+            return
+        this.runner.DATA['state_msg'] = 'Upload: adapters ready in %.1fs' \
+                % (time.time() - start)
+        this.runner.logger.info(this.runner.DATA['state_msg'])
+
+        # create and start the ftp
+        this.runner.FTP_THREAD = ServiceRunnerCore.FTPResults(
+                this.runner,this.args['import_type'],this.runner.suite.name)
+        this.runner.FTP_THREAD.start()
 
     def do_command(this, msg):
         """Upload the results for this test suite"""
@@ -588,20 +977,20 @@ class uploadresults_command(BaseCommand):
             msg.error = 'failed to aquire lock of service: %s' %msg.error
             return
 
+        _harvest_durations(this.runner)
+
         # Set the runner state
         this.runner.DATA['PREVIOUS_STATE'] = this.runner.DATA['state']
         this.runner.setState(this.runner.STATE_UPLOADING_RESULTS)
 
-        # create and start the ftp
-        this.runner.FTP_THREAD = ServiceRunnerCore.FTPResults(
-                this.runner,this.args['import_type'],this.runner.suite.name)
-        this.runner.FTP_THREAD.start()
-
         # set the state, and respond to the client
         if this.user is None:
             this.runner.DATA['resultState'].uploadedBy = 'Anonymous'
         else:
             this.runner.DATA['resultState'].uploadedBy = this.user
+
+        # the adapters are brought up in the background, as part of the job
+        thread.start_new_thread(this.upload, ())
         msg.code = 'ack'
         msg.data = ''
 
@@ -706,7 +1095,20 @@ class setuploadresult_command(BaseCommand):
             this.runner.logger.error('Automation Results failed imported'\
             + ' into database with error: %s' %this.args['error'])
 
-        this.runner.saveState()
+        # Only the upload state changed, so append it to the checkpoint
+        # journal rather than rewriting the whole save state. getsaves shows
+        # the checkpoint summary over summary.pickle until the next full
+        # save, which holds them itself.
+        checkpoint = _checkpoint(this.runner)
+        if checkpoint is None:
+            this.runner.saveState()
+        else:
+            result_state = this.runner.DATA['resultState']
+            checkpoint.save_result_state(result_state)
+            summary = Checkpoint.read_summary(checkpoint.save_dir)
+            summary['resultSetId'] = result_state.resultSetId
+            summary['uploadError'] = result_state.uploadError
+            checkpoint.save_summary(summary)
 
         msg.code = 'ack'
         msg.data = "<id>%s</id>" %this.args['id'] +\
@@ -714,9 +1116,36 @@ class setuploadresult_command(BaseCommand):
 
 class start_command(BaseCommand):
     """Start automation on the currently loaded test suite
-
+    <workers> <order> <shard> <durations> <isolate>
     This command will start a full automation run on whatever test suite is
     currently loaded. If not suite is loaded, it will trigger an error
+
+    workers, order and shard run the testcases one at a time, through the
+    runner core's run_testcase if it has one, or TestcaseRun otherwise.
+
+        workers - (optional) run up to this many testcases at once. Only
+                  testcases that declare non conflicting resources are run
+                  side by side.
+
+        order   - (optional) 'longest' to run the testcases that took the
+                  longest in the past first, or 'failfast' to run the ones
+                  most likely to fail first. Defaults to the suite's order.
+
+        shard   - (optional) "<index>/<count>", only run the index'th of
+                  count shards of the suite, so count runners can split one
+                  suite between them. The shards are balanced on the
+                  testcases' durations in the duration store
+                  (cfg.DURATIONS_FILE), which the runners must share.
+
+        durations - (optional) with shard, the path of a durations file
+                  (a frozen copy of a duration store) to balance the shards
+                  on instead, for runners which do not share a store.
+
+        isolate - (optional) if true, run each testcase in a separate worker
+                  process, so a crashing testcase does not take the service
+                  down. The workers have the suite already imported. They
+                  run testcases with TestcaseRun, or the function named by
+                  cfg.WORKER_RUN_TESTCASE ("module.function").
     """
     name = 'start'
     def __init__(this,user,args=None):
@@ -736,9 +1165,36 @@ class start_command(BaseCommand):
             msg.error = \
                     'Can NOT run a test suite from state %s' %this.runner.DATA['state']
         else:
+            try:
+                _materialize_suite(this.runner)
+                _harvest_durations(this.runner)
+                workers = _workers(this.args)
+                testcases = _schedule(this.runner,
+                        [t for t in this.runner.suite if t.enabled],
+                        this.args)
+                run = _isolated_run(this.runner, this.args, workers)
+                parallel = workers > 1 or run is not None or \
+                           this.args.get('order') or this.args.get('shard')
+                if parallel and run is None:
+                    run = _testcase_run(this.runner)
+            except (ValueError, RuntimeError, WorkerPool.WorkerError), exc:
+                msg.code  = 'cer'
+                msg.error = str(exc)
+                return
             this.runner.DATA['executedBy'] = this.user
+            this.runner.PARALLEL_EXECUTOR = None
             this.runner.setState(this.runner.STATE_SUITE_STARTING)
-            this.runner.start_testing()
+            if parallel:
+                # the core only runs the whole suite in its own order, a
+                # single worker executor runs it in the scheduled order
+                this.runner.DATA['testCount'] = len(testcases)
+                this.runner.DATA['startTime'] = time.time()
+                this.runner.setState(this.runner.STATE_SUITE_RUNNING)
+                _run_parallel(this.runner, testcases, workers,
+                              this.runner.STATE_SUITE_COMPLETE, run)
+            else:
+                _fold_checkpoint(this.runner)
+                this.runner.start_testing()
             msg.code = 'ack'
 
 class stop_command(BaseCommand):
@@ -763,7 +1219,13 @@ class stop_command(BaseCommand):
             if this.runner.DATA['state'] == this.runner.STATE_SUBSET_RUNNING:
                 this.runner.STOPPED_DURING_SUBSET = True
             this.runner.setState(this.runner.STATE_SUITE_STOPPING)
-            this.runner.stopTesting()
+            executor = _parallel_executor(this.runner)
+            if executor is not None and executor.isAlive():
+                # the executor goes to STATE_SUITE_STOPPED once the running
+                # testcases finished
+                executor.stop()
+            else:
+                this.runner.stopTesting()
             msg.code = 'ack'
         else:
             msg.code  = 'cer'
@@ -795,15 +1257,28 @@ class resume_command(BaseCommand):
             msg.error = 'Can NOT resume a test suite from state %s' \
                             %this.runner.DATA['state']
         else:
-            this.runner.resume_testing()
+            executor = _parallel_executor(this.runner)
+            if executor is not None and executor.remaining():
+                this.runner.setState(this.runner.STATE_SUITE_RUNNING)
+                _run_parallel(this.runner, executor.remaining(),
+                              executor.workers, executor.done_state,
+                              executor.run_one)
+            else:
+                _fold_checkpoint(this.runner)
+                this.runner.resume_testing()
             msg.code = 'ack'
 
 class reload_command(BaseCommand):
     """Relaod the currently loaded testsuite
-
+    <full>
     This command would be used to trigger a reload of the currently loaded
     test suite. This could be useful to pick up changes in any of the
-    test cases or support libraries
+    test cases or support libraries. Only the modules whose source changed
+    since the suite was loaded (and the modules depending on them) are
+    re-imported, and the existing testcases keep their results.
+
+        full - (optional) if true, throw away the suite and load it again
+               from scratch instead.
     """
     name = 'reload'
     def __init__(this,user,args=None):
@@ -814,6 +1289,13 @@ class reload_command(BaseCommand):
         if not this.runner.check_acl(this.user,msg):
             return
         module_to_reload = this.runner.DATA['suiteModule']
+        reloader = getattr(this.runner, 'MODULE_RELOADER', None)
+        if module_to_reload is not None and reloader is not None and \
+           this.runner.suite is not None and \
+           not _is_true(this.args.get('full')):
+            this.__hot_reload(msg, reloader)
+            return
+
         this.runner.setState(this.runner.STATE_SUITE_LOADING)
         if module_to_reload is None:
             this.runner.setState(this.runner.STATE_SUITE_LOAD_FAIL)
@@ -822,9 +1304,40 @@ class reload_command(BaseCommand):
             msg.code  = 'cer'
             msg.error = this.runner.DATA['state_msg']
         else:
-            this.runner.load(module_to_reload)
+            _load_suite(this.runner, module_to_reload)
             msg.code = 'ack'
 
+    def __hot_reload(this, msg, reloader):
+        if this.runner.DATA['state'] not in [
+                this.runner.STATE_SUITE_LOADED,
+                this.runner.STATE_SUITE_STOPPED,
+                this.runner.STATE_SUITE_COMPLETE,
+                this.runner.STATE_SUITE_ERRORED]:
+            msg.code  = 'cer'
+            msg.error = 'Can NOT reload test suite from state %s' \
+                            %this.runner.DATA['state']
+            return
+
+        start = time.time()
+        try:
+            reloaded = reloader.reload_changed()
+            rebound = reloader.rebind(this.runner.suite, reloaded)
+            if reloaded:
+                _close_worker_pool(this.runner)
+        except Exception, exc:
+            this.runner.logger.exception(exc)
+            msg.code  = 'ser'
+            msg.error = 'Failed to reload changed modules: %s' % repr(exc)
+            return
+
+        this.runner.logger.info('Reloaded %d modules (%d testcases rebound) '\
+                'in %.3f seconds' % (len(reloaded), rebound, time.time()-start))
+        xml = XmlResponse.XmlResponse().open('reloaded')
+        for name in reloaded:
+            xml.element('module', name, '  ')
+        msg.code = 'ack'
+        msg.data = xml.close('reloaded').getvalue()
+
 class goidle_command(BaseCommand):
     """Instruct the automation service to go to an idle state
 
@@ -875,17 +1388,24 @@ class getcases_command(BaseCommand):
     def do_command(this, msg):
         msg.code  = 'ack'
         if this.runner.suite is not None:
-            msg.code  = 'ack'
-            xml = ''
+            cases = []
             for testcase in this.runner.suite:
                 if testcase.enabled is False: # skip disabled test cases
                     continue
-                xml+='<testcase>\n'
-                xml+='<name>%s</name>\n' %testcase.friendlyName
-                xml+='<description><![CDATA[%s]]></description>\n' %testcase.description
-                xml+='<status>%s</status>\n' %testcase.result.upper()
-                xml+='</testcase>\n'
-            msg.data = xml
+                cases.append({'name'        : testcase.friendlyName,
+                              'description' : testcase.description,
+                              'status'      : testcase.result.upper()})
+            this._respond(msg, {'testcases': cases}, this.__xml)
+
+    def __xml(this, data):
+        xml = XmlResponse.XmlResponse()
+        for case in data['testcases']:
+            xml.open('testcase')
+            xml.element('name', case['name'])
+            xml.cdata('description', case['description'])
+            xml.element('status', case['status'])
+            xml.close('testcase')
+        return xml.getvalue()
 
 class getsuites_command(BaseCommand):
     """Retrieves a list of all the tests available on this system
@@ -918,13 +1438,13 @@ class getsuites_command(BaseCommand):
                     pyfiles.append(basename)
 
             testsuites[directory] = pyfiles
-        tests = "<testsuites>\n"
+        tests = XmlResponse.XmlResponse().open('testsuites')
         for product in testsuites.keys():
-            tests += "<folder>\n<product>" + product + "</product>\n<suites>"
-            tests += ','.join(testsuites[product])
-            tests += "</suites>\n</folder>\n"
-
-        tests += "</testsuites>\n"
+            tests.open('folder')
+            tests.element('product', product)
+            tests.element('suites', ','.join(testsuites[product]))
+            tests.close('folder')
+        tests.close('testsuites')
 
         testcases = {}
         results = os.listdir(cfg.TESTCASE_DIR)
@@ -945,16 +1465,16 @@ class getsuites_command(BaseCommand):
                     pyfiles.append(basename)
 
             testcases[directory] = pyfiles
-        tests += "<testcases>\n"
+        tests.open('testcases')
         for product in testcases.keys():
-            tests += "<folder>\n<product>" + product + "</product>\n<cases>"
-            tests += ','.join(testcases[product])
-            tests += "</cases>\n</folder>\n"
-
-        tests += "</testcases>\n"
+            tests.open('folder')
+            tests.element('product', product)
+            tests.element('cases', ','.join(testcases[product]))
+            tests.close('folder')
+        tests.close('testcases')
 
         msg.code = 'ack'
-        msg.data = tests
+        msg.data = tests.getvalue()
 
 class getsaves_command(BaseCommand):
     """Retrieve a list and details of all the save states available
@@ -969,8 +1489,8 @@ class getsaves_command(BaseCommand):
 
     def do_command(this, msg):
         saves = []
-        savesDetail = "<details>\n"
-        summaryData = []
+        savesDetail = XmlResponse.XmlResponse().open('details')
+        summaryData = {}
         # check for non existant results dir
         try:
             dirs = os.listdir(cfg.RESULTS_DIR)
@@ -982,26 +1502,33 @@ class getsaves_command(BaseCommand):
             return
 
         for dir in dirs:
+            if dir.startswith(CleanupEngine.TRASH_PREFIX):
+                # renamed aside by a cleanup, being deleted
+                continue
             save_file = os.sep.join([cfg.RESULTS_DIR,dir,'save_state.pickle'])
             summary_file = os.sep.join([cfg.RESULTS_DIR,dir,'summary.pickle'])
             if os.path.isfile(save_file) and os.path.isfile(summary_file):
                 saves.append(dir)
-                savesDetail += "  <save name=\"" + dir + "\">\n"
-                savesDetail += "    <name>" + dir +"</name>\n"
+                savesDetail.open('save', '  ', name=dir)
+                savesDetail.element('name', dir, '    ')
+                summaryData = {}
                 try:
                     with open(summary_file, 'rb') as summaryPickle:
                         summaryData = cPickle.load(summaryPickle)
                 except Exception,exc:
                     this.runner.logger.exception(exc)
-                if len(summaryData) > 0:
-                    for key in summaryData.keys():
-                        savesDetail += "<%s><![CDATA[%s]]></%s>" \
-                                %(key, summaryData[key], key)
-                savesDetail += "  </save>\n"
-        savesDetail +=("</details>\n")
+                # values checkpointed since the last full save are newer
+                summaryData.update(Checkpoint.read_summary(
+                        os.sep.join([cfg.RESULTS_DIR,dir])))
+                for key in summaryData.keys():
+                    savesDetail.cdata(key, summaryData[key], '    ')
+                savesDetail.close('save', '  ')
+        savesDetail.close('details')
         msg.code = 'ack'
-        msg.data = "<saves>"+",".join(saves)+"</saves>\n"
-        msg.data += savesDetail
+        msg.data = XmlResponse.XmlResponse() \
+                .element('saves', ','.join(saves)) \
+                .extend(savesDetail.parts).getvalue()
+        this._compress(msg)
 
 class lock_command(BaseCommand):
     """Lock this host, so no other user can manipulate it
@@ -1115,12 +1642,9 @@ class getfile_command(BaseCommand):
             msg.code  = 'cer'
             msg.error = 'Cannot get testcase log, no suite is loaded'
         else:
-            testcase = this.runner.suite.findTestCase(this.args['testcase'])
-            datafile = None
-            for pair in testcase.resultData:
-                if pair[1] == this.args['filename']:
-                    datafile = pair[0]
-                    break
+            testcase = _find_testcase(this.runner, this.args['testcase'])
+            datafile = this.runner.SUITE_INDEX.result_file(
+                    testcase, this.args['filename'])
             if datafile is None:
                 msg.code = 'cer'
                 msg.error = 'testcase "%s" has not result file named "%s"' \
@@ -1133,7 +1657,9 @@ class getfile_command(BaseCommand):
             # over XML reliably.
             data = base64.encodestring("".join(data))
             msg.code = 'ack'
-            msg.data = "<file><![CDATA[%s]]></file>" % data
+            msg.data = XmlResponse.XmlResponse().cdata('file', data) \
+                                                .getvalue()
+            this._compress(msg)
 
 class loadstate_command(BaseCommand):
     """Instruct the service to load a specific saved state
@@ -1165,12 +1691,22 @@ class loadstate_command(BaseCommand):
         else:
             state_file = os.path.sep.join(\
                     ['results', this.args['statename'], 'save_state.pickle'])
-            if not os.path.exists(state_file):
+            trashed = os.path.basename(os.path.normpath(
+                    this.args['statename'])).startswith(
+                            CleanupEngine.TRASH_PREFIX)
+            if trashed or not os.path.exists(state_file):
                 msg.code = 'cer'
                 msg.error = "No save state found for test run '%s'" %dir
                 return
             val = this.runner.loadState(state_file)
             if val is True:
+                # replay anything checkpointed after the last full save
+                checkpoint = Checkpoint.Checkpoint(os.path.dirname(state_file))
+                applied = checkpoint.replay(this.runner,
+                        lambda name: _find_testcase(this.runner, name))
+                this.runner.logger.info('Replayed %d checkpoint records' \
+                        % applied)
+                _compact_logs(this.runner)
                 msg.code = 'ack'
             else:
                 msg.code  = 'ser'
@@ -1178,11 +1714,16 @@ class loadstate_command(BaseCommand):
 
 class load_command(BaseCommand):
     """Instruct the service to load a specific test suite or collection
-    <suite>
+    <suite> <lazy>
     This command will load a new test suite or test collection in to the
-    service. This command takes just one argument:
+    service. This command takes the following arguments:
 
         suite - The name of the suite file (as returned from getsuites)
+
+        lazy  - (optional) if true, only read the names and descriptions of
+                the testcases from their sources. Testcases are imported
+                when they are inspected, and the whole suite is loaded when
+                it is started.
     """
     name = 'load'
     def __init__(this,user,args=None):
@@ -1206,9 +1747,18 @@ class load_command(BaseCommand):
                 'Can NOT load new test suite from state %s' %this.runner.DATA['state']
         else:
             this.runner.logger.info('Inside load method')
+            _harvest_durations(this.runner)
+            policy = getattr(this.runner, 'RETENTION_POLICY', None)
+            if policy:
+                cleanup_command.apply_policy(this.runner, policy)
             this.runner.setState(this.runner.STATE_SUITE_LOADING)
             this.runner.DATA['suiteModule'] = this.args['suite']
-            (rv,err) = this.runner.load(this.runner.DATA['suiteModule'])
+            if _is_true(this.args.get('lazy')) and \
+               _load_lazy_suite(this.runner, this.runner.DATA['suiteModule']):
+                (rv,err) = (True, None)
+            else:
+                (rv,err) = _load_suite(this.runner,
+                                       this.runner.DATA['suiteModule'])
             if rv is True:
                 if 'build' in this.args.keys():
                     this.runner.suite.build = this.args['build']
@@ -1217,15 +1767,57 @@ class load_command(BaseCommand):
                 msg.code  = 'ser'
                 msg.error = err
 
+def _log_time(value):
+    """Returns a log entry time (or a 'since' argument) as seconds since the
+    epoch. Raises ValueError if it is not a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError('"%s" is not a time in seconds' % value)
+
+def _logged_after(when, since):
+    # an entry without a numeric time cannot be placed, it is kept
+    try:
+        return _log_time(when) > since
+    except ValueError:
+        return True
+
 class caseinfo_command(BaseCommand):
     """Retrive detailed information about a specific testcase
-    <testcase>
+    <testcase> <offset> <limit> <since> <tail>
     This command will retrieve all the detailed information about a specific
     test case in the currently loaded suite. This command takes one argument:
 
         testcase - The name of the testcase (as returned from getcases)
+
+    and optional arguments which select the part of the log returned, so a
+    long (or still running) testcase can be paged through, or watched:
+
+        since  - only return log entries logged after this time (in
+                 seconds since the epoch)
+
+        offset - index of the first log entry returned, among the entries
+                 logged after since (default 0)
+
+        limit  - maximum number of log entries returned (default all)
+
+        tail   - if true, only return the log entries logged since the last
+                 tail caseinfo of this testcase by the same user (and leave
+                 out the documentation, which the user already has)
+
+    If any of them is given, the response also holds a
+    <logRange offset="..." next="..." total="..."/> element, where total is
+    the number of entries selected by since and tail, and next is the offset
+    to ask for to continue after the returned entries.
     """
     name = 'caseinfo'
+
+    # testcase -> {user: index of the next log entry to tail from}, dropped
+    # with the testcase when the suite is reloaded
+    cursors = weakref.WeakKeyDictionary()
+    # testcase -> (longdesc, resultData count, static XML parts)
+    static  = weakref.WeakKeyDictionary()
+
     def __init__(this,user,args=None):
         this.user = user
         this.args = this._parse_args(args,['testcase'])
@@ -1235,42 +1827,153 @@ class caseinfo_command(BaseCommand):
             msg.code  = 'cer'
             msg.error = 'Cannot get testcase log, no suite is loaded'
         else:
+            testcase = _find_testcase(this.runner, this.args['testcase'])
+            tail = _is_true(this.args.get('tail'))
+            try:
+                (offset, selected, total, cursor) = this.__log_range(testcase,
+                                                                     tail)
+            except ValueError, exc:
+                msg.code  = 'cer'
+                msg.error = 'Invalid caseinfo log range: %s' % exc
+                return
+            paged = tail or [a for a in ['offset', 'limit', 'since']
+                             if this.args.get(a) is not None]
+
             msg.code  = 'ack'
-            xml = ''
-            testcase = this.runner.suite.findTestCase(this.args['testcase'])
+            xml = XmlResponse.XmlResponse()
+            xml.open('testcase')
+            xml.element('name', testcase.friendlyName)
+            xml.cdata('description', testcase.description)
+            xml.element('startTime', int(testcase.startTime))
+            xml.element('finishTime', int(testcase.finishTime))
+            xml.element('status', testcase.result.upper())
+            xml.extend(this.__log_elements(testcase.log, selected))
+            (documentation, resultData) = this.__static_parts(testcase)
+            if not tail:
+                xml.raw(documentation)
+            xml.extend(resultData)
+            if paged:
+                xml.raw('<logRange offset="%d" next="%d" total="%d"/>\n'
+                        %(offset, offset + len(selected), total))
+            xml.close('testcase')
+            msg.data = xml.getvalue()
+            if tail:
+                this.__set_cursor(testcase, cursor)
+            this._compress(msg)
+
+    def __log_range(this, testcase, tail):
+        """Returns the (offset, indexes of the log entries to return, number
+        of entries to page through, tail cursor after them)"""
+        log = testcase.log
+        length = len(log)
+        first = 0
+        offset = 0
+        if tail:
+            try:
+                first = this.cursors.get(testcase, {}).get(this.user, 0)
+            except TypeError:
+                first = 0
+            if first > length:
+                # the log is shorter than last time, the testcase was rerun
+                first = 0
+        else:
+            offset = int(this.args.get('offset') or 0)
+            if offset < 0:
+                raise ValueError('offset %d is negative' % offset)
+        candidates = xrange(first, length)
+        since = this.args.get('since')
+        if since is not None:
+            since = _log_time(since)
+            # a LogStore keeps the times apart, filter without the messages
+            times = getattr(log, 'times', None)
+            if times is None:
+                times = [entry[0] for entry in log]
+            candidates = [i for i in candidates
+                          if _logged_after(times[i], since)]
+        stop = len(candidates)
+        if this.args.get('limit') is not None:
+            limit = int(this.args['limit'])
+            if limit < 0:
+                raise ValueError('limit %d is negative' % limit)
+            stop = min(stop, offset + limit)
+        selected = [candidates[i] for i in xrange(min(offset, stop), stop)]
+        cursor = length
+        if stop < len(candidates):
+            # the limit left entries out, tail from the first of them
+            cursor = candidates[stop]
+        return offset, selected, len(candidates), cursor
+
+    def __set_cursor(this, testcase, cursor):
+        try:
+            this.cursors.setdefault(testcase, {})[this.user] = cursor
+        except TypeError:
+            pass # a testcase which cannot be weakly referenced is not tailed
+
+    def __static_parts(this, testcase):
+        """Returns the (documentation, resultData) XML of a testcase, which
+        are built once and reused until the testcase changes"""
+        key = (testcase.longdesc, len(testcase.resultData))
+        cached = this.static.get(testcase)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        # clean up the docstring a bit
+        if testcase.longdesc is None:
+            docstring = ''
+        else:
+            docstring = testcase.longdesc.replace('        ','')
+            docstring = docstring.replace('@DESCRIPTION', '\n@DESCRIPTION')
+        documentation = XmlResponse.XmlResponse() \
+                .cdata('documentation', docstring).getvalue()
+        resultData = XmlResponse.XmlResponse()
+        for data in sorted(testcase.resultData,
+                           key=lambda i: str(i[1]).lower()):
+            resultData.element('resultData', data[1])
+        parts = (documentation, resultData.parts)
+        try:
+            this.static[testcase] = (key, parts)
+        except TypeError:
+            pass # a testcase which cannot be weakly referenced is not cached
+        return parts
 
-            # clean up the docstring a bit
-            if testcase.longdesc is None:
-                docstring = ''
-            else:
-                docstring = testcase.longdesc.replace('        ','')
-                docstring = docstring.replace('@DESCRIPTION', '\n@DESCRIPTION')
-
-            xml += '<testcase>\n'
-            xml += '<name>%s</name>\n' %testcase.friendlyName
-            xml += '<description><![CDATA[%s]]></description>\n' %testcase.description
-            xml += '<startTime>%d</startTime>\n' %testcase.startTime
-            xml += '<finishTime>%d</finishTime>\n' %testcase.finishTime
-            xml += '<status>%s</status>\n' %testcase.result.upper()
-            for log in testcase.log:
-                xml += '<log><time>%s</time>' %log[0] + \
-                       '<message><![CDATA[%s]]></message></log>\n' %log[1]
-            xml += '<documentation><![CDATA[%s]]></documentation>\n' %docstring
-            for data in sorted(testcase.resultData, 
-                               key=lambda i: str(i[1]).lower()):
-                xml += "<resultData>%s</resultData>\n" %data[1]
-            xml += '</testcase>\n'
-            msg.data = xml
+    def __log_elements(this, log, selected):
+        if not selected:
+            return
+        # a slice of a LogStore is read at once
+        first = selected[0]
+        entries = log[first:selected[-1] + 1]
+        for index in selected:
+            entry = entries[index - first]
+            yield '<log><time>%s</time><message>%s</message></log>\n' \
+                    %(XmlResponse.escape(entry[0]),
+                      XmlResponse.cdata(entry[1]))
 
 class runsubset_command(BaseCommand):
     """Instruct the service to run a subset of the loaded test suite
-    <testcases>
+    <testcases> <workers> <order> <shard> <durations> <isolate>
     This command will instruct the service to execute a particular selection
     of the currently loaded test cases. The test cases will run in the order
     recieved by this command, and can be interupted by the stop command. This
-    command takes one argument:
+    command takes the following arguments:
 
         testcases - a comma separted list of test case names
+
+        workers   - (optional) run up to this many testcases at once. Only
+                    testcases that declare non conflicting resources are run
+                    side by side.
+
+        order     - (optional) 'longest' or 'failfast', reorder the test
+                    cases by their past durations or failure rates.
+
+        shard     - (optional) "<index>/<count>", only run the index'th of
+                    count shards of the test cases, balanced on their
+                    durations in the shared duration store.
+
+        durations - (optional) with shard, the path of a frozen durations
+                    file to balance the shards on instead.
+
+        isolate   - (optional) if true, run each test case in a separate
+                    worker process.
     """
     name = 'runsubset'
     def __init__(this,user,args=None):
@@ -1291,17 +1994,35 @@ class runsubset_command(BaseCommand):
             # get a list of all the testcase objects and make sure they are
             # real testcases (they exist in this suite). If they don't exist,
             # return a client error.
+            try:
+                _materialize_suite(this.runner)
+            except RuntimeError, exc:
+                msg.code  = 'cer'
+                msg.error = str(exc)
+                return
             testcase_list = []
             casenames = this.args['testcases'].split(",")
             for casename in casenames:
                 try:
                     testcase_list.append( \
-                    this.runner.suite.findTestCase(casename) )
+                    _find_testcase(this.runner, casename) )
                 except AttributeError, exc:
                     this.runner.logger.exception(exc)
                     msg.code  = 'cer'
                     msg.error = str(exc)
                     return
+            _harvest_durations(this.runner)
+            try:
+                workers = _workers(this.args)
+                testcase_list = _schedule(this.runner, testcase_list,
+                                          this.args)
+                run = _isolated_run(this.runner, this.args, workers)
+                if workers > 1 and run is None:
+                    run = _testcase_run(this.runner)
+            except (ValueError, WorkerPool.WorkerError), exc:
+                msg.code  = 'cer'
+                msg.error = str(exc)
+                return
 
             # Remember the subset run list, so we can adjust counters correctly
             this.runner.DATA['SUBSET_RUN_LIST'] = \
@@ -1309,8 +2030,14 @@ class runsubset_command(BaseCommand):
 
             # set the state, and do it.
             this.runner.DATA['PREVIOUS_STATE'] = this.runner.DATA['state']
+            this.runner.PARALLEL_EXECUTOR = None
             this.runner.setState(this.runner.STATE_SUBSET_RUNNING)
-            this.runner.subset_testing(testcase_list)
+            if run is not None:
+                _run_parallel(this.runner, testcase_list, workers,
+                              this.runner.DATA['PREVIOUS_STATE'], run)
+            else:
+                _fold_checkpoint(this.runner)
+                this.runner.subset_testing(testcase_list)
             msg.code = 'ack'
 
 class error_command(BaseCommand):
@@ -1334,6 +2061,9 @@ class kickstart_command(BaseCommand):
     Kickstart a test for the service. This allows you to install a new
     build, and start a new testsutie all in one command. This could cause
     a reboot if the installer requires a reboot after install or uninstall.
+    All the installers are downloaded in parallel (through the local
+    installer cache) before the kickstart starts, and the time taken by
+    each stage is reported in the status message.
     This command takes 3 arguments
 
         suite        - the name of the test suite to load and start. If no
@@ -1363,14 +2093,33 @@ class kickstart_command(BaseCommand):
 
         this.runner.setState(this.runner.STATE_KICKSTART)
 
-        kickstart = Kickstart.Kickstart(this.user, this.args, this.runner)
+        this.kickstart = Kickstart.Kickstart(this.user, this.args, this.runner)
         try:
-            kickstart.verify_before_start()
-            kickstart.start()
+            this.kickstart.verify_before_start()
+
+            # Download every installer (and warm up the suite) in parallel
+            # before handing the staged copies over to the Kickstart.
+            pipeline = KickstartPipeline.KickstartPipeline(
+                    this.runner, this.args, _installer_cache(),
+                    os.path.join(os.getcwd(), KickstartPipeline.STAGING_DIR),
+                    [cfg.TESTSUITE_DIR, cfg.TESTCASE_DIR],
+                    this.__start_kickstart, this.kickstart.set_error)
+            pipeline.start()
             msg.code = 'ack'
 
         except Exception, e:
-            kickstart.set_error(e)
+            this.kickstart.set_error(e)
+            msg.code  = 'cer'
+            msg.error = str(e)
+
+    def __start_kickstart(this, staged_args):
+        # the Kickstart reads its arguments when it starts, point it at the
+        # staged copies
+        this.args.update(staged_args)
+        try:
+            this.kickstart.start()
+        except Exception, e:
+            this.kickstart.set_error(e)
 
 class insanity_command(BaseCommand):
     """Instruct automation to start a Sanity test
@@ -1414,6 +2163,47 @@ class insanity_command(BaseCommand):
 
         msg.code = 'ack'
 
+class prefetch_command(BaseCommand):
+    """Download installers into the local installer cache ahead of time
+    <install_urls>
+    This command will download the given installers into the installer cache
+    in the background, so a later kickstart of the same build does not have
+    to wait for them. The command responds immediately, with the urls it
+    prefetches. This command takes one argument:
+
+        install_urls - a double caret "^^" separated list of urls to
+                       installers that should be cached
+    """
+    name = 'prefetch'
+
+    def __init__(this, user, args=None):
+        this.user = user
+        this.args = this._parse_args(args,['install_urls'])
+
+    def do_command(this, msg):
+        if this.args['install_urls'] is None:
+            msg.code  = 'cer'
+            msg.error = 'No installer urls given to prefetch'
+            return
+
+        urls = KickstartPipeline.split_urls(this.args['install_urls'])
+        cache = _installer_cache()
+        xml = XmlResponse.XmlResponse().open('prefetch')
+        for url in urls:
+            thread.start_new_thread(this.__prefetch, (cache, url))
+            xml.element('url', url, '  ')
+        msg.code = 'ack'
+        msg.data = xml.close('prefetch').getvalue()
+
+    def __prefetch(this, cache, url):
+        start = time.time()
+        try:
+            cache.fetch(url)
+            this.runner.logger.info('Prefetched %s in %.1f seconds' \
+                    %(url, time.time() - start))
+        except Exception, exc:
+            this.runner.logger.exception('Failed to prefetch %s' % url)
+
 class takesnapshot_command(BaseCommand):
     """Instruct the service to take a VM snapshot (only works on VM's)
     <snapshotname>
@@ -1422,12 +2212,17 @@ class takesnapshot_command(BaseCommand):
     is a virtual machine. This command takes one argument:
 
         snapshotname - the name the snapshot should recieve
+
+    The snapshot is taken by a job, started once the response is sent. The
+    response holds the job's id, to follow it with the jobstatus command:
+      <job><id>...</id></job>
     """
     name = 'takesnapshot'
 
     def __init__(this, user, args='base'):
         this.user  = user
         this.args = this._parse_args(args,['snapshotname'])
+        this.job  = None
 
     def do_command(this, msg):
 
@@ -1443,22 +2238,25 @@ class takesnapshot_command(BaseCommand):
         else:
             this.runner.logger.info("Taking snapshot named '%s'." \
                     %this.args['snapshotname'])
-            try:
-                thread.start_new_thread(
-                    this.__take_latest_snapshot, (this.args['snapshotname'],))
-                this.runner.setState(this.runner.STATE_REBOOTING)
-                msg.code = 'ack'
-            except Exception, exc:
-                msg.code  = 'cer'
-                msg.error = "Failure while attempting to take snapshot! %s" \
-                   % repr(exc)
-        this.runner.logger.info("Snapshotting completed.")
+            this.job = _snapshot_jobs().create('takesnapshot',
+                    this.args['snapshotname'], _vm_manager_call,
+                    'takeSnapshot', this.args['snapshotname'])
+            this.runner.setState(this.runner.STATE_REBOOTING)
+            msg.code = 'ack'
+            msg.data = XmlResponse.XmlResponse().open('job') \
+                    .element('id', this.job.id, '  ').close('job').getvalue()
 
-    def __take_latest_snapshot(this, name):
-        time.sleep(5) # Sleeping 5 seconds to ensure the responce is sent.
-        import VMManager
-        vmManager = VMManager.VMManager()
-        vmManager.takeSnapshot(name)
+    def do_post_socket_send_actions(this):
+        # start snapshotting only once the response is out
+        if this.job is None:
+            return
+        try:
+            _snapshot_jobs().start(this.job.id)
+        except SnapshotJobs.JobError, exc:
+            # it expired before the response went out
+            this.runner.logger.error(str(exc))
+            return
+        this.runner.logger.info("Snapshot job %s started." % this.job.id)
 
 class reverttolatestsnapshotofname_command(BaseCommand):
     """Instruct the service to revert to a specific snapshot (only works on VMs)
@@ -1468,12 +2266,17 @@ class reverttolatestsnapshotofname_command(BaseCommand):
     is a virtual machine. This command takes one argument:
 
         snapshotname - the name the snapshot should recieve
+
+    The revert is done by a job, started once the response is sent. The
+    response holds the job's id, to follow it with the jobstatus command:
+      <job><id>...</id></job>
     """
     name = 'reverttolatestsnapshotofname'
 
     def __init__(this, user, args=None):
         this.user  = user
         this.args = this._parse_args(args,['snapshotname'])
+        this.job  = None
 
     def do_command(this, msg):
 
@@ -1489,22 +2292,180 @@ class reverttolatestsnapshotofname_command(BaseCommand):
         else:
             this.runner.logger.info("Reverting to latest snapshot of name '%s'."
                                     % this.args['snapshotname'])
+            this.job = _snapshot_jobs().create('reverttolatestsnapshotofname',
+                    this.args['snapshotname'], _vm_manager_call,
+                    'revertToLatestSnapshot', this.args['snapshotname'])
+            this.runner.setState(this.runner.STATE_REBOOTING)
+            msg.code = 'ack'
+            msg.data = XmlResponse.XmlResponse().open('job') \
+                    .element('id', this.job.id, '  ').close('job').getvalue()
+
+    def do_post_socket_send_actions(this):
+        # start reverting only once the response is out
+        if this.job is None:
+            return
+        try:
+            _snapshot_jobs().start(this.job.id)
+        except SnapshotJobs.JobError, exc:
+            # it expired before the response went out
+            this.runner.logger.error(str(exc))
+            return
+        this.runner.logger.info("Snapshot revert job %s started."
+                                % this.job.id)
+
+class jobstatus_command(BaseCommand):
+    """Returns the state of the snapshot jobs of this service
+    <jobid>
+    This command returns the state of a job submitted by takesnapshot or
+    reverttolatestsnapshotofname, or of every job still known if no job id is
+    given. The state of a job is one of queued, running, done or failed:
+      <jobs>
+        <job>
+          <id>...</id>
+          <kind>takesnapshot</kind>
+          <target>base</target>
+          <state>failed</state>
+          <error>...</error>
+          <submitted>...</submitted>
+          <started>...</started>
+          <finished>...</finished>
+        </job>
+      </jobs>
+
+    Jobs are only known to the service process which runs them, they are
+    not persisted. A job id the service does not know (a client error) means
+    the service was restarted since, as it is when a revert job restores the
+    machine to its snapshot: check the machine rather than the job then.
+    """
+    name = 'jobstatus'
+    FIELDS = ['id', 'kind', 'target', 'state', 'error', 'submitted',
+              'started', 'finished']
+
+    def __init__(this, user, args=None):
+        this.user = user
+        if type(args) is dict:
+            this.args = this._parse_args(args,[])
+        else:
+            # the job id is optional, and positional in protocol 00
+            this.args = this._parse_args(args,['jobid'])
+
+    def do_command(this, msg):
+        jobs = _snapshot_jobs()
+        try:
+            if this.args.get('jobid'):
+                selected = [jobs.get(this.args['jobid'])]
+            else:
+                selected = jobs.list()
+        except SnapshotJobs.JobError, exc:
+            msg.code  = 'cer'
+            msg.error = str(exc)
+            return
+        this._respond(msg, {'jobs': [job.as_dict() for job in selected]},
+                      this.__xml)
+
+    def __xml(this, data):
+        xml = XmlResponse.XmlResponse().open('jobs')
+        for job in data['jobs']:
+            xml.open('job', '  ')
+            for field in this.FIELDS:
+                if job[field] is not None:
+                    xml.element(field, job[field], '    ')
+            xml.close('job', '  ')
+        return xml.close('jobs').getvalue()
+
+class hosts_command(BaseCommand):
+    """Register or unregister a host in the hosts registry of this service
+    <action> <ip> <name>
+    This command maintains the hosts registry the hosts file of this machine
+    (cfg.HOSTS_FILE) is generated from, for the hosts registering themselves
+    as they are set up. This command takes the following arguments:
+
+        action - 'register' or 'unregister'
+
+        ip     - the address of the host
+
+        name   - the name of the host, to register it (or to unregister it
+                 whatever its address)
+
+    Registering an address or a name again replaces its old entry. The
+    arguments may also be given as "ip=..." and "name=...", as
+    ServerConnection sends them. The response lists the entries replaced or
+    removed:
+      <hosts>
+        <removed><ip>...</ip><name>...</name></removed>
+      </hosts>
+    """
+    name = 'hosts'
+    ACTIONS = ['register', 'unregister']
+
+    def __init__(this, user, args=None):
+        this.user = user
+        if type(args) is str:
+            args = this.__keyword_args(args)
+        this.args = this._parse_args(args, ['action', 'ip'])
+
+    def __keyword_args(this, args):
+        # positional action, ip and name, or "ip=..." and "name=..."
+        data = {'action': None, 'ip': None}
+        positional = ['action', 'ip', 'name']
+        for value in args.split():
+            value = value.strip('"')
+            if '=' in value:
+                (key, value) = value.split('=', 1)
+            elif positional:
+                key = positional.pop(0)
+            else:
+                raise RuntimeError('%s too many arguments' \
+                        % this.__class__.__name__)
+            if key in positional:
+                positional.remove(key)
+            data[key] = value
+        return data
+
+    def do_command(this, msg):
+        action = this.args.get('action')
+        ip = this.args.get('ip')
+        name = this.args.get('name')
+        if action not in this.ACTIONS:
+            msg.code  = 'cer'
+            msg.error = 'Invalid hosts action "%s", expected one of %s' \
+                    %(action, ', '.join(this.ACTIONS))
+            return
+        if action == 'register' and not (ip and name):
+            msg.code  = 'cer'
+            msg.error = 'hosts register needs an ip and a name'
+            return
+        if ip is not None:
             try:
-                thread.start_new_thread(this.__revert_latest_snapshot_of_name,
-                                        (this.args['snapshotname'],))
-                this.runner.setState(this.runner.STATE_REBOOTING)
-                msg.code = 'ack'
-            except Exception, exc:
+                NetworkTable.parse(ip)
+            except NetworkTable.AddressError, exc:
                 msg.code  = 'cer'
-                msg.error = "Failure while attempting to revert snapshot! %s" \
-                   % repr(exc)
-        this.runner.logger.info("Snapshot reverting completed.")
+                msg.error = str(exc)
+                return
+        elif name is None:
+            msg.code  = 'cer'
+            msg.error = 'hosts unregister needs an ip or a name'
+            return
 
-    def __revert_latest_snapshot_of_name(this, name):
-        time.sleep(5) # Sleeping 5 seconds to ensure the responce is sent.
-        import VMManager
-        vmManager = VMManager.VMManager()
-        vmManager.revertToLatestSnapshot(name)
+        registry = _host_registry()
+        if action == 'register':
+            removed = registry.upsert(ip, name)
+            this.runner.logger.info('Registered host %s at %s' %(name, ip))
+        else:
+            removed = registry.delete(ip, name)
+            this.runner.logger.info('Unregistered host %s' %(ip or name))
+        this._respond(msg, {'removed': [{'ip': i, 'name': n}
+                                        for (i, n) in removed]},
+                      this.__xml)
+
+    def __xml(this, data):
+        xml = XmlResponse.XmlResponse().open('hosts')
+        for entry in data['removed']:
+            xml.open('removed', '  ')
+            xml.element('ip', entry['ip'], '    ')
+            xml.element('name', entry['name'], '    ')
+            xml.close('removed', '  ')
+        return xml.close('hosts').getvalue()
 
 class svnstatus_command(BaseCommand):
     """Returns SVN revision number and a list of modified files
@@ -1521,19 +2482,20 @@ class svnstatus_command(BaseCommand):
 
     def do_command(this, msg):
         # Grab the revision number.
-        revision_xml = "<revision>%s</revision>\n" % this.__get_revision()
+        xml = XmlResponse.XmlResponse().open('svnstatus')
+        xml.element('revision', this.__get_revision())
+        xml.extend(this.__get_changes_xml())
+        xml.close('svnstatus')
         # Build response message.
         msg.code = 'ack'
-        msg.data = "<svnstatus>\n%s%s</svnstatus>" % (revision_xml,
-                                                      this.__get_changes_xml())
+        msg.data = xml.getvalue().rstrip('\n')
 
     def __get_changes_xml(this):
-        """Returns an xml that represents all the changes found in
-        local repository. If pysvn is not installed, and emptry string
+        """Returns a list of xml elements that represents all the changes
+        found in local repository. If pysvn is not installed, an empty list
         is returned."""
         try:
             import pysvn
-            file_xml = '<file status="%s">%s</file>\n'
             client = pysvn.Client()
             # Assigning callback asked by pysvn.
             client.callback_ssl_server_trust_prompt = ssl_server_trust_prompt
@@ -1546,13 +2508,13 @@ class svnstatus_command(BaseCommand):
                               for file in client.status('.')
                               if file['text_status'] not in ignored_status]
 
-            changes_xml = ''
+            changes_xml = XmlResponse.XmlResponse()
             for status, path in modified_files:
-                changes_xml += file_xml % (status, path)
-            return changes_xml
+                changes_xml.element('file', path, status=status)
+            return changes_xml.parts
         except Exception:
             this.runner.logger.exception('Failed to get SVN modifications')
-            return ''
+            return []
 
     def __get_revision(this):
         """"This function attempts to find the SVN revision number. It uses
@@ -1616,21 +2578,58 @@ class svnstatus_command(BaseCommand):
 
 class cleanup_command(BaseCommand):
     """Cleans up the installers and results folder
-
+    <keep_saves> <keep_days> <max_mb> <auto>
     This command will remove all the folders and files inside of the installers
-    and results folders under the automation directory.
+    and results folders under the automation directory. Everything is renamed
+    aside and the command responds immediately, the actual deletion happens
+    in the background. If any of the retention arguments are given, only the
+    saved results not covered by the retention policy are removed and the
+    installers folder is left alone:
+
+        keep_saves - (optional) always keep the newest N saved results
+
+        keep_days  - (optional) always keep saved results newer than X days
+
+        max_mb     - (optional) remove the oldest saved results until the
+                     results folder uses less than this many megabytes
+
+        auto       - (optional) if true, remember the retention policy and
+                     apply it again every time a suite is loaded
     """
     name = 'cleanup'
 
+    # Shared by every cleanup, so deletions from back to back commands are
+    # spread over the same pool of background threads.
+    ENGINE = CleanupEngine.CleanupEngine()
+
     def __init__(this,user,args=None):
         this.user = user
         this.args = this._parse_args(args,[])
 
     def do_command(this, msg):
 
+        policy = {}
         try:
-            this.__cleanupdir('installers')
-            this.__cleanupdir('results')
+            if this.args.get('keep_saves') is not None:
+                policy['keep_saves'] = int(this.args['keep_saves'])
+            if this.args.get('keep_days') is not None:
+                policy['keep_days'] = float(this.args['keep_days'])
+            if this.args.get('max_mb') is not None:
+                policy['max_bytes'] = int(float(this.args['max_mb'])*1024*1024)
+        except ValueError, exc:
+            msg.code  = 'cer'
+            msg.error = "Invalid retention policy! %s" % repr(exc)
+            return
+
+        try:
+            if policy:
+                if _is_true(this.args.get('auto')):
+                    this.runner.RETENTION_POLICY = policy
+                this.apply_policy(this.runner, policy)
+            else:
+                this.__cleanupdir('installers')
+                this.__cleanupdir(KickstartPipeline.STAGING_DIR)
+                this.__cleanupdir('results')
         except Exception, exc:
             msg.code  = 'cer'
             msg.error = "Failure while attempting to delete directories! %s" \
@@ -1638,23 +2637,30 @@ class cleanup_command(BaseCommand):
             return
 
         msg.code = 'ack'
-        msg.data = 'Cleanup completed \n'
+        msg.data = 'Cleanup started \n'
+
+    @classmethod
+    def apply_policy(cls, runner, policy):
+        """Apply a retention policy to the results folder in the background,
+        never touching the results of the currently loaded suite"""
+        keep = []
+        suite = getattr(runner, 'suite', None)
+        if suite is not None and getattr(suite, 'resultDataDir', None):
+            keep.append(os.path.basename(
+                os.path.normpath(suite.resultDataDir)))
+        cls.ENGINE.submit(cls.ENGINE.apply_retention,
+                os.path.join(os.getcwd(), 'results'),
+                policy.get('keep_saves'), policy.get('keep_days'),
+                policy.get('max_bytes'), keep)
 
     def __cleanupdir(this, dirname):
-        """"This function deletes all the content on a given sub directory in
-        the given working directory.
+        """"This function moves all the content on a given sub directory in
+        the given working directory aside, and deletes it in the background.
         """
-        import shutil
-
         dir_path = os.path.join(os.getcwd(), dirname)
-
-        if os.path.exists(dir_path):
-            for file in os.listdir(dir_path):
-                file_path = os.path.join(dir_path, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
+        trashed = this.ENGINE.empty(dir_path)
+        this.runner.logger.info('Cleanup: deleting %d entries from %s' \
+                %(len(trashed), dir_path))
 
 class osupdate_command(BaseCommand):
     """Performs critical updates on the host operating system.
@@ -1773,14 +2779,14 @@ class getdevcode_command(BaseCommand):
         this.download_files(dev_name)
 
         if len(this.files_copied) > 0:
-            xml = "<dev_name>%s</dev_name>" % dev_name
-            xml += "<files>\n"
+            xml = XmlResponse.XmlResponse().element('dev_name', dev_name)
+            xml.open('files')
             for f in this.files_copied:
-                xml += "<file>%s</file>\n" % f
-            xml += "</files>\n"
+                xml.element('file', f)
+            xml.close('files')
 
             msg.code = 'ack'
-            msg.data = xml
+            msg.data = xml.getvalue()
 
         else:
             msg.code  = 'cer'
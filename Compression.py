@@ -0,0 +1,132 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the optional compression of large payloads sent
+over the length framed command sockets.
+
+A peer that can decompress says so with the "compress" argument of a
+request, listing the algorithms it accepts in order of preference (eg
+"lz4,zlib"). A payload larger than THRESHOLD bytes is then compressed with
+the first of them supported here, and prefixed with a "#<algorithm>\\n"
+marker line, so the receiving side can always tell a compressed payload
+from a plain one. Payloads which do not shrink are sent as they are.
+
+zlib is always available, lz4 only if the lz4 module is installed.
+
+Every payload compressed here is counted in METRICS, and every payload
+decompressed here in RECEIVED (bytes before and after, and the time spent),
+so the ratio actually achieved can be reported.
+'''
+import threading
+import time
+import zlib
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+ZLIB = 'zlib'
+LZ4  = 'lz4'
+
+# Payloads up to this many bytes are never compressed
+THRESHOLD = 16 * 1024
+
+class CompressionError(Exception): pass
+
+def supported():
+    """Returns the algorithms supported here, fastest first"""
+    algorithms = []
+    if lz4frame is not None:
+        algorithms.append(LZ4)
+    algorithms.append(ZLIB)
+    return algorithms
+
+def negotiate(accept):
+    """Returns the first algorithm of accept (a comma separated list, or a
+    list) that is supported here, or None"""
+    if not accept:
+        return None
+    if isinstance(accept, basestring):
+        accept = accept.split(',')
+    available = supported()
+    for algorithm in accept:
+        algorithm = algorithm.strip().lower()
+        if algorithm in available:
+            return algorithm
+    return None
+
+class Metrics(object):
+    '''Counts the compressed payloads sent or received'''
+
+    def __init__(this):
+        this.lock = threading.Lock()
+        this.reset()
+
+    def reset(this):
+        this.payloads  = 0
+        this.raw_bytes = 0
+        this.sent_bytes = 0
+        this.seconds   = 0.0
+
+    def record(this, raw_size, sent_size, seconds):
+        with this.lock:
+            this.payloads   += 1
+            this.raw_bytes  += raw_size
+            this.sent_bytes += sent_size
+            this.seconds    += seconds
+
+    def ratio(this):
+        """Returns the overall compression ratio (raw / compressed)"""
+        with this.lock:
+            if not this.sent_bytes:
+                return 1.0
+            return float(this.raw_bytes) / this.sent_bytes
+
+    def as_dict(this):
+        with this.lock:
+            return {'payloads'  : this.payloads,
+                    'rawBytes'  : this.raw_bytes,
+                    'sentBytes' : this.sent_bytes,
+                    'seconds'   : round(this.seconds, 3)}
+
+METRICS  = Metrics()
+RECEIVED = Metrics()
+
+def compress(payload, algorithm, threshold=THRESHOLD):
+    """Returns payload compressed with algorithm (and marked as such) if it
+    is larger than threshold and compressing it pays off, or payload as it
+    is otherwise"""
+    if algorithm is None or len(payload) <= threshold:
+        return payload
+    start = time.time()
+    if algorithm == ZLIB:
+        body = zlib.compress(payload, 6)
+    elif algorithm == LZ4 and lz4frame is not None:
+        body = lz4frame.compress(payload)
+    else:
+        raise CompressionError('Unsupported compression %s' % algorithm)
+    compressed = '#%s\n%s' %(algorithm, body)
+    if len(compressed) >= len(payload):
+        return payload
+    METRICS.record(len(payload), len(compressed), time.time() - start)
+    return compressed
+
+def decompress(payload):
+    """Returns the original of a (possibly) compressed payload"""
+    for algorithm in [ZLIB, LZ4]:
+        marker = '#%s\n' % algorithm
+        if not payload.startswith(marker):
+            continue
+        start = time.time()
+        body = payload[len(marker):]
+        if algorithm == ZLIB:
+            original = zlib.decompress(body)
+        elif lz4frame is not None:
+            original = lz4frame.decompress(body)
+        else:
+            raise CompressionError('Cannot decompress a lz4 payload, the '
+                                   'lz4 module is not installed')
+        RECEIVED.record(len(original), len(payload), time.time() - start)
+        return original
+    return payload
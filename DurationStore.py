@@ -0,0 +1,201 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the historical testcase duration store, and the
+ordering and sharding built on top of it.
+
+Every testcase that finished is recorded under its full name (module.Class)
+with an exponentially weighted moving average of its duration and of its
+failure rate, so recent runs weigh more than old ones. The store is a small
+json file, written atomically after each batch of updates.
+
+Testcases can then be ordered longest first (which keeps a pool of parallel
+workers busy until the end) or most likely to fail first (so a broken build
+shows up early), and a list of testcases can be split into K shards of
+about equal predicted runtime. Balanced sharding is only deterministic for a
+given store, so runners splitting a suite between them shard from the same
+store file: a store they share, read when the run starts, or a frozen copy
+of a store passed to them by path. hash_shard() splits the testcases on a
+stable hash of their names instead, which every runner agrees on without
+any store.
+'''
+import json
+import os
+import threading
+import zlib
+
+# The weight of the newest sample in the moving averages
+ALPHA = 0.3
+
+# Results that count as a failure for fail fast ordering
+FAILED_RESULTS = ['fail', 'block', 'crash', 'error']
+
+ORDERS = ['declared', 'longest', 'failfast']
+
+def full_name(testcase):
+    """Returns the module.Class name a testcase is stored under"""
+    manifest = getattr(testcase, '_manifest', None)
+    if manifest is not None:
+        return '%s.%s' %(manifest.module_name, manifest.class_name)
+    return '%s.%s' %(testcase.__class__.__module__,
+                     testcase.__class__.__name__)
+
+def parse_shard(value):
+    """Parse a "i/K" shard argument into (i, K), where 0 <= i < K. Raises
+    ValueError if it is malformed."""
+    try:
+        (index, count) = [int(v) for v in str(value).split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard "%s", expected <index>/<count>'
+                         % value)
+    if count < 1 or index < 0 or index >= count:
+        raise ValueError('Invalid shard "%s", expected 0 <= index < count'
+                         % value)
+    return index, count
+
+def hash_shard(testcases, index, count):
+    """Returns the testcases of shard index of count, split on a stable
+    hash of their names (the same on every runner and every run), keeping
+    the given order"""
+    return [t for t in testcases
+            if (zlib.crc32(full_name(t)) & 0xffffffff) % count == index]
+
+class DurationStore(object):
+    '''
+    A persistent store of testcase durations and failure rates.
+
+        path - the json file the store is kept in
+    '''
+
+    def __init__(this, path):
+        this.path  = path
+        this.lock  = threading.Lock()
+        this.data  = this.__read()
+
+    def estimate(this, testcase):
+        """Returns the predicted duration of testcase in seconds, or None if
+        it never ran"""
+        entry = this.data.get(full_name(testcase))
+        if entry is None:
+            return None
+        return entry['duration']
+
+    def fail_rate(this, testcase):
+        entry = this.data.get(full_name(testcase))
+        if entry is None:
+            return 0.0
+        return entry['failRate']
+
+    def record(this, testcase, save=True):
+        """Record the duration and result of a finished testcase. A run that
+        was already recorded (same startTime) is ignored. Returns True if
+        the testcase was recorded."""
+        start  = getattr(testcase, 'startTime', 0) or 0
+        finish = getattr(testcase, 'finishTime', 0) or 0
+        result = str(getattr(testcase, 'result', None)).lower()
+        if not start or finish < start or result in ['none', 'notrun']:
+            return False
+
+        name = full_name(testcase)
+        failed = result in FAILED_RESULTS and 1.0 or 0.0
+        with this.lock:
+            entry = this.data.get(name)
+            if entry is not None and entry['last'] == start:
+                return False
+            if entry is None:
+                entry = {'duration': finish - start, 'failRate': failed,
+                         'runs': 0}
+            else:
+                entry['duration'] += ALPHA * (finish - start - entry['duration'])
+                entry['failRate'] += ALPHA * (failed - entry['failRate'])
+            entry['runs'] += 1
+            entry['last']  = start
+            this.data[name] = entry
+            if save:
+                this.__write()
+        return True
+
+    def harvest(this, testcases):
+        """Record every finished testcase that was not recorded yet, and save
+        the store once. Returns the number of testcases recorded."""
+        recorded = 0
+        for testcase in testcases:
+            if getattr(testcase, '_testcase', True) is None:
+                # a lazy testcase that was never loaded, so never run
+                continue
+            if this.record(testcase, save=False):
+                recorded += 1
+        if recorded:
+            with this.lock:
+                this.__write()
+        return recorded
+
+    def order(this, testcases, order):
+        """Returns testcases sorted by order ('declared', 'longest' or
+        'failfast'). Testcases which never ran are assumed to take the
+        average duration. The sort is stable."""
+        if order not in ORDERS:
+            raise ValueError('Invalid order "%s", expected one of %s'
+                             %(order, ', '.join(ORDERS)))
+        if order == 'declared':
+            return list(testcases)
+        durations = this.__durations(testcases)
+        if order == 'longest':
+            return sorted(testcases, key=lambda t: -durations[id(t)])
+        # most likely to fail first, and the quickest of those first
+        return sorted(testcases, key=lambda t: (-this.fail_rate(t),
+                                                durations[id(t)]))
+
+    def shard(this, testcases, index, count):
+        """Split testcases into count shards of about equal predicted
+        runtime (longest processing time first) and return shard index,
+        keeping the given order within the shard. Runners only get the same
+        split if they shard from the same store data."""
+        durations = this.__durations(testcases)
+        loads  = [0.0] * count
+        shards = [[] for i in range(count)]
+        ranked = sorted(enumerate(testcases),
+                        key=lambda (i, t): (-durations[id(t)], full_name(t)))
+        for (position, testcase) in ranked:
+            lightest = loads.index(min(loads))
+            loads[lightest] += durations[id(testcase)]
+            shards[lightest].append((position, testcase))
+        return [t for (position, t) in sorted(shards[index])]
+
+    def predict(this, testcases):
+        """Returns the predicted total runtime of testcases, in seconds"""
+        return sum(this.__durations(testcases).values())
+
+    def __durations(this, testcases):
+        """Returns a dictionary of id(testcase) -> predicted duration"""
+        known = [this.estimate(t) for t in testcases]
+        ran = [d for d in known if d is not None]
+        default = ran and sum(ran) / len(ran) or 60.0
+        return dict([(id(t), d is None and default or d)
+                     for (t, d) in zip(testcases, known)])
+
+    def __read(this):
+        try:
+            fp = open(this.path, 'rb')
+            try:
+                return json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            return {}
+
+    def __write(this):
+        directory = os.path.dirname(this.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # write then rename, so a crash never leaves a half written store
+        tmp_path = this.path + '.tmp'
+        fp = open(tmp_path, 'wb')
+        try:
+            json.dump(this.data, fp)
+        finally:
+            fp.close()
+        if os.name == 'nt' and os.path.exists(this.path):
+            # rename does not replace an existing file on windows
+            os.remove(this.path)
+        os.rename(tmp_path, this.path)
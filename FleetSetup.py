@@ -0,0 +1,283 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the fleet installer, which runs setup.py on many
+hosts at once over SSH.
+
+Each host gets the local setup.py pushed into its automation directory (so
+the whole fleet installs with the same script), and runs it in its
+non-interactive mode. At most a given number of hosts are set up at the same
+time. Every line a host's setup prints is streamed, prefixed with the host's
+name, and once every host is done a summary of the results (exit code, time
+taken, last line of output) is printed. The exit code is non zero if any
+host failed.
+
+The command a host runs is a POSIX shell command, so only Linux and Mac
+hosts can be set up. A host whose SSH server runs another shell (eg cmd.exe
+on a Windows host) is refused before anything is pushed to it, and has to
+run setup.py itself.
+
+    FleetSetup.py -f hosts.txt -u root install anyconnect
+    FleetSetup.py -t host:anyconnect -u root -w 20 install anyconnect
+    FleetSetup.py -f hosts.txt -u root remove
+
+The hosts are read from a file (one per line, # starts a comment) and/or
+asked from the dashboard (the resources of a type and capability in this
+host's testbed). The password is asked for once, or read from the
+AUTOMATION_FLEET_PASSWORD environment variable, unless a key is given.
+'''
+import getpass
+import optparse
+import os
+import posixpath
+import Queue
+import sys
+import threading
+import time
+
+import paramiko
+
+PASSWORD_VARIABLE = 'AUTOMATION_FLEET_PASSWORD'
+
+SETUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'setup.py')
+
+def read_hosts(path):
+    """Returns the hosts listed in a file, one per line"""
+    hosts = []
+    fp = open(path, 'r')
+    try:
+        for line in fp:
+            host = line.split('#', 1)[0].strip()
+            if host and host not in hosts:
+                hosts.append(host)
+    finally:
+        fp.close()
+    return hosts
+
+def testbed_hosts(resource):
+    """Returns the hosts of a "type:capability" resource in this host's
+    testbed, as known by the dashboard"""
+    import ServerConnection
+    (resource_type, capability) = resource.split(':', 1)
+    hosts = ServerConnection.ServerConnection().get_testbed_resources(
+            resource_type, capability)
+    if not isinstance(hosts, list):
+        raise RuntimeError('Could not get the %s hosts of the testbed: %s'
+                           %(resource, hosts.error))
+    return hosts
+
+class UnsupportedHost(Exception): pass
+
+class HostResult(object):
+    '''The outcome of setting up one host'''
+
+    def __init__(this, host):
+        this.host      = host
+        this.rc        = None
+        this.error     = None
+        this.last_line = ''
+        this.seconds   = 0.0
+
+    def succeeded(this):
+        return this.error is None and this.rc == 0
+
+class FleetSetup(object):
+    '''
+    Runs setup.py with the same arguments on every host of a fleet.
+
+        hosts      - the host names or addresses
+        setup_args - the arguments of setup.py (eg ['install', 'anyconnect',
+                     'none'] or ['-r'])
+        username, password, key_filename - the SSH credentials
+        workers    - how many hosts are set up at the same time
+        remote_dir - the automation directory of the hosts
+        python     - the python interpreter of the hosts
+        push       - the local setup.py copied to the hosts first, or None to
+                     run the one the hosts have
+        timeout    - seconds a host's setup may take
+        out        - where the progress is written
+    '''
+
+    def __init__(this, hosts, setup_args, username, password=None,
+                 key_filename=None, workers=10, remote_dir='/automation',
+                 python='python', push=SETUP_SCRIPT, timeout=1800,
+                 out=sys.stdout):
+        this.hosts        = list(hosts)
+        this.setup_args   = list(setup_args)
+        this.username     = username
+        this.password     = password
+        this.key_filename = key_filename
+        this.workers      = max(1, min(workers, len(this.hosts)))
+        this.remote_dir   = remote_dir
+        this.python       = python
+        this.push         = push
+        this.timeout      = timeout
+        this.out          = out
+        this.lock         = threading.Lock()
+        this.results      = {}
+
+    def run(this):
+        """Set up every host, and return their results in the hosts order"""
+        queue = Queue.Queue()
+        for host in this.hosts:
+            queue.put(host)
+        threads = []
+        for i in range(this.workers):
+            thread = threading.Thread(target=this.__worker, args=(queue,))
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return [this.results[host] for host in this.hosts]
+
+    def command(this):
+        """Returns the command a host runs"""
+        script = posixpath.join(this.remote_dir, 'setup.py')
+        return 'cd "%s" && %s "%s" %s --non-interactive' \
+                %(this.remote_dir, this.python, script,
+                  ' '.join(['"%s"' % arg for arg in this.setup_args]))
+
+    def __worker(this, queue):
+        while True:
+            try:
+                host = queue.get_nowait()
+            except Queue.Empty:
+                return
+            result = HostResult(host)
+            start = time.time()
+            try:
+                this.__setup(host, result)
+            except Exception, exc:
+                result.error = '%s: %s' %(exc.__class__.__name__, exc)
+                this.__report(host, 'ERROR %s' % result.error)
+            result.seconds = time.time() - start
+            with this.lock:
+                this.results[host] = result
+                done = len(this.results)
+            this.__report(host, '%s in %ds (%d/%d hosts done)'
+                          %(result.succeeded() and 'succeeded' or 'FAILED',
+                            result.seconds, done, len(this.hosts)))
+
+    def __setup(this, host, result):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            this.__report(host, 'connecting')
+            ssh.connect(host, 22, this.username, this.password,
+                        key_filename=this.key_filename, timeout=30)
+            this.__check_posix(ssh)
+            if this.push is not None:
+                sftp = ssh.open_sftp()
+                try:
+                    sftp.put(this.push,
+                             posixpath.join(this.remote_dir, 'setup.py'))
+                finally:
+                    sftp.close()
+            command = this.command()
+            this.__report(host, 'running %s' % command)
+            channel = ssh.get_transport().open_session()
+            # setup prints its progress on both, read them as one stream
+            channel.set_combine_stderr(True)
+            channel.settimeout(this.timeout)
+            channel.exec_command(command)
+            channel.shutdown_write()
+            for line in channel.makefile('rb'):
+                line = line.rstrip()
+                if line:
+                    result.last_line = line
+                    this.__report(host, line)
+            result.rc = channel.recv_exit_status()
+        finally:
+            ssh.close()
+
+    def __check_posix(this, ssh):
+        """Raise UnsupportedHost unless the host runs a POSIX shell"""
+        (stdin, stdout, stderr) = ssh.exec_command('uname -s', timeout=30)
+        stdin.close()
+        system = stdout.read().strip()
+        if stdout.channel.recv_exit_status() != 0 or not system:
+            raise UnsupportedHost('not a POSIX host (Windows hosts are not '
+                                  'supported, run setup.py on them)')
+
+    def __report(this, host, text):
+        with this.lock:
+            this.out.write('[%s] %s\n' %(host, text))
+            this.out.flush()
+
+def summary(results, out=sys.stdout):
+    """Print the results of a fleet setup, returns the number of failures"""
+    failed = [r for r in results if not r.succeeded()]
+    width = max([len(r.host) for r in results] + [4])
+    out.write('\n%-*s  %-6s  %6s  %s\n' %(width, 'HOST', 'RESULT', 'TIME',
+                                        'LAST OUTPUT'))
+    for result in results:
+        if result.error is not None:
+            outcome = 'error'
+            detail = result.error
+        else:
+            outcome = result.rc == 0 and 'ok' or 'rc=%d' % result.rc
+            detail = result.last_line
+        out.write('%-*s  %-6s  %5ds  %s\n' %(width, result.host, outcome,
+                                             result.seconds, detail))
+    out.write('\n%d hosts, %d succeeded, %d failed\n'
+              %(len(results), len(results) - len(failed), len(failed)))
+    return len(failed)
+
+def main(argv):
+    parser = optparse.OptionParser(
+            usage='%prog [options] install <module> [resource-pool] | remove')
+    parser.add_option('-f', '--hosts-file', action='append', default=[],
+                      help='file listing the hosts, one per line')
+    parser.add_option('-t', '--testbed', action='append', default=[],
+                      metavar='TYPE:CAPABILITY',
+                      help='set up the resources of this testbed')
+    parser.add_option('-u', '--user', default=getpass.getuser(),
+                      help='SSH user (default %default)')
+    parser.add_option('-k', '--key', help='SSH private key file')
+    parser.add_option('-w', '--workers', type='int', default=10,
+                      help='hosts set up at the same time (default %default)')
+    parser.add_option('--remote-dir', default='/automation',
+                      help='automation directory of the hosts '
+                           '(default %default)')
+    parser.add_option('--python', default='python',
+                      help='python interpreter of the hosts '
+                           '(default %default)')
+    parser.add_option('--no-push', action='store_true',
+                      help="run the hosts' own setup.py")
+    parser.add_option('--timeout', type='int', default=1800,
+                      help='seconds a host may take (default %default)')
+    (options, args) = parser.parse_args(argv)
+
+    if args[:1] == ['install'] and len(args) in [2, 3]:
+        pool = len(args) == 3 and args[2] or 'none'
+        setup_args = ['install', args[1], pool]
+    elif args == ['remove']:
+        setup_args = ['-r']
+    else:
+        parser.error('expected "install <module> [resource-pool]" or '
+                     '"remove"')
+
+    hosts = []
+    for path in options.hosts_file:
+        hosts.extend(read_hosts(path))
+    for resource in options.testbed:
+        hosts.extend(testbed_hosts(resource))
+    hosts = [h for (i, h) in enumerate(hosts) if h not in hosts[:i]]
+    if not hosts:
+        parser.error('no hosts given (use --hosts-file or --testbed)')
+
+    password = os.environ.get(PASSWORD_VARIABLE)
+    if password is None and options.key is None:
+        password = getpass.getpass('SSH password for %s: ' % options.user)
+
+    fleet = FleetSetup(hosts, setup_args, options.user, password,
+                       options.key, options.workers, options.remote_dir,
+                       options.python,
+                       not options.no_push and SETUP_SCRIPT or None,
+                       options.timeout)
+    return summary(fleet.run()) and 1 or 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,172 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the shared, persisted HostInfo snapshot.
+
+Building a HostInfo probes the system through subprocesses, and every
+module used to build its own at import time. get_host_info() builds it once
+per process, and persists its values to a small json file so the next
+process (a service restart, setup.py, ...) does not probe again. Other slow
+probes of static host properties (eg the hardware ports used to pick the mac
+test adapter) can be persisted in the same file with probe().
+
+The file is kept in the temporary directory (or where
+$AUTOMATION_HOSTINFO_CACHE says), not in the automation working copy, so
+it never shows up as an unversioned file there. Its name carries a hash of
+the working copy's path, so checkouts side by side do not share it.
+
+The persisted values are only used while they were recorded on the same
+boot of the same system: the cache is keyed by the linux boot id, or by the
+kernel release and version elsewhere, and by the HostInfo module source, so
+a reboot, an OS update or a HostInfo change probes again.
+'''
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import types
+
+import HostInfo
+
+_CHECKOUT = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_FILE = os.environ.get('AUTOMATION_HOSTINFO_CACHE',
+        os.path.join(tempfile.gettempdir(), 'automation-hostinfo-%s.cache'
+                     % hashlib.md5(_CHECKOUT).hexdigest()[:8]))
+
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+
+_LOCK      = threading.RLock()
+_HOST_INFO = None
+_CACHE     = None
+
+def boot_key():
+    """Returns a key which changes whenever the host reboots or its kernel
+    (OS) is updated"""
+    try:
+        fp = open(BOOT_ID_FILE)
+        try:
+            boot_id = fp.read().strip()
+        finally:
+            fp.close()
+    except IOError:
+        boot_id = ''
+    source = getattr(HostInfo, '__file__', '')
+    try:
+        source_mtime = os.path.getmtime(source)
+    except OSError:
+        source_mtime = 0
+    uname = platform.uname()
+    return '%s|%s|%s|%s|%s|%s' %(boot_id, uname[0], uname[2], uname[3],
+                                 sys.platform, source_mtime)
+
+def _serializable(value):
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def _to_str(value):
+    """json gives back unicode strings, HostInfo values are plain strings"""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_to_str(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(_to_str(k), _to_str(v)) for (k, v) in value.items()])
+    return value
+
+def _read():
+    try:
+        fp = open(CACHE_FILE, 'rb')
+        try:
+            cache = _to_str(json.load(fp))
+        finally:
+            fp.close()
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('key') != boot_key():
+        return {}
+    return cache
+
+def _write(cache):
+    # write then rename, so a crash never leaves a half written cache. The
+    # cache is only an optimization, failing to write it is not an error.
+    tmp_path = '%s.%d.tmp' %(CACHE_FILE, os.getpid())
+    try:
+        fp = open(tmp_path, 'wb')
+        try:
+            json.dump(cache, fp)
+        finally:
+            fp.close()
+        if os.name == 'nt' and os.path.exists(CACHE_FILE):
+            # rename does not replace an existing file on windows
+            os.remove(CACHE_FILE)
+        os.rename(tmp_path, CACHE_FILE)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _cache():
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = _read()
+        _CACHE['key'] = boot_key()
+        _CACHE.setdefault('hostinfo', None)
+        _CACHE.setdefault('probes', {})
+    return _CACHE
+
+def get_host_info():
+    """Returns the HostInfo shared by every module of this process, restored
+    from the persisted snapshot if there is a valid one"""
+    global _HOST_INFO
+    with _LOCK:
+        if _HOST_INFO is not None:
+            return _HOST_INFO
+        cache = _cache()
+        if cache['hostinfo'] is not None:
+            cls = HostInfo.HostInfo
+            if isinstance(cls, type):
+                host_info = cls.__new__(cls)
+                host_info.__dict__.update(cache['hostinfo'])
+            else:
+                # an old style class
+                host_info = types.InstanceType(cls, dict(cache['hostinfo']))
+        else:
+            host_info = HostInfo.HostInfo()
+            values = vars(host_info)
+            # a HostInfo holding anything but plain values could not be
+            # restored faithfully, so it is probed again next time
+            if not [v for v in values.values() if not _serializable(v)]:
+                cache['hostinfo'] = dict(values)
+                _write(cache)
+        _HOST_INFO = host_info
+        return _HOST_INFO
+
+def probe(name, function):
+    """Returns the persisted result of a named probe of a static host
+    property, calling function() (once per boot) to get it. The result must
+    be json serializable."""
+    with _LOCK:
+        probes = _cache()['probes']
+        if name not in probes:
+            probes[name] = function()
+            _write(_cache())
+        return probes[name]
+
+def invalidate():
+    """Forget the snapshot, the next get_host_info() probes again"""
+    global _HOST_INFO, _CACHE
+    with _LOCK:
+        _HOST_INFO = None
+        _CACHE = None
+        try:
+            os.remove(CACHE_FILE)
+        except OSError:
+            pass
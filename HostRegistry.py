@@ -0,0 +1,349 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the registry of the automation hosts known to the
+dashboard server (deathstar), behind its hosts file.
+
+Hosts used to register by downloading the whole hosts file over SFTP,
+scanning it, and appending to it (or rewriting it, to unregister), with
+nothing to stop two installs from overwriting each other's changes. The
+registry is instead owned by the service of the machine holding the hosts
+file, which answers the "hosts register"/"hosts unregister" requests of
+ServerConnection with it (the hosts command):
+
+  - the hosts are indexed by address and by name, so a registration is a
+    dictionary update, and registering an address or a name again replaces
+    its old entry (re-imaged machines keep their name, get a new address)
+  - every change is made under a lock and appended to a journal before it
+    is acknowledged, so concurrent registrations are never lost
+  - the hosts file is regenerated from the registry (at most once per
+    flush_interval, however many hosts register at once), and written to a
+    temporary file renamed over the real one, so readers never see a half
+    written file
+
+The registry is seeded from the hosts file the first time. The lines which
+are not plain "address name" entries of a host (comments, blank lines,
+entries with aliases, and the loopback and link-local entries such as
+"::1 localhost6") are kept as they are at the top of the regenerated file.
+
+HostsFile is the parsed form of a hosts file itself, for the places which
+still read and edit one (setup.py, when the service does not support the
+registry, edits it the way the registry would): every line is kept as it is, and the entries (with their aliases,
+v4 or v6) are indexed by address and by name, so lookups and a whole batch
+of additions and removals take one pass over the file at most.
+'''
+import json
+import os
+import threading
+import logging
+
+import NetworkTable
+
+LOGGER = logging.getLogger("automation")
+
+# The loopback and link-local subnets, (family, network, prefix length):
+# their entries name the machine itself, never another host
+LOCAL_SUBNETS = [(NetworkTable.V4, NetworkTable.parse_v4('127.0.0.0'), 8),
+                 (NetworkTable.V4, NetworkTable.parse_v4('169.254.0.0'), 16),
+                 (NetworkTable.V6, NetworkTable.parse_v6('::1'), 128),
+                 (NetworkTable.V6, NetworkTable.parse_v6('fe80::'), 10)]
+
+def is_local(address):
+    """Returns True for a loopback or link-local address"""
+    try:
+        (family, value) = NetworkTable.parse(address)
+    except NetworkTable.AddressError:
+        return False
+    bits = family == NetworkTable.V4 and 32 or 128
+    for (subnet_family, network, length) in LOCAL_SUBNETS:
+        if subnet_family == family and \
+           value >> (bits - length) == network >> (bits - length):
+            return True
+    return False
+
+def parse_line(line):
+    """Returns the (address, [names], comment) of a hosts file line, or None
+    if the line is not a host entry (blank, a comment, or malformed)"""
+    if '#' in line:
+        (line, comment) = line.split('#', 1)
+        comment = comment.strip()
+    else:
+        comment = ''
+    fields = line.split()
+    if len(fields) < 2:
+        return None
+    try:
+        NetworkTable.parse(fields[0])
+    except NetworkTable.AddressError:
+        return None
+    return fields[0], fields[1:], comment
+
+class HostsFile(object):
+    '''
+    A hosts file, parsed once.
+
+        lines - the lines of the file (eg from readlines())
+
+    Every line is kept as it is, so the file can be written back unchanged
+    apart from the entries added or removed. Names are looked up case
+    insensitively, as the resolver does.
+    '''
+
+    def __init__(this, lines=()):
+        this.lines   = []
+        this.by_ip   = {}   # address -> [line indexes]
+        this.by_name = {}   # lower case name -> [line indexes]
+        for line in lines:
+            this.__add_line(line)
+
+    def __len__(this):
+        return len(this.by_ip)
+
+    def entry(this, index):
+        """Returns the (address, [names], comment) of a line"""
+        return parse_line(this.lines[index])
+
+    def lookup_ip(this, ip):
+        """Returns the names registered for an address (first one first)"""
+        names = []
+        for index in this.by_ip.get(ip, []):
+            names.extend(this.entry(index)[1])
+        return names
+
+    def lookup_name(this, name):
+        """Returns the addresses a name (or alias) is registered at"""
+        return [this.entry(index)[0]
+                for index in this.by_name.get(name.lower(), [])]
+
+    def conflicts(this, ip, name=None):
+        """Returns the (address, [names]) entries already registered for an
+        address or a name"""
+        indexes = set(this.by_ip.get(ip, []))
+        if name is not None:
+            indexes.update(this.by_name.get(name.lower(), []))
+        return [this.entry(index)[:2] for index in sorted(indexes)]
+
+    def apply(this, add=(), remove=()):
+        """Add (address, name) entries, and remove the entries of addresses
+        or names, in one pass. An added entry replaces the entries of its
+        address and name. Returns the (address, [names]) entries removed."""
+        doomed = set()
+        for key in remove:
+            doomed.update(this.by_ip.get(key, []))
+            doomed.update(this.by_name.get(key.lower(), []))
+        for (ip, name) in add:
+            doomed.update(this.by_ip.get(ip, []))
+            doomed.update(this.by_name.get(name.lower(), []))
+        removed = [this.entry(index)[:2] for index in sorted(doomed)]
+        lines = [line for (index, line) in enumerate(this.lines)
+                 if index not in doomed]
+        lines.extend(['%s   %s\n' %(ip, name) for (ip, name) in add])
+        this.__init__(lines)
+        return removed
+
+    def diff(this, entries):
+        """Returns the (add, remove) to pass to apply() for the file to hold
+        exactly the given (address, name) entries, leaving alone the entries
+        with aliases or comments, and the loopback and link-local entries
+        (localhost and the likes)"""
+        wanted = dict(entries)
+        current = {}
+        for (ip, indexes) in this.by_ip.items():
+            if is_local(ip):
+                continue
+            for index in indexes:
+                (address, names, comment) = this.entry(index)
+                if len(names) == 1 and not comment:
+                    current[ip] = names[0]
+        add = [(ip, name) for (ip, name) in sorted(wanted.items())
+               if current.get(ip) != name]
+        remove = [ip for ip in sorted(current) if ip not in wanted]
+        return add, remove
+
+    def text(this):
+        return ''.join(this.lines)
+
+    def __add_line(this, line):
+        if not line.endswith('\n'):
+            line += '\n'
+        index = len(this.lines)
+        this.lines.append(line)
+        entry = parse_line(line)
+        if entry is not None:
+            this.by_ip.setdefault(entry[0], []).append(index)
+            for name in entry[1]:
+                this.by_name.setdefault(name.lower(), []).append(index)
+
+def _write_atomic(path, text):
+    # write then rename, so a crash never leaves a half written file
+    tmp_path = path + '.tmp'
+    fp = open(tmp_path, 'wb')
+    try:
+        fp.write(text)
+    finally:
+        fp.close()
+    if os.name == 'nt' and os.path.exists(path):
+        # rename does not replace an existing file on windows
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+class HostRegistry(object):
+    '''
+    The registered hosts, keyed by address and by name.
+
+        path           - the registry store (a json snapshot, and a journal
+                         of the changes made since next to it)
+        hosts_path     - the hosts file regenerated from the registry, if any
+        flush_interval - how long changes are batched before the snapshot
+                         and the hosts file are rewritten
+    '''
+
+    def __init__(this, path, hosts_path=None, flush_interval=1.0):
+        this.path           = path
+        this.journal_path   = path + '.journal'
+        this.hosts_path     = hosts_path
+        this.flush_interval = flush_interval
+        this.lock    = threading.RLock()
+        this.by_ip   = {}
+        this.by_name = {}
+        this.header  = []
+        this.timer   = None
+        this.__load()
+
+    def __len__(this):
+        return len(this.by_ip)
+
+    def lookup(this, ip=None, name=None):
+        """Returns the (address, name) registered for an address or a name,
+        or None"""
+        with this.lock:
+            if ip is not None and ip in this.by_ip:
+                return ip, this.by_ip[ip]
+            if name is not None and name in this.by_name:
+                return this.by_name[name], name
+        return None
+
+    def entries(this):
+        """Returns the registered (address, name) pairs, sorted by name"""
+        with this.lock:
+            return sorted(this.by_ip.items(), key=lambda e: (e[1], e[0]))
+
+    def upsert(this, ip, name):
+        """Register name at address ip, replacing any entry for either of
+        them. Returns the (address, name) entries that were replaced."""
+        with this.lock:
+            if this.by_ip.get(ip) == name:
+                return []
+            replaced = this.__remove(ip, name)
+            this.by_ip[ip] = name
+            this.by_name[name] = ip
+            this.__journal({'op': 'upsert', 'ip': ip, 'name': name})
+            return replaced
+
+    def delete(this, ip=None, name=None):
+        """Unregister the entries of an address and/or a name. Returns the
+        (address, name) entries that were removed."""
+        with this.lock:
+            removed = this.__remove(ip, name)
+            if removed:
+                this.__journal({'op': 'delete', 'ip': ip, 'name': name})
+            return removed
+
+    def render(this):
+        """Returns the text of the hosts file"""
+        with this.lock:
+            lines = list(this.header)
+            lines.extend(['%-15s   %s\n' %(ip, name)
+                          for (ip, name) in this.entries()])
+            return ''.join(lines)
+
+    def flush(this):
+        """Write the snapshot and the hosts file out now"""
+        with this.lock:
+            if this.timer is not None:
+                this.timer.cancel()
+                this.timer = None
+            _write_atomic(this.path, json.dumps(
+                    {'header': this.header, 'hosts': this.entries()}))
+            # everything in the journal is in the snapshot now
+            open(this.journal_path, 'wb').close()
+            if this.hosts_path is not None:
+                _write_atomic(this.hosts_path, this.render())
+
+    def close(this):
+        this.flush()
+
+    def __remove(this, ip, name):
+        removed = []
+        if ip is not None and ip in this.by_ip:
+            removed.append((ip, this.by_ip.pop(ip)))
+            del this.by_name[removed[-1][1]]
+        if name is not None and name in this.by_name:
+            removed.append((this.by_name.pop(name), name))
+            del this.by_ip[removed[-1][0]]
+        return removed
+
+    def __journal(this, record):
+        fp = open(this.journal_path, 'ab')
+        try:
+            fp.write(json.dumps(record) + '\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+        finally:
+            fp.close()
+        if this.timer is None:
+            this.timer = threading.Timer(this.flush_interval, this.flush)
+            this.timer.setDaemon(True)
+            this.timer.start()
+
+    def __load(this):
+        if os.path.exists(this.path):
+            fp = open(this.path, 'rb')
+            try:
+                snapshot = json.load(fp)
+            finally:
+                fp.close()
+            this.header = [str(line) for line in snapshot['header']]
+            for (ip, name) in snapshot['hosts']:
+                this.by_ip[str(ip)] = str(name)
+                this.by_name[str(name)] = str(ip)
+        elif this.hosts_path is not None and os.path.exists(this.hosts_path):
+            this.__seed()
+
+        if os.path.exists(this.journal_path):
+            # replay the changes made after the last snapshot
+            fp = open(this.journal_path, 'rb')
+            try:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a record cut short by a crash, it was never
+                        # acknowledged
+                        LOGGER.warning('Skipping a truncated host registry '
+                                       'journal record')
+                        continue
+                    ip = record['ip'] and str(record['ip'])
+                    name = record['name'] and str(record['name'])
+                    this.__remove(ip, name)
+                    if record['op'] == 'upsert':
+                        this.by_ip[ip] = name
+                        this.by_name[name] = ip
+            finally:
+                fp.close()
+
+    def __seed(this):
+        fp = open(this.hosts_path, 'rb')
+        try:
+            for line in fp:
+                entry = parse_line(line)
+                if entry is None or len(entry[1]) != 1 or entry[2] or \
+                   is_local(entry[0]):
+                    this.header.append(line)
+                else:
+                    (ip, name) = (entry[0], entry[1][0])
+                    this.__remove(ip, name)
+                    this.by_ip[ip] = name
+                    this.by_name[name] = ip
+        finally:
+            fp.close()
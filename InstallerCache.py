@@ -0,0 +1,315 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains a local, content addressed cache of installers.
+Every downloaded installer is stored once under its sha1 digest, and an index
+maps each url onto the digest of its content. Staging an installer for a
+kickstart links (or copies) the cached blob into its staging folder, so
+the same build is only ever downloaded once, no matter how many kickstarts
+or prefetch requests ask for it.
+
+Cached urls are revalidated before use: the ETag and Last-Modified headers
+of the original download are sent back as a conditional request, and the
+cached copy is used if the server says it has not changed. If the url
+carries an expected digest (see below) which matches the cached copy, no
+request is made at all. A server that sent neither header is trusted for
+max_age seconds after the download, and then as long as it reports the
+same Content-Length as the cached copy.
+
+An expected digest may be appended to an installer url as a fragment, eg
+"http://.../anyconnect.msi#md5=0123..." or "#sha1=...", in which case the
+download is verified against it before it is accepted into the cache.
+
+The cache is kept under max_bytes by evicting the least recently used blobs.
+'''
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib2
+import urlparse
+import logging
+
+LOGGER = logging.getLogger("automation")
+
+CHUNK_SIZE = 64 * 1024
+
+class CacheError(Exception): pass
+
+class InstallerCache(object):
+    '''
+    A content addressed store of downloaded installers.
+
+        cache_dir - the directory holding the blobs and the index
+    '''
+
+    INDEX_FILE = 'index.json'
+
+    # Default size limit of the cache, in bytes
+    MAX_BYTES = 20 * 1024 * 1024 * 1024
+
+    # Default time a download without validators is trusted, in seconds
+    MAX_AGE = 60 * 60
+
+    def __init__(this, cache_dir, max_bytes=MAX_BYTES, max_age=MAX_AGE):
+        this.cache_dir  = cache_dir
+        this.blob_dir   = os.path.join(cache_dir, 'blobs')
+        this.index_path = os.path.join(cache_dir, this.INDEX_FILE)
+        this.max_bytes  = max_bytes
+        this.max_age    = max_age
+        this.lock       = threading.Lock()
+        this.url_locks  = {}    # url -> [lock, number of fetches using it]
+        if not os.path.isdir(this.blob_dir):
+            os.makedirs(this.blob_dir)
+        this.index = this.__read_index()
+
+    def blob_path(this, digest):
+        return os.path.join(this.blob_dir, digest)
+
+    def lookup(this, url):
+        """Returns the cached blob for url, or None if it is not cached"""
+        with this.lock:
+            entry = this.index.get(url)
+        if entry is None or not os.path.exists(this.blob_path(entry['digest'])):
+            return None
+        return this.blob_path(entry['digest'])
+
+    def size(this):
+        """Returns the number of bytes used by the cached blobs"""
+        with this.lock:
+            return sum(this.__blob_sizes().values())
+
+    def fetch(this, url, revalidate=True):
+        """Returns the path of the cached blob holding url's content,
+        downloading it first if it is not in the cache yet (or the cached
+        copy turns out to be stale when revalidate is True)"""
+        with this.lock:
+            url_lock = this.url_locks.setdefault(url, [threading.Lock(), 0])
+            url_lock[1] += 1
+        try:
+            # only one thread downloads a given url, the others wait for it
+            with url_lock[0]:
+                return this.__fetch(url, revalidate)
+        finally:
+            with this.lock:
+                url_lock[1] -= 1
+                if not url_lock[1]:
+                    del this.url_locks[url]
+
+    def __fetch(this, url, revalidate):
+        path = this.lookup(url)
+        if path is not None:
+            fresh = True
+            if revalidate:
+                try:
+                    fresh = this.__is_fresh(url)
+                except (urllib2.URLError, IOError), exc:
+                    # the server is unreachable, trust the cached copy
+                    LOGGER.warning("InstallerCache: could not revalidate "
+                                   "%s: %s" %(url, repr(exc)))
+            if fresh:
+                this.__touch(url)
+                return path
+        return this.__download(url)
+
+    def stage(this, url, dest_dir, name=None):
+        """Make url's content available in dest_dir under name (by default
+        the url's file name), and return the staged path"""
+        blob = this.fetch(url)
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        if name is None:
+            name = os.path.basename(urlparse.urlparse(url).path)
+        dest = os.path.join(dest_dir, name)
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(blob, dest)
+        except (AttributeError, OSError):
+            # no hard links on windows (python 2) or across file systems
+            shutil.copyfile(blob, dest)
+        return dest
+
+    def __download(this, url):
+        (base_url, expected) = this.__split_digest(url)
+        tmp_path = os.path.join(this.cache_dir, '.partial-%s-%d' \
+                %(threading.currentThread().getName(), int(time.time()*1000)))
+        sha1 = hashlib.sha1()
+        check = None
+        if expected is not None:
+            check = hashlib.new(expected[0])
+
+        LOGGER.info("InstallerCache: downloading %s" % base_url)
+        size = 0
+        response = urllib2.urlopen(base_url)
+        try:
+            headers = response.info()
+            length = headers.getheader('Content-Length')
+            fp = open(tmp_path, 'wb')
+            try:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    fp.write(chunk)
+                    sha1.update(chunk)
+                    if check is not None:
+                        check.update(chunk)
+                    size += len(chunk)
+            finally:
+                fp.close()
+        finally:
+            response.close()
+
+        try:
+            if length is not None and int(length) != size:
+                raise CacheError('Truncated download of %s: got %d of %s '
+                                 'bytes' %(base_url, size, length))
+            if check is not None and \
+               check.hexdigest().lower() != expected[1].lower():
+                raise CacheError('Checksum mismatch for %s: expected %s %s, '
+                                 'got %s' %(base_url, expected[0], expected[1],
+                                            check.hexdigest()))
+        except CacheError:
+            os.remove(tmp_path)
+            raise
+
+        digest = sha1.hexdigest()
+        blob = this.blob_path(digest)
+        if os.path.exists(blob):
+            # identical content was already cached under another url
+            os.remove(tmp_path)
+        else:
+            os.rename(tmp_path, blob)
+
+        with this.lock:
+            old = this.index.get(url)
+            this.index[url] = {'digest': digest, 'size': size,
+                               'fetched': time.time(), 'used': time.time(),
+                               'etag': headers.getheader('ETag'),
+                               'modified': headers.getheader('Last-Modified'),
+                               'checksum': expected and '='.join(expected)}
+            if old is not None and old['digest'] not in this.__blob_sizes():
+                # the url's content changed, drop the stale copy
+                try:
+                    os.remove(this.blob_path(old['digest']))
+                except OSError:
+                    pass
+            this.__evict(keep=digest)
+            this.__write_index()
+        return blob
+
+    def __is_fresh(this, url):
+        """Revalidate the cached copy of url against the server"""
+        with this.lock:
+            entry = dict(this.index[url])
+        (base_url, expected) = this.__split_digest(url)
+        if expected is not None and \
+           entry.get('checksum') == '='.join(expected):
+            # the content was verified against this very digest
+            return True
+        validated = entry.get('etag') or entry.get('modified')
+        if not validated and \
+           time.time() - entry.get('fetched', 0) < this.max_age:
+            return True
+
+        request = urllib2.Request(base_url)
+        if entry.get('etag'):
+            request.add_header('If-None-Match', entry['etag'])
+        if entry.get('modified'):
+            request.add_header('If-Modified-Since', entry['modified'])
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError, exc:
+            if exc.code == 304:
+                return True
+            raise
+        try:
+            # not every server (or the file: handler) honours conditional
+            # requests, so compare the validators ourselves as well
+            headers = response.info()
+            if entry.get('etag') and \
+               headers.getheader('ETag') == entry['etag']:
+                return True
+            if entry.get('modified') and \
+               headers.getheader('Last-Modified') == entry['modified']:
+                return True
+            if not validated:
+                # nothing better to go on than the size
+                return headers.getheader('Content-Length') == \
+                       str(entry['size'])
+            return False
+        finally:
+            response.close()
+
+    def __touch(this, url):
+        with this.lock:
+            this.index[url]['used'] = time.time()
+            this.__write_index()
+
+    def __blob_sizes(this):
+        sizes = {}
+        for entry in this.index.values():
+            sizes[entry['digest']] = entry['size']
+        return sizes
+
+    def __evict(this, keep=None):
+        """Remove the least recently used blobs until the cache fits in
+        max_bytes. Must be called with the lock held."""
+        sizes = this.__blob_sizes()
+        total = sum(sizes.values())
+        if total <= this.max_bytes:
+            return
+
+        last_used = {}
+        for entry in this.index.values():
+            last_used[entry['digest']] = max(last_used.get(entry['digest'], 0),
+                                             entry.get('used', 0))
+        for (used, digest) in sorted([(u, d) for (d, u) in last_used.items()]):
+            if total <= this.max_bytes:
+                break
+            if digest == keep:
+                continue
+            LOGGER.info("InstallerCache: evicting %s" % digest)
+            for url in [u for (u, e) in this.index.items()
+                        if e['digest'] == digest]:
+                del this.index[url]
+            try:
+                os.remove(this.blob_path(digest))
+            except OSError:
+                pass
+            total -= sizes[digest]
+
+    def __split_digest(this, url):
+        """Splits an optional "#md5=..." or "#sha1=..." fragment off url"""
+        (base_url, fragment) = urlparse.urldefrag(url)
+        if '=' in fragment:
+            (algorithm, value) = fragment.split('=', 1)
+            if algorithm.lower() in ['md5', 'sha1', 'sha256']:
+                return base_url, (algorithm.lower(), value)
+        return base_url, None
+
+    def __read_index(this):
+        try:
+            fp = open(this.index_path, 'rb')
+            try:
+                return json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            return {}
+
+    def __write_index(this):
+        # write then rename, so a crash never leaves a half written index
+        tmp_path = this.index_path + '.tmp'
+        fp = open(tmp_path, 'wb')
+        try:
+            json.dump(this.index, fp)
+        finally:
+            fp.close()
+        if os.name == 'nt' and os.path.exists(this.index_path):
+            # rename does not replace an existing file on windows
+            os.remove(this.index_path)
+        os.rename(tmp_path, this.index_path)
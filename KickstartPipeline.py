@@ -0,0 +1,137 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the staging pipeline that runs in front of a
+Kickstart. All of the installer urls are downloaded concurrently into the
+local InstallerCache (verified, content addressed), while the suite and
+testcase sources are byte compiled in parallel. Once every stage is done the
+Kickstart is started with the installer urls pointing at the staged local
+copies, so the time to stage a new build is bound by its slowest download
+rather than the sum of all of them. The copies are staged in a directory of
+their own (STAGING_DIR), as the Kickstart downloads its urls into the
+installers directory, and would otherwise overwrite the file it reads.
+
+Each stage is timed, and the timings are reported in the runner's state_msg.
+'''
+import compileall
+import os
+import posixpath
+import threading
+import time
+import urllib
+import urlparse
+import logging
+
+LOGGER = logging.getLogger("automation")
+
+# Where the installers are staged, next to (not in) the installers directory
+STAGING_DIR = 'installers.staged'
+
+def split_urls(install_urls):
+    """Returns the urls of a double caret "^^" separated install_urls
+    argument (which may be None)"""
+    if install_urls is None:
+        return []
+    return [u for u in install_urls.split('^^') if u]
+
+def staged_names(urls):
+    """Returns the file names to stage urls under: their own file names,
+    prefixed with their position when several urls share one"""
+    names = [posixpath.basename(urlparse.urlparse(url).path) or 'installer'
+             for url in urls]
+    return [names.count(name) > 1 and '%d-%s' %(i, name) or name
+            for (i, name) in enumerate(names)]
+
+class KickstartPipeline(threading.Thread):
+    '''
+    Stages the installers and suite of a kickstart, then starts it.
+
+        runner       - the service runner
+        args         - the (parsed) kickstart command arguments
+        cache        - the InstallerCache to download through
+        download_dir - where the installers are staged for the Kickstart
+        source_dirs  - directories to byte compile while downloading
+        start        - called with the staged copy of args once all the
+                       stages completed
+        error        - called with the exception if any stage failed
+    '''
+
+    def __init__(this, runner, args, cache, download_dir, source_dirs,
+                 start, error):
+        threading.Thread.__init__(this, name='KickstartPipeline')
+        this.setDaemon(True)
+        this.runner       = runner
+        this.args         = args
+        this.cache        = cache
+        this.download_dir = download_dir
+        this.source_dirs  = source_dirs
+        this.__start      = start
+        this.__error      = error
+        this.timings      = []   # list of (stage, seconds)
+        this.__lock       = threading.Lock()
+        this.__errors     = []
+
+    def urls(this):
+        return split_urls(this.args.get('install_urls'))
+
+    def run(this):
+        start = time.time()
+        urls = this.urls()
+        try:
+            this.runner.DATA['state_msg'] = \
+                    "Kickstart: staging %d installers" % len(urls)
+            staged = [None] * len(urls)
+            names = staged_names(urls)
+            threads = [threading.Thread(target=this.__download,
+                                        args=(i, url, names[i], staged))
+                       for (i, url) in enumerate(urls)]
+            threads.append(threading.Thread(target=this.__preload))
+            for t in threads:
+                t.setDaemon(True)
+                t.start()
+            for t in threads:
+                t.join()
+
+            if this.__errors:
+                raise this.__errors[0]
+
+            args = dict(this.args)
+            if urls:
+                args['install_urls'] = '^^'.join(
+                        ['file:' + urllib.pathname2url(os.path.abspath(path))
+                         for path in staged])
+            this.__time('staging', start)
+            this.runner.DATA['state_msg'] = "Kickstart staged (%s)" \
+                    % this.summary()
+            LOGGER.info("Kickstart pipeline: %s" % this.summary())
+            this.__start(args)
+        except Exception, exc:
+            LOGGER.exception(exc)
+            this.__error(exc)
+
+    def summary(this):
+        """Returns the stage timings as a human readable string"""
+        return ', '.join(['%s %.1fs' % (stage, seconds)
+                          for (stage, seconds) in this.timings])
+
+    def __time(this, stage, start):
+        with this.__lock:
+            this.timings.append((stage, time.time() - start))
+
+    def __download(this, index, url, name, staged):
+        start = time.time()
+        try:
+            staged[index] = this.cache.stage(url, this.download_dir, name)
+            this.__time('download %s' % os.path.basename(staged[index]),
+                        start)
+        except Exception, exc:
+            LOGGER.exception(exc)
+            with this.__lock:
+                this.__errors.append(exc)
+
+    def __preload(this):
+        start = time.time()
+        for path in this.source_dirs:
+            if os.path.isdir(path):
+                compileall.compile_dir(path, quiet=1)
+        this.__time('preload', start)
@@ -0,0 +1,245 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the lazy test suite. Instead of importing every
+testcase module and constructing every testcase object when a suite is
+loaded, a lightweight manifest (name, description, enabled) is built by
+parsing the sources, and testcases are only imported and constructed when
+they are actually inspected. The full suite is only loaded (through the
+runner) when it is about to be run.
+
+The manifest of a suite is made of the TestCase classes defined in the
+testcase modules its source file imports, which the suite source refers to
+by name (eg to construct them), in the order it refers to them. Base classes
+the suite never names are left out. A suite which names none of them builds
+its testcases some other way, and cannot be loaded lazily (its manifest is
+empty). Suite level values (name, productName, ...) are read from simple
+literal assignments in the suite file, anything else is taken from the fully
+loaded suite.
+'''
+import ast
+import os
+import sys
+
+# Suite attributes which can be read from the suite source
+SUITE_FIELDS = ['name', 'productName', 'productCodename', 'productVersion']
+
+def _literal(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+def _base_names(classdef):
+    names = []
+    for base in classdef.bases:
+        if isinstance(base, ast.Name):
+            names.append(base.id)
+        elif isinstance(base, ast.Attribute):
+            names.append(base.attr)
+    return names
+
+def _parse(path):
+    fp = open(path, 'rb')
+    try:
+        return ast.parse(fp.read(), path)
+    finally:
+        fp.close()
+
+def scan_testcases(path, module_name):
+    """Returns a list of TestCaseManifest objects for every TestCase class
+    defined in the module source at path"""
+    entries = []
+    for node in _parse(path).body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        if not [b for b in _base_names(node) if 'TestCase' in b]:
+            continue
+        enabled = True
+        for item in node.body:
+            if isinstance(item, ast.Assign) and \
+               [t for t in item.targets
+                if isinstance(t, ast.Name) and t.id == 'enabled']:
+                enabled = _literal(item.value) is not False
+        entries.append(TestCaseManifest(module_name, node.name,
+                                        ast.get_docstring(node), enabled))
+    return entries
+
+def find_module_file(name, dirs):
+    """Find the source file of a (possibly dotted or path like) module name
+    in dirs or in any of their direct sub directories"""
+    relative = name.replace('.', os.sep).replace('/', os.sep) + '.py'
+    basename = os.path.basename(relative)
+    for directory in dirs:
+        path = os.path.join(directory, relative)
+        if os.path.isfile(path):
+            return path
+        if not os.path.isdir(directory):
+            continue
+        for sub in sorted(os.listdir(directory)):
+            path = os.path.join(directory, sub, basename)
+            if os.path.isfile(path):
+                return path
+    return None
+
+class TestCaseManifest(object):
+    '''The cheap to build, static description of a single testcase'''
+
+    def __init__(this, module_name, class_name, docstring, enabled):
+        this.module_name  = module_name
+        this.class_name   = class_name
+        this.friendlyName = class_name
+        this.enabled      = enabled
+        this.longdesc     = docstring
+        if docstring:
+            this.description = docstring.strip().split('\n')[0]
+        else:
+            this.description = ''
+
+class LazyTestCase(object):
+    '''
+    Stands in for a testcase until something other than its manifest values
+    is needed, at which point the testcase module is imported and the real
+    testcase object is constructed and used from then on.
+    '''
+
+    # Values reported for a testcase that was never materialized
+    DEFAULTS = {'result': 'notrun', 'startTime': 0, 'finishTime': 0,
+                'log': (), 'resultData': ()}
+
+    def __init__(this, manifest):
+        object.__setattr__(this, '_manifest', manifest)
+        object.__setattr__(this, '_testcase', None)
+
+    def materialized(this):
+        return this._testcase is not None
+
+    def materialize(this):
+        """Import and construct the real testcase (only once)"""
+        if this._testcase is None:
+            manifest = this._manifest
+            __import__(manifest.module_name)
+            module = sys.modules[manifest.module_name]
+            testcase = getattr(module, manifest.class_name)()
+            object.__setattr__(this, '_testcase', testcase)
+        return this._testcase
+
+    def __getattr__(this, name):
+        if this._testcase is None:
+            if name in ['friendlyName', 'description', 'enabled']:
+                return getattr(this._manifest, name)
+            if name in this.DEFAULTS:
+                return this.DEFAULTS[name]
+        return getattr(this.materialize(), name)
+
+    def __setattr__(this, name, value):
+        setattr(this.materialize(), name, value)
+
+class LazySuite(object):
+    '''
+    A suite made of LazyTestCase objects, built from the suite's source.
+
+        module - the suite module name, as passed to the load command
+        path   - the suite source file
+        dirs   - the directories holding the testcase modules
+        loader - called (with no arguments) to fully load the suite when
+                 something needs more than the manifest. It must return the
+                 real suite object.
+    '''
+
+    # attributes that belong to the lazy suite itself, any other attribute
+    # that gets set is remembered and passed on to the real suite
+    OWN_ATTRIBUTES = ['module', 'path', 'loader', 'testcases',
+                      '_LazySuite__suite', '_LazySuite__index',
+                      '_LazySuite__fields', '_LazySuite__overrides']
+
+    def __init__(this, module, path, dirs, loader):
+        this.module    = module
+        this.path      = path
+        this.loader    = loader
+        this.testcases = []
+        this.__suite   = None
+        this.__index   = {}
+        this.__fields  = {}
+        this.__overrides = {}
+
+        tree = _parse(path)
+        candidates = {}
+        references = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                references.append((node.lineno, node.col_offset, node.id))
+            elif isinstance(node, ast.Attribute) and \
+                 isinstance(node.ctx, ast.Load):
+                references.append((node.lineno, node.col_offset, node.attr))
+
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and \
+                       target.id in SUITE_FIELDS:
+                        this.__fields[target.id] = _literal(node.value)
+
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names = [node.module] + ['%s.%s' %(node.module, alias.name)
+                                         for alias in node.names]
+            else:
+                continue
+            for name in names:
+                source = find_module_file(name, dirs)
+                if source is None:
+                    continue
+                for entry in scan_testcases(source, name):
+                    candidates.setdefault(entry.friendlyName, entry)
+
+        # only the testcases the suite refers to, in the order it does
+        for (line, column, name) in sorted(references):
+            if name in candidates and name not in this.__index:
+                testcase = LazyTestCase(candidates[name])
+                this.testcases.append(testcase)
+                this.__index[name] = testcase
+
+        if 'name' not in this.__fields:
+            this.__fields['name'] = os.path.splitext(os.path.basename(path))[0]
+
+    def __iter__(this):
+        return iter(this.testcases)
+
+    def __len__(this):
+        return len(this.testcases)
+
+    def findTestCase(this, name):
+        try:
+            return this.__index[name]
+        except KeyError:
+            raise AttributeError('No testcase named "%s" in suite %s' \
+                    %(name, this.__fields['name']))
+
+    def materialized(this):
+        return this.__suite is not None
+
+    def materialize(this):
+        """Fully load the suite through the loader, and return it"""
+        if this.__suite is None:
+            suite = this.loader()
+            for name, value in this.__overrides.items():
+                setattr(suite, name, value)
+            this.__suite = suite
+        return this.__suite
+
+    def __getattr__(this, name):
+        if this.__suite is None:
+            if name in this.__overrides:
+                return this.__overrides[name]
+            if name in this.__fields:
+                return this.__fields[name]
+        return getattr(this.materialize(), name)
+
+    def __setattr__(this, name, value):
+        if name in this.OWN_ATTRIBUTES:
+            object.__setattr__(this, name, value)
+        elif this.__suite is None:
+            this.__overrides[name] = value
+        else:
+            setattr(this.__suite, name, value)
@@ -0,0 +1,277 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the compact storage of testcase logs.
+
+A testcase log is a list of (time, message) entries, kept for every testcase
+of the suite for as long as the suite is loaded, and pickled into every save
+state. A LogStore holds the same entries as an array of float times, an
+array of message offsets and a single buffer of message text, instead of one
+tuple and two objects per entry. Once the buffer passes SPILL_THRESHOLD bytes
+it is moved to a file (in LOG_SPILL_DIR of the configuration, or the
+temporary directory), and further messages are appended to that file in
+batches of WRITE_BATCH bytes, so the memory used by a log stays flat however
+verbose the testcase is. The spill file is only opened for the time of a
+batch write or a read, so a large suite does not hold a file descriptor per
+testcase.
+
+A LogStore reads like the list it replaces: len(), indexing, slicing and
+iteration all give (time, message) tuples, and append()/extend()/+= add to
+it. The other changes (insert(), pop(), del and item assignment) are
+supported too, but rewrite the log, except for clearing it (del log[:]).
+'''
+import array
+import os
+import re
+import tempfile
+import threading
+
+# Message bytes kept in memory before the log is moved to a file
+SPILL_THRESHOLD = 256 * 1024
+
+# Message bytes buffered before they are appended to the spill file
+WRITE_BATCH = 64 * 1024
+
+def _spill_dir():
+    try:
+        import cfg
+        return getattr(cfg, 'LOG_SPILL_DIR', None) or tempfile.gettempdir()
+    except ImportError:
+        return tempfile.gettempdir()
+
+class LogStore(object):
+    '''
+    The (time, message) entries of a testcase log.
+
+        entries - initial entries (eg the list a testcase was created with)
+        name    - used to name the spill file
+    '''
+
+    def __init__(this, entries=(), name='testcase'):
+        this.name = name
+        this.lock = threading.RLock()
+        this.__reset()
+        this.extend(entries)
+
+    def __reset(this):
+        # times stay a float array as long as every time is a float, other
+        # times are kept as they are
+        this.times   = array.array('d')
+        this.offsets = array.array('l')
+        this.unicode = set()    # indexes of the messages that were unicode
+        this.buffer  = []       # message text not yet joined (or written)
+        this.pending = 0        # bytes in buffer, once spilled
+        this.size    = 0        # total message bytes
+        this.data    = ''       # joined in memory message text
+        this.path    = None     # spill file
+
+    def __len__(this):
+        return len(this.offsets)
+
+    def __iter__(this):
+        # read the entries a batch at a time, one read per batch
+        for start in xrange(0, len(this), 1024):
+            for entry in this[start:start + 1024]:
+                yield entry
+
+    def __getitem__(this, index):
+        if isinstance(index, slice):
+            (start, stop, step) = index.indices(len(this))
+            if step == 1:
+                return this.__entries(start, stop)
+            return [this[i] for i in xrange(start, stop, step)]
+        with this.lock:
+            if index < 0:
+                index += len(this)
+            if not 0 <= index < len(this):
+                raise IndexError('log index out of range')
+            return this.__entries(index, index + 1)[0]
+
+    def __entries(this, start, stop):
+        """Returns the entries start to stop, reading their text at once"""
+        with this.lock:
+            if start >= stop:
+                return []
+            base = this.offsets[start]
+            if stop < len(this):
+                end = this.offsets[stop]
+            else:
+                end = this.size
+            text = this.__read(base, end)
+            entries = []
+            for index in xrange(start, stop):
+                if index + 1 < stop:
+                    message = text[this.offsets[index] - base:
+                                   this.offsets[index + 1] - base]
+                else:
+                    message = text[this.offsets[index] - base:]
+                if index in this.unicode:
+                    message = message.decode('utf-8')
+                entries.append((this.times[index], message))
+            return entries
+
+    def __setitem__(this, index, value):
+        with this.lock:
+            entries = this[:]
+            entries[index] = value
+            this.__rewrite(entries)
+
+    def __delitem__(this, index):
+        with this.lock:
+            if isinstance(index, slice) and \
+               index.indices(len(this)) in [(0, len(this), 1), (0, 0, 1)]:
+                this.__clear()
+                return
+            entries = this[:]
+            del entries[index]
+            this.__rewrite(entries)
+
+    def __iadd__(this, entries):
+        this.extend(entries)
+        return this
+
+    def insert(this, index, entry):
+        with this.lock:
+            entries = this[:]
+            entries.insert(index, entry)
+            this.__rewrite(entries)
+
+    def pop(this, index=-1):
+        with this.lock:
+            entries = this[:]
+            entry = entries.pop(index)
+            this.__rewrite(entries)
+            return entry
+
+    def __rewrite(this, entries):
+        this.__clear()
+        this.extend(entries)
+
+    def __clear(this):
+        this.__discard_file()
+        this.__reset()
+
+    def __eq__(this, other):
+        try:
+            return list(this) == list(other)
+        except TypeError:
+            return False
+
+    def __ne__(this, other):
+        return not this == other
+
+    def __repr__(this):
+        return 'LogStore(%r)' % list(this)
+
+    def append(this, entry):
+        (when, message) = entry
+        if isinstance(message, unicode):
+            message = message.encode('utf-8')
+            encoded = True
+        else:
+            message = str(message)
+            encoded = False
+        with this.lock:
+            if type(when) is not float and isinstance(this.times, array.array):
+                this.times = list(this.times)
+            this.times.append(when)
+            if encoded:
+                this.unicode.add(len(this.offsets))
+            this.offsets.append(this.size)
+            this.size += len(message)
+            this.buffer.append(message)
+            if this.path is not None:
+                this.pending += len(message)
+                if this.pending >= WRITE_BATCH:
+                    this.__flush()
+            elif this.size > SPILL_THRESHOLD:
+                this.__spill()
+
+    def extend(this, entries):
+        for entry in entries:
+            this.append(entry)
+
+    def close(this):
+        """Remove the spill file (the log is empty from then on)"""
+        with this.lock:
+            this.__clear()
+
+    def __del__(this):
+        this.__discard_file()
+
+    def __read(this, start, end):
+        if this.path is not None:
+            this.__flush()
+            fp = open(this.path, 'rb')
+            try:
+                fp.seek(start)
+                return fp.read(end - start)
+            finally:
+                fp.close()
+        if this.buffer:
+            this.data += ''.join(this.buffer)
+            this.buffer = []
+        return this.data[start:end]
+
+    def __spill(this):
+        prefix = 'log-%s-' % re.sub(r'[^\w.-]', '_', str(this.name))
+        (fd, path) = tempfile.mkstemp(prefix=prefix, dir=_spill_dir())
+        fp = os.fdopen(fd, 'wb')
+        try:
+            fp.write(this.data)
+            fp.write(''.join(this.buffer))
+        finally:
+            fp.close()
+        this.path = path
+        this.data = ''
+        this.buffer = []
+        this.pending = 0
+
+    def __flush(this):
+        """Append the buffered messages to the spill file"""
+        if not this.buffer:
+            return
+        fp = open(this.path, 'ab')
+        try:
+            fp.write(''.join(this.buffer))
+        finally:
+            fp.close()
+        this.buffer = []
+        this.pending = 0
+
+    def __discard_file(this):
+        if getattr(this, 'path', None) is not None:
+            try:
+                os.remove(this.path)
+            except OSError:
+                pass
+            this.path = None
+
+    def __getstate__(this):
+        # the whole text goes into the pickle, the spill file belongs to this
+        # process only
+        with this.lock:
+            return {'name'   : this.name,
+                    'times'  : this.times,
+                    'offsets': this.offsets.tostring(),
+                    'unicode': sorted(this.unicode),
+                    'text'   : this.__read(0, this.size)}
+
+    def __setstate__(this, state):
+        this.name = state['name']
+        this.lock = threading.RLock()
+        this.__reset()
+        this.times = state['times']
+        this.offsets.fromstring(state['offsets'])
+        this.unicode = set(state['unicode'])
+        this.buffer = [state['text']]
+        this.size = len(state['text'])
+        if this.size > SPILL_THRESHOLD:
+            this.__spill()
+
+def compact(testcase):
+    """Replace the log of a testcase by a LogStore holding the same entries"""
+    log = getattr(testcase, 'log', None)
+    if isinstance(log, list):
+        testcase.log = LogStore(log, getattr(testcase, 'friendlyName',
+                                             'testcase'))
@@ -0,0 +1,204 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains a dependency aware module reloader. It records
+which modules were imported while a test suite was being loaded, and later
+reloads only the ones whose source changed on disk (plus any tracked module
+that depends on them), instead of re-importing the whole suite tree.
+
+Typical usage:
+
+    reloader = ModuleReloader([cfg.BASEDIR])
+    reloader.begin()
+    runner.load(suite)
+    reloader.end()
+    ...
+    names = reloader.reload_changed()
+    reloader.rebind(runner.suite)
+'''
+import hashlib
+import os
+import sys
+import types
+
+# Suffixes of compiled files which map back onto a .py source file
+COMPILED_SUFFIXES = ['.pyc', '.pyo', '$py.class']
+
+def source_file(module):
+    """Returns the .py source file of a module, or None if it has none"""
+    filename = getattr(module, '__file__', None)
+    if not filename:
+        return None
+    for suffix in COMPILED_SUFFIXES:
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)] + '.py'
+            break
+    if not filename.endswith('.py'):
+        return None
+    return os.path.abspath(filename)
+
+def _digest(filename):
+    fp = open(filename, 'rb')
+    try:
+        return hashlib.md5(fp.read()).hexdigest()
+    finally:
+        fp.close()
+
+class ModuleReloader(object):
+    '''
+    Tracks the modules imported between begin() and end() whose source lives
+    under one of the given root directories.
+    '''
+
+    def __init__(this, roots):
+        this.roots   = [os.path.normcase(os.path.abspath(r)) for r in roots]
+        this.files   = {}  # module name -> source file
+        this.stamps  = {}  # module name -> (mtime, md5)
+        this.deps    = {}  # module name -> set of tracked modules it uses
+        this.pending = set()  # modules of a reload that failed, to retry
+        this.__before = None
+
+    def begin(this):
+        """Start recording newly imported modules"""
+        this.__before = set(sys.modules.keys())
+
+    def end(this):
+        """Stop recording, and start tracking every module imported since
+        begin() was called"""
+        if this.__before is None:
+            return
+        for name in set(sys.modules.keys()) - this.__before:
+            this.track(name)
+        this.__before = None
+        this.__update_deps()
+
+    def tracked(this):
+        """Returns a sorted list of the tracked module names"""
+        names = this.files.keys()
+        names.sort()
+        return names
+
+    def changed(this):
+        """Returns the set of tracked modules whose source changed since
+        they were last (re)loaded. The mtime is checked first, and the
+        content hash only when it differs, so an unchanged tree costs one
+        stat() per module. A changed module keeps its old stamp until it
+        is reloaded."""
+        changed = set()
+        for name, filename in this.files.items():
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                continue
+            (old_mtime, old_digest) = this.stamps[name]
+            if mtime == old_mtime:
+                continue
+            digest = _digest(filename)
+            if digest != old_digest:
+                changed.add(name)
+            else:
+                # touched only, no need to hash it again next time
+                this.stamps[name] = (mtime, digest)
+        return changed
+
+    def dependents(this, names):
+        """Returns names plus every tracked module which (transitively)
+        depends on any of them"""
+        result  = set(names)
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            for other, deps in this.deps.items():
+                if name in deps and other not in result:
+                    result.add(other)
+                    pending.append(other)
+        return result
+
+    def reload_changed(this):
+        """Reload the changed modules and their dependents, dependencies
+        first. Returns the list of reloaded module names, in reload order.
+        If a reload fails, the exception is raised, and every module of this
+        reload is reloaded again by the next call."""
+        to_reload = this.dependents(this.changed() | this.pending)
+        order = []
+        visited = set()
+        def visit(name):
+            if name in visited:
+                return
+            visited.add(name)
+            for dep in sorted(this.deps.get(name, ())):
+                if dep in to_reload:
+                    visit(dep)
+            order.append(name)
+        for name in sorted(to_reload):
+            visit(name)
+
+        this.pending = set(order)
+        for name in order:
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            reload(module)
+            # stamp it only once it reloaded
+            this.track(name)
+        this.pending = set()
+        this.__update_deps()
+        return order
+
+    def rebind(this, objects, names=None):
+        """Point each object at the freshly reloaded version of its class,
+        keeping all of its instance state (results, logs, etc). If names is
+        given only objects whose class lives in one of those modules are
+        rebound. Returns the number of objects rebound."""
+        count = 0
+        for obj in objects:
+            cls = obj.__class__
+            if names is not None and cls.__module__ not in names:
+                continue
+            module = sys.modules.get(cls.__module__)
+            new_cls = getattr(module, cls.__name__, None)
+            if new_cls is None or new_cls is cls:
+                continue
+            obj.__class__ = new_cls
+            count += 1
+        return count
+
+    def adopt(this, other):
+        """Track the modules another reloader tracks and this one does not,
+        with the stamps the other one recorded, so a change made since they
+        were stamped still shows up in changed()"""
+        for name, filename in other.files.items():
+            if name not in this.files and name in sys.modules:
+                this.files[name]  = filename
+                this.stamps[name] = other.stamps[name]
+        this.__update_deps()
+
+    def track(this, name):
+        """Start tracking an already imported module, if its source lives
+        under one of the roots"""
+        module = sys.modules.get(name)
+        filename = source_file(module)
+        if filename is None or not os.path.exists(filename):
+            return
+        normalized = os.path.normcase(filename)
+        for root in this.roots:
+            if normalized.startswith(root + os.sep):
+                this.files[name]  = filename
+                this.stamps[name] = (os.path.getmtime(filename),
+                                     _digest(filename))
+                return
+
+    def __update_deps(this):
+        this.deps = {}
+        for name in this.files.keys():
+            module = sys.modules.get(name)
+            deps = set()
+            if module is not None:
+                for value in module.__dict__.values():
+                    if isinstance(value, types.ModuleType):
+                        dep = value.__name__
+                    else:
+                        dep = getattr(value, '__module__', None)
+                    if dep != name and dep in this.files:
+                        deps.add(dep)
+            this.deps[name] = deps
@@ -0,0 +1,218 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the compiled table of the testbed networks.
+
+The NETWORKS classes of the configuration describe each network with
+strings (Destination/Netmask, DestinationV6/NetmaskV6, and a Prefix such as
+'10.1' meant for startswith() checks, which also matches 10.10.x.x). A
+network without a valid Netmask is taken from its Prefix, as whole octets
+(10.1.0.0/16), which testbeds edit rather than the Destination. The
+table parses them once into integer v4 and v6 subnets, and answers "which
+network is this address on" with a longest prefix match (one dictionary
+lookup per distinct prefix length), and "which of these addresses is on
+network X" with a subnet membership check.
+
+The parsers are pure python, so they work the same on every interpreter and
+platform (socket.inet_pton is not available everywhere).
+'''
+import re
+
+V4 = 4
+V6 = 6
+
+class AddressError(ValueError): pass
+
+def parse_v4(text):
+    """Returns the integer value of a dotted quad v4 address"""
+    parts = text.split('.')
+    if len(parts) != 4:
+        raise AddressError('Invalid IPv4 address "%s"' % text)
+    value = 0
+    for part in parts:
+        if not part.isdigit() or int(part) > 255:
+            raise AddressError('Invalid IPv4 address "%s"' % text)
+        value = (value << 8) | int(part)
+    return value
+
+def parse_v6(text):
+    """Returns the integer value of a v6 address, in any of its textual
+    forms (compressed, with an embedded v4 address, with a zone id)"""
+    address = text.split('%', 1)[0]
+    tail = []
+    if '.' in address:
+        # an embedded v4 address makes up the last two groups
+        (address, v4) = address.rsplit(':', 1)
+        v4 = parse_v4(v4)
+        tail = ['%x' % (v4 >> 16), '%x' % (v4 & 0xffff)]
+        if address.endswith(':'):
+            address += ':'
+    if address.count('::') > 1:
+        raise AddressError('Invalid IPv6 address "%s"' % text)
+    if '::' in address:
+        (head, rest) = address.split('::')
+        head = head and head.split(':') or []
+        rest = (rest and rest.split(':') or []) + tail
+        missing = 8 - len(head) - len(rest)
+        if missing < 1:
+            raise AddressError('Invalid IPv6 address "%s"' % text)
+        groups = head + ['0'] * missing + rest
+    else:
+        groups = address.split(':') + tail
+    if len(groups) != 8:
+        raise AddressError('Invalid IPv6 address "%s"' % text)
+    value = 0
+    for group in groups:
+        if not 1 <= len(group) <= 4:
+            raise AddressError('Invalid IPv6 address "%s"' % text)
+        try:
+            value = (value << 16) | int(group, 16)
+        except ValueError:
+            raise AddressError('Invalid IPv6 address "%s"' % text)
+    return value
+
+def parse(text):
+    """Returns (family, value) for a v4 or v6 address"""
+    if ':' in text:
+        return V6, parse_v6(text)
+    return V4, parse_v4(text)
+
+def mask_length(netmask):
+    """Returns the prefix length of a dotted quad netmask, or None if it is
+    not a valid (contiguous) netmask"""
+    try:
+        value = parse_v4(netmask)
+    except AddressError:
+        return None
+    length = bin(value).count('1')
+    if value != (0xffffffff << (32 - length)) & 0xffffffff:
+        return None
+    return length
+
+def _bits(family):
+    return family == V4 and 32 or 128
+
+def _network(family, value, length):
+    bits = _bits(family)
+    return value & (((1 << bits) - 1) ^ ((1 << (bits - length)) - 1))
+
+# the address looking tokens of ifconfig, ip addr and ipconfig output, eg
+# "inet 10.1.2.3", "addr:10.1.2.3", "fe80::1%en0", "10.1.2.3(Preferred)"
+_TOKEN = re.compile(r'[0-9A-Fa-f:.]*[:.][0-9A-Fa-f:.%]*')
+
+def addresses_in(text):
+    """Returns every v4 or v6 address found in a block of command output,
+    in order"""
+    addresses = []
+    for token in _TOKEN.findall(text):
+        token = token.strip(':.')
+        try:
+            parse(token)
+        except AddressError:
+            continue
+        addresses.append(token)
+    return addresses
+
+class NetworkTable(object):
+    '''
+    The subnets of a set of named networks.
+
+        networks - a class holding one nested class per network (such as
+                   config._config.NETWORKS)
+    '''
+
+    def __init__(this, networks=None):
+        this.subnets = {}   # name -> [(family, network, length)]
+        this.index   = {}   # (family, length) -> {network: [names]}
+        if networks is not None:
+            for name in sorted(dir(networks)):
+                if not name.startswith('_'):
+                    this.add_network(name, getattr(networks, name))
+
+    def add_network(this, name, network):
+        """Add the v4 and v6 subnets of a network class"""
+        destination = getattr(network, 'Destination', None)
+        length = mask_length(getattr(network, 'Netmask', ''))
+        if destination and length is not None:
+            this.add(name, destination, length)
+        elif getattr(network, 'Prefix', None):
+            # no usable netmask, the subnet is the prefix itself (the
+            # addresses the configuration matches with startswith())
+            this.add_prefix(name, network.Prefix)
+        destination = getattr(network, 'DestinationV6', None)
+        if destination and str(getattr(network, 'NetmaskV6', '')).isdigit():
+            this.add(name, destination, int(network.NetmaskV6))
+
+    def add_prefix(this, name, prefix):
+        """Add the subnet of a v4 prefix of whole octets, eg '10.1' for
+        10.1.0.0/16"""
+        octets = prefix.strip('.').split('.')
+        if not 1 <= len(octets) <= 4:
+            raise AddressError('Invalid IPv4 prefix "%s"' % prefix)
+        destination = '.'.join(octets + ['0'] * (4 - len(octets)))
+        this.add(name, destination, 8 * len(octets))
+
+    def add(this, name, destination, length):
+        """Add a subnet (address, prefix length) to the named network"""
+        (family, value) = parse(destination)
+        if not 0 <= length <= _bits(family):
+            raise AddressError('Invalid prefix length %d for %s'
+                               %(length, destination))
+        network = _network(family, value, length)
+        this.subnets.setdefault(name, []).append((family, network, length))
+        names = this.index.setdefault((family, length), {}) \
+                          .setdefault(network, [])
+        if name not in names:
+            names.append(name)
+
+    def networks_of(this, address):
+        """Returns the names of the networks the longest matching subnet of
+        address belongs to, or an empty list"""
+        try:
+            (family, value) = parse(address)
+        except AddressError:
+            return []
+        lengths = sorted([l for (f, l) in this.index if f == family],
+                         reverse=True)
+        for length in lengths:
+            names = this.index[(family, length)].get(
+                    _network(family, value, length))
+            if names:
+                return list(names)
+        return []
+
+    def network_of(this, address):
+        """Returns the name of the network address is on, or None"""
+        names = this.networks_of(address)
+        return names and names[0] or None
+
+    def on_network(this, address, name):
+        """Returns True if address is on (any subnet of) the named network"""
+        try:
+            (family, value) = parse(address)
+        except AddressError:
+            return False
+        for (subnet_family, network, length) in this.subnets.get(name, []):
+            if subnet_family == family and \
+               _network(family, value, length) == network:
+                return True
+        return False
+
+    def address_on(this, name, addresses):
+        """Returns the first of addresses (a list, or command output to pick
+        the addresses from) that is on the named network, or None"""
+        if isinstance(addresses, basestring):
+            addresses = addresses_in(addresses)
+        for address in addresses:
+            if this.on_network(address, name):
+                return address
+        return None
+
+_TABLE = None
+def get_table():
+    """Returns the table of the configured networks"""
+    global _TABLE
+    if _TABLE is None:
+        import config
+        _TABLE = NetworkTable(config._config.NETWORKS)
+    return _TABLE
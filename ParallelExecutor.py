@@ -0,0 +1,160 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the opt-in parallel testcase executor. Testcases
+declare the resources they need in a "resources" attribute, eg:
+
+    class MyTest(TestCase):
+        resources = ['adapter:testnet', 'asa:default']
+
+and the executor runs testcases that do not share any resource on a pool of
+worker threads. A testcase that does not declare any resources, or declares
+the EXCLUSIVE resource, is assumed to need the whole host and always runs on
+its own. Testcases are started in the order they were given. A testcase is
+only skipped over while its resources are busy, and nothing is started past
+an exclusive testcase until it got to run.
+
+The executor owns the runner's result counters (runCount, passCount, ...)
+for the testcases it runs, and updates them under a lock as each testcase
+finishes. The runner's activeTestcase is the testcase started last of the
+ones still running. Stopping the executor lets the running testcases finish
+but does not start new ones; the ones that did not run can be resumed later.
+Once the executor is done (or stopped), the full runner state is saved (with
+save, if given), as the runner core does at the end of a run.
+'''
+import threading
+import time
+import logging
+
+from Checkpoint import RESULT_COUNTERS
+
+LOGGER = logging.getLogger("automation")
+
+EXCLUSIVE = 'exclusive'
+
+def resources_of(testcase):
+    """Returns the set of resources a testcase needs"""
+    resources = getattr(testcase, 'resources', None)
+    if not resources:
+        return set([EXCLUSIVE])
+    return set(resources)
+
+class ParallelExecutor(threading.Thread):
+    '''
+    Runs testcases concurrently on a pool of worker threads.
+
+        runner     - the service runner
+        testcases  - the testcases to run, in order
+        workers    - the maximum number of testcases to run at once
+        run        - called with a testcase to execute it. It should not
+                     touch the runner's counters.
+        done_state - the runner state to go to once every testcase ran
+        finished   - optionally called with each testcase once it finished
+        save       - optionally called to save the full runner state, instead
+                     of the runner's saveState()
+    '''
+
+    def __init__(this, runner, testcases, workers, run, done_state,
+                 finished=None, save=None):
+        threading.Thread.__init__(this, name='ParallelExecutor')
+        this.setDaemon(True)
+        this.runner     = runner
+        this.pending    = list(testcases)
+        this.workers    = max(1, int(workers))
+        this.run_one    = run
+        this.done_state = done_state
+        this.finished   = finished
+        this.save       = save or runner.saveState
+        this.running    = {}  # testcase -> set of resources held
+        this.active     = []  # the running testcases, in start order
+        this.stopped    = False
+        this.cond       = threading.Condition()
+
+    def stop(this):
+        """Let the running testcases finish, but do not start any others"""
+        with this.cond:
+            this.stopped = True
+            this.cond.notifyAll()
+
+    def remaining(this):
+        """Returns the testcases that have not been started"""
+        with this.cond:
+            return list(this.pending)
+
+    def run(this):
+        threads = [threading.Thread(target=this.__work,
+                                    name='ParallelExecutor-%d' % i)
+                   for i in range(this.workers)]
+        for t in threads:
+            t.setDaemon(True)
+            t.start()
+        for t in threads:
+            t.join()
+
+        this.runner.DATA['activeTestcase'] = None
+        if this.stopped:
+            this.runner.setState(this.runner.STATE_SUITE_STOPPED)
+        else:
+            this.runner.DATA['finishTime'] = time.time()
+            this.runner.setState(this.done_state)
+        try:
+            this.save()
+        except Exception, exc:
+            LOGGER.exception(exc)
+
+    def __next(this):
+        """Returns the next testcase whose resources are free (holding its
+        resources), or None once there is nothing left to run"""
+        with this.cond:
+            while True:
+                if this.stopped or not this.pending:
+                    return None
+                busy = set()
+                for resources in this.running.values():
+                    busy |= resources
+                for testcase in this.pending:
+                    needed = resources_of(testcase)
+                    if this.running and EXCLUSIVE in needed:
+                        # wait for the host to drain, rather than letting
+                        # later testcases starve this one
+                        break
+                    if this.running and (EXCLUSIVE in busy or needed & busy):
+                        continue
+                    this.pending.remove(testcase)
+                    this.running[testcase] = needed
+                    this.active.append(testcase)
+                    this.runner.DATA['activeTestcase'] = testcase
+                    return testcase
+                this.cond.wait()
+
+    def __work(this):
+        while True:
+            testcase = this.__next()
+            if testcase is None:
+                return
+            previous = getattr(testcase, 'result', None)
+            try:
+                this.run_one(testcase)
+            except Exception, exc:
+                LOGGER.exception(exc)
+                testcase.result = 'error'
+            with this.cond:
+                this.__count(previous, -1)
+                this.__count(testcase.result, 1)
+                del this.running[testcase]
+                this.active.remove(testcase)
+                this.runner.DATA['activeTestcase'] = \
+                        this.active and this.active[-1] or None
+                this.cond.notifyAll()
+            if this.finished is not None:
+                try:
+                    this.finished(testcase)
+                except Exception, exc:
+                    LOGGER.exception(exc)
+
+    def __count(this, result, delta):
+        counter = RESULT_COUNTERS.get(str(result).lower())
+        if counter is None:
+            return
+        this.runner.DATA[counter]   += delta
+        this.runner.DATA['runCount'] += delta
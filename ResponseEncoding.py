@@ -0,0 +1,77 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the negotiated encodings of command responses.
+
+Responses are XML by default. A client that prefers a more compact encoding
+lists the encodings it accepts, in order of preference, in the "accept"
+argument of a request (eg "msgpack,json"), and the response is encoded in
+the first of them this side supports. Which encodings a peer supports can
+be asked for with the "protocol" request.
+
+A response that is not XML starts with a marker line naming its encoding
+("#json\\n", "#msgpack\\n"), which can never start an XML document, so a
+client can always tell how to decode a reply, and peers that know nothing
+about the negotiation keep exchanging plain XML.
+
+msgpack is optional, it is only offered when the msgpack module is
+installed.
+'''
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+XML     = 'xml'
+JSON    = 'json'
+MSGPACK = 'msgpack'
+
+class EncodingError(Exception): pass
+
+def supported():
+    """Returns the encodings this side supports, most compact first"""
+    encodings = []
+    if msgpack is not None:
+        encodings.append(MSGPACK)
+    encodings.extend([JSON, XML])
+    return encodings
+
+def negotiate(accept):
+    """Returns the first encoding of accept (a comma separated list, or a
+    list) that is supported here, or XML"""
+    if not accept:
+        return XML
+    if isinstance(accept, basestring):
+        accept = accept.split(',')
+    available = supported()
+    for encoding in accept:
+        encoding = encoding.strip().lower()
+        if encoding in available:
+            return encoding
+    return XML
+
+def encode(data, encoding):
+    """Encode a structured (json compatible) response"""
+    if encoding == JSON:
+        return '#%s\n%s' %(JSON, json.dumps(data, separators=(',', ':')))
+    if encoding == MSGPACK and msgpack is not None:
+        return '#%s\n%s' %(MSGPACK, msgpack.packb(data))
+    raise EncodingError('Cannot encode a response as %s' % encoding)
+
+def decode(payload):
+    """Returns (encoding, data) for a response. The data of an XML (or any
+    other response without an exact known marker) is the text as it is."""
+    for encoding in [JSON, MSGPACK]:
+        marker = '#%s\n' % encoding
+        if not payload.startswith(marker):
+            continue
+        body = payload[len(marker):]
+        if encoding == JSON:
+            return JSON, json.loads(body)
+        if msgpack is None:
+            raise EncodingError('Cannot decode a msgpack response, the '
+                                'msgpack module is not installed')
+        return MSGPACK, msgpack.unpackb(body)
+    return XML, payload
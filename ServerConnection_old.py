@@ -12,7 +12,10 @@ import time
 import xml.etree.ElementTree as ET
 
 from AutomationService.ServiceRunnerResponseMsg import ResponseMsg
-import HostInfo
+import Compression
+import HostInfoCache
+import ResponseEncoding
+import SnapshotJobs
 import sys
 sys.path.append("E:\\automation")
 import config
@@ -20,7 +23,7 @@ import subprocess
 import logging
 LOGGER = logging.getLogger("automation")
 
-HOST_INFO = HostInfo.HostInfo()
+HOST_INFO = HostInfoCache.get_host_info()
 
 class ResponseError(Exception): pass
 
@@ -33,6 +36,16 @@ class ServerConnection():
     def __init__(this):
         this.PORT        = 9876
         this.host        = '10.76.157.238'
+        # the compact response encodings the server accepts, None until
+        # negotiated (or if the server only speaks XML)
+        this.accept      = None
+        # the compressions the server can apply to large replies, None until
+        # negotiated (or if the server never compresses)
+        this.compress    = None
+        # whether the server was asked for the above yet
+        this.negotiated  = False
+        # the snapshot jobs submitted through this connection
+        this.jobs        = None
 
     def __get(this,sock,length):
         """Gets length number of bytes off the socket"""
@@ -41,7 +54,23 @@ class ServerConnection():
             buf += sock.recv(length-len(buf))
         return buf
 
-    def __request(this,command):
+    def __request(this,command,structured=False,large=False):
+        # the first request that can use a compact encoding or compression
+        # asks the server which ones it supports
+        if (structured or large) and not this.negotiated:
+            this.negotiate_encoding()
+        # ask for a compact encoding of requests which have a structured
+        # reply, if the server said it can do one
+        encoded = structured and this.accept
+        if encoded:
+            command = '%s %s' %(command,
+                                this.__to_argument_string('accept', this.accept))
+        # and for the compression of requests which may have a large reply
+        compressed = (structured or large) and this.compress
+        if compressed:
+            command = '%s %s' %(command,
+                                this.__to_argument_string('compress',
+                                                          this.compress))
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # We don't really want a timeout. However, if something goes
         # wrong the socket shouldn't block forever. The next best
@@ -52,6 +81,7 @@ class ServerConnection():
         # goes wrong on the socket. If the socket transaction is successful a
         # new message object will be created with the "real" data
         msg = ResponseMsg('ecn',command)
+        msg.encoding = ResponseEncoding.XML
 
         try:
             ip = socket.gethostbyname(this.host)
@@ -62,8 +92,16 @@ class ServerConnection():
             code   = this.__get(sock,3)
             msglen = struct.unpack("!i", this.__get(sock,4))[0]
             data   = this.__get(sock,msglen)
+            # anything else than what was asked for is a plain reply, even
+            # if it starts with a '#'
+            if compressed:
+                data = Compression.decompress(data)
+            encoding = ResponseEncoding.XML
+            if encoded:
+                (encoding, data) = ResponseEncoding.decode(data)
             # create the real response message object.
             msg = ResponseMsg(code,command,data)
+            msg.encoding = encoding
 
         # Windows raises socket.gaierror exceptiosn
         except socket.error, exc:
@@ -169,6 +207,43 @@ class ServerConnection():
 
     def setServerAddress(this, value):
         this.host = value
+        this.accept = None
+        this.compress = None
+
+    def negotiate_encoding(this):
+        '''
+        Asks the server which response encodings and compressions it
+        supports, and uses the most compact encoding both sides know for
+        structured replies, and the fastest compression both sides know for
+        large replies, from then on. Servers which do not know the request
+        keep getting plain uncompressed XML.
+        This is done by the first structured or large request of the
+        connection, if it was not called before.
+        Returns the encoding in use.
+        '''
+        response = this.__request('protocol')
+        this.accept = None
+        this.compress = None
+        # ask again next time if the server could not be reached at all
+        this.negotiated = response.code != 'ecn'
+        if response.code == 'ack':
+            try:
+                root = ET.fromstring(response.data)
+                offered = root.findtext('encodings').split(',')
+                compressions = (root.findtext('compressions') or '').split(',')
+            except Exception, exc:
+                LOGGER.debug('Unexpected protocol response: %s' % repr(exc))
+                offered = []
+                compressions = []
+            accept = [e for e in ResponseEncoding.supported()
+                      if e in offered and e != ResponseEncoding.XML]
+            if accept:
+                this.accept = ','.join(accept)
+            compress = [c for c in Compression.supported()
+                        if c in compressions]
+            if compress:
+                this.compress = ','.join(compress)
+        return ResponseEncoding.negotiate(this.accept)
 
     def get_hostscan_version_request(this, asa_obj):
         '''
@@ -269,9 +344,15 @@ class ServerConnection():
             capability    - The resource's capability. "vpn", "nam", etc.
         '''
         response = this.__request(('get_testbed_resources %s %s %s' %
-                            (HOST_INFO.nodename, resource_type, capability)))
+                            (HOST_INFO.nodename, resource_type, capability)),
+                            structured=True)
         if response.code != 'ack':
             return response
+        if response.encoding != ResponseEncoding.XML:
+            try:
+                return list(response.data['resources'])
+            except (TypeError, KeyError), exc:
+                raise ResponseError('Unexpected response data: %s' % repr(exc))
 
         # Verify the integrity of the response first.
         try:
@@ -304,6 +385,29 @@ class ServerConnection():
                     (this.__to_argument_string('host',HOST_INFO.nodename))
         LOGGER.debug("adding to resourcepool request %s" %request)
         return this.__request(request)
+    def register_machine_request(this, ip, host_name=None):
+        '''
+        Registers this machine (name and address) in the dashboard server's
+        hosts registry, replacing any entry for the same name or address.
+        '''
+        if host_name is None:
+            host_name = socket.gethostname()
+        request = ('hosts register %s %s') %\
+                    (this.__to_argument_string('ip', ip),
+                     this.__to_argument_string('name', host_name))
+        LOGGER.debug("register machine request %s" %request)
+        return this.__request(request)
+
+    def unregister_machine_request(this, ip):
+        '''
+        Removes the entry of this machine's address from the dashboard
+        server's hosts registry.
+        '''
+        request = ('hosts unregister %s') %\
+                    (this.__to_argument_string('ip', ip))
+        LOGGER.debug("unregister machine request %s" %request)
+        return this.__request(request)
+
     def getIp(this):
         if HOST_INFO.isWindows():
 
@@ -363,16 +467,20 @@ class ServerConnection():
 
         return this.__request(request)
 
-    def vm_revert_snapshot_request(this, snapshot_name, snapshot_id):
+    def vm_revert_snapshot_request(this, snapshot_name, snapshot_id=None,
+                                   host=None):
         '''
         This method serves as an interface through which you can make
-        a call to revert a snapshot on a VM
+        a call to revert a snapshot on a VM (this one, unless another host
+        is given). Without a snapshot_id, the snapshot is looked up by name.
         '''
         # build the request string
-        request = ('vm revert_to_snapshot %s %s %s') %\
-                  (this.__to_argument_string('host', HOST_INFO.nodename),\
-                   this.__to_argument_string('snapshot_name', snapshot_name),\
-                   this.__to_argument_string('snapshot_id', snapshot_id))
+        request = ('vm revert_to_snapshot %s %s') %\
+                  (this.__to_argument_string('host', host or HOST_INFO.nodename),\
+                   this.__to_argument_string('snapshot_name', snapshot_name))
+        if snapshot_id is not None:
+            request += ' ' + this.__to_argument_string('snapshot_id',
+                                                       snapshot_id)
 
 
         return this.__request(request)
@@ -389,17 +497,19 @@ class ServerConnection():
 
         return this.__request(request)
 
-    def vm_create_snapshot_request(this, snapshot_name, power_cycle_vm=True):
+    def vm_create_snapshot_request(this, snapshot_name, power_cycle_vm=True,
+                                   host=None):
         '''
         This method serves as an interface through which you can make
-        a call to the method to create a snapshot on this VM.  It defaults
+        a call to the method to create a snapshot on this VM (or another
+        host).  It defaults
         to shutting down the VM and taking the snapshot then turning the machine
         back on afterwards.  If you pass power_cycle_vm as False, it will take
         a snapshot of the machine while it is still powered on.
         '''
         # build the request string
         request = ('vm create_snapshot %s %s %s') %\
-                  (this.__to_argument_string('host', HOST_INFO.nodename),\
+                  (this.__to_argument_string('host', host or HOST_INFO.nodename),\
                    this.__to_argument_string('snapshot_name', snapshot_name),\
                    this.__to_argument_string('power_cycle_vm', str(power_cycle_vm)))
 
@@ -414,15 +524,17 @@ class ServerConnection():
         request = ('vm list_snapshots %s') %\
                    (this.__to_argument_string('host', HOST_INFO.nodename))
 
-        return this.__request(request)
+        # a VM with a long snapshot history has a large list
+        return this.__request(request, large=True)
 
-    def vm_snapshot_remove_request(this, snapshot_name, snapshot_id):
+    def vm_snapshot_remove_request(this, snapshot_name, snapshot_id, host=None):
         '''
         This method serves as an interface through which you can make
-        a call to the method to remove snapshots.
+        a call to the method to remove snapshots (of this VM, unless another
+        host is given).
         '''
         request = ('vm remove_snapshot %s %s %s') %\
-                  (this.__to_argument_string('host', HOST_INFO.nodename),\
+                  (this.__to_argument_string('host', host or HOST_INFO.nodename),\
                    this.__to_argument_string('snapshot_name', snapshot_name),\
                    this.__to_argument_string('snapshot_id', snapshot_id))
 
@@ -445,6 +557,64 @@ class ServerConnection():
 
         return this.__request(request)
 
+    # the snapshot requests which can be submitted as jobs
+    SNAPSHOT_OPERATIONS = {'revert' : 'vm_revert_snapshot_request',
+                           'create' : 'vm_create_snapshot_request',
+                           'remove' : 'vm_snapshot_remove_request'}
+
+    def submit_snapshot_job(this, operation, host, *args):
+        '''
+        Submits a snapshot operation ('revert', 'create' or 'remove', with
+        the arguments of its request) on a host as a job, and returns the
+        job id straight away. The request runs in the background (several
+        jobs run side by side), use snapshot_job_status or
+        wait_for_snapshot_jobs to follow it.
+        '''
+        if this.jobs is None:
+            this.jobs = SnapshotJobs.JobTracker()
+        request = getattr(this, this.SNAPSHOT_OPERATIONS[operation])
+        def run():
+            response = request(*args, **{'host': host})
+            if response.code != 'ack':
+                raise ResponseError('%s of %s failed: %s'
+                                    %(operation, host, response.error))
+            return response.data
+        return this.jobs.submit(operation, host, run)
+
+    def revert_testbed_request(this, hosts, snapshot_name, snapshot_id=None):
+        '''
+        Reverts every host of a list (eg a testbed) to a snapshot, all at the
+        same time (by snapshot_id if given, by name otherwise). Returns the
+        job ids, in the order of the hosts. The jobs are tracked by this
+        connection, in this process only.
+        '''
+        return [this.submit_snapshot_job('revert', host, snapshot_name,
+                                         snapshot_id)
+                for host in hosts]
+
+    def snapshot_job_status(this, job_id):
+        '''
+        Returns the state of a snapshot job (a dictionary with its id, kind,
+        target, state, error and times), raises SnapshotJobs.JobError for an
+        unknown job.
+        '''
+        if this.jobs is None:
+            raise SnapshotJobs.JobError('No job %s' % job_id)
+        job = this.jobs.get(job_id)
+        status = job.as_dict()
+        status['data'] = job.result
+        return status
+
+    def wait_for_snapshot_jobs(this, job_ids, timeout=None):
+        '''
+        Waits for snapshot jobs to finish, and returns their states (as
+        snapshot_job_status does). Jobs still running when timeout seconds
+        have passed are returned in their current state.
+        '''
+        if this.jobs is not None:
+            this.jobs.wait(job_ids, timeout)
+        return [this.snapshot_job_status(job_id) for job_id in job_ids]
+
     def save_state_exists_query(this, file_name):
         '''
         This method asks the dashboard service on the server if there is
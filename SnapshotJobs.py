@@ -0,0 +1,209 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the tracking of asynchronous (snapshot) jobs.
+
+Snapshot operations take minutes, so rather than blocking whoever asked for
+one, an operation is submitted as a job: it gets an id straight away, runs
+on a bounded pool of worker threads, and its state (queued, running, done or
+failed, with the error or result, and when each state was entered) can be
+polled with that id, or waited for. Operations on many VMs (eg reverting a
+whole testbed) are submitted together and run side by side.
+
+A job can also be created without being started, and started later, eg by a
+command once its response has been sent. A job that is still not started
+expire_after seconds after it was created (its command never got to start
+it) fails, so whoever polls it is not left waiting forever.
+
+Jobs only live as long as the process which tracks them: they are not
+persisted, and an id is unknown to any other (or restarted) process. In
+particular reverting the machine the service runs on restarts the service,
+and the revert job with it.
+'''
+import itertools
+import Queue
+import threading
+import time
+import logging
+
+LOGGER = logging.getLogger("automation")
+
+QUEUED  = 'queued'
+RUNNING = 'running'
+DONE    = 'done'
+FAILED  = 'failed'
+
+class JobError(Exception): pass
+
+class Job(object):
+    '''
+    One operation.
+
+        kind     - what the job does (eg "revert")
+        target   - what it does it to (eg a host name)
+        function - called with args to do it, its return value is the job's
+                   result, and an exception it raises fails the job
+    '''
+
+    def __init__(this, id, kind, target, function, args):
+        this.id        = id
+        this.kind      = kind
+        this.target    = target
+        this.function  = function
+        this.args      = args
+        this.state     = QUEUED
+        this.result    = None
+        this.error     = None
+        this.submitted = time.time()
+        this.queued    = None
+        this.started   = None
+        this.finished  = None
+
+    def is_finished(this):
+        return this.state in [DONE, FAILED]
+
+    def as_dict(this):
+        return {'id'        : this.id,
+                'kind'      : this.kind,
+                'target'    : this.target,
+                'state'     : this.state,
+                'error'     : this.error,
+                'submitted' : int(this.submitted),
+                'started'   : this.started and int(this.started),
+                'finished'  : this.finished and int(this.finished)}
+
+class JobTracker(object):
+    '''
+    Runs jobs on up to workers threads, and keeps the last keep finished
+    jobs around for their state to be asked for. Jobs created and not
+    started within expire_after seconds fail.
+    '''
+
+    def __init__(this, workers=8, keep=100, expire_after=600):
+        this.workers   = workers
+        this.keep      = keep
+        this.expire_after = expire_after
+        this.jobs      = {}
+        this.order     = []
+        this.queue     = Queue.Queue()
+        this.threads   = 0
+        this.idle      = 0
+        this.ids       = itertools.count(1)
+        this.condition = threading.Condition()
+
+    def create(this, kind, target, function, *args):
+        """Create a job, without starting it. Returns the job."""
+        with this.condition:
+            job = Job('%d-%d' %(int(time.time()), this.ids.next()), kind,
+                      target, function, args)
+            this.jobs[job.id] = job
+            this.order.append(job.id)
+            this.__expire()
+            this.__prune()
+        return job
+
+    def start(this, job_id):
+        """Start (queue for a worker) a job created earlier"""
+        with this.condition:
+            job = this.get(job_id)
+            if job.queued is not None:
+                raise JobError('Job %s was already started' % job_id)
+            if job.is_finished():
+                raise JobError('Job %s expired before it was started: %s'
+                               %(job_id, job.error))
+            job.queued = time.time()
+            this.queue.put(job)
+            # one more worker, unless enough of them are waiting for a job
+            if this.queue.qsize() > this.idle and this.threads < this.workers:
+                this.threads += 1
+                thread = threading.Thread(target=this.__worker)
+                thread.setDaemon(True)
+                thread.start()
+            return job
+
+    def submit(this, kind, target, function, *args):
+        """Create and start a job. Returns its id."""
+        job = this.create(kind, target, function, *args)
+        this.start(job.id)
+        return job.id
+
+    def get(this, job_id):
+        """Returns a job, raises JobError if there is no such job"""
+        with this.condition:
+            this.__expire()
+            try:
+                return this.jobs[job_id]
+            except KeyError:
+                raise JobError('No job %s' % job_id)
+
+    def list(this):
+        """Returns every known job, oldest first"""
+        with this.condition:
+            this.__expire()
+            return [this.jobs[job_id] for job_id in this.order]
+
+    def wait(this, job_ids, timeout=None):
+        """Wait for jobs to finish. Returns True if they all did, False if
+        timeout seconds passed first."""
+        deadline = timeout is not None and time.time() + timeout or None
+        with this.condition:
+            # a job that is no longer known finished long ago
+            this.__expire()
+            while not all([this.jobs[i].is_finished() for i in job_ids
+                           if i in this.jobs]):
+                if deadline is None:
+                    this.condition.wait(60)
+                    this.__expire()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                this.condition.wait(remaining)
+                this.__expire()
+            return True
+
+    def __worker(this):
+        while True:
+            with this.condition:
+                this.idle += 1
+            try:
+                job = this.queue.get()
+            finally:
+                with this.condition:
+                    this.idle -= 1
+            with this.condition:
+                job.state = RUNNING
+                job.started = time.time()
+            try:
+                result = job.function(*job.args)
+                (state, error) = (DONE, None)
+            except Exception, exc:
+                LOGGER.exception(exc)
+                (result, state, error) = (None, FAILED, str(exc))
+            with this.condition:
+                (job.result, job.state, job.error) = (result, state, error)
+                job.finished = time.time()
+                this.condition.notifyAll()
+
+    def __expire(this):
+        # fail the jobs which were never started
+        now = time.time()
+        for job_id in this.order:
+            job = this.jobs[job_id]
+            if job.queued is None and job.state == QUEUED and \
+               now - job.submitted > this.expire_after:
+                job.state = FAILED
+                job.error = 'Not started within %ds' % this.expire_after
+                job.finished = now
+                this.condition.notifyAll()
+
+    def __prune(this):
+        # forget the oldest finished jobs, never unfinished ones
+        excess = len(this.order) - this.keep
+        for job_id in list(this.order):
+            if excess <= 0:
+                break
+            if this.jobs[job_id].is_finished():
+                this.order.remove(job_id)
+                del this.jobs[job_id]
+                excess -= 1
@@ -0,0 +1,59 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains hash indexes over a loaded suite, so testcases can
+be looked up by name, and result files by file name, in constant time rather
+than by scanning the suite (or a testcase's resultData) on every request.
+
+The testcase index is built once per loaded suite. The result file index of
+a testcase is updated incrementally as result data gets attached, which
+relies on resultData only ever being appended to (a replaced or shrunk
+resultData list is detected and re-indexed from scratch).
+'''
+
+class SuiteIndex(object):
+    '''
+    Indexes the testcases of suite by friendly name and by full name
+    (module.Class).
+    '''
+
+    def __init__(this, suite):
+        this.suite   = suite
+        this.names   = {}
+        this.results = {}   # id(testcase) -> [resultData, length, index]
+        for testcase in suite:
+            manifest = getattr(testcase, '_manifest', None)
+            if manifest is not None:
+                # a lazy testcase, don't import it just to index it
+                full_name = '%s.%s' %(manifest.module_name,
+                                      manifest.class_name)
+            else:
+                full_name = '%s.%s' %(testcase.__class__.__module__,
+                                      testcase.__class__.__name__)
+            this.names.setdefault(full_name, testcase)
+            this.names.setdefault(testcase.friendlyName, testcase)
+
+    def find(this, name):
+        """Returns the testcase with the given friendly or full name. Falls
+        back on the suite's own lookup (which raises AttributeError if there
+        is no such testcase) for any other name it understands."""
+        testcase = this.names.get(name)
+        if testcase is None:
+            testcase = this.suite.findTestCase(name)
+            this.names[name] = testcase
+        return testcase
+
+    def result_file(this, testcase, filename):
+        """Returns the path of the result file of testcase named filename,
+        or None if the testcase has no such result file"""
+        data = testcase.resultData
+        entry = this.results.get(id(testcase))
+        if entry is None or entry[0] is not data or entry[1] > len(data):
+            entry = [data, 0, {}]
+            this.results[id(testcase)] = entry
+        if entry[1] != len(data):
+            # index only the result data attached since the last lookup
+            for pair in data[entry[1]:]:
+                entry[2].setdefault(pair[1], pair[0])
+            entry[1] = len(data)
+        return entry[2].get(filename)
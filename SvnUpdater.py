@@ -0,0 +1,194 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the engine used to update the local copy of the
+automation code from SVN. The same engine drives both the pysvn bindings and
+the svn command line client, so callers do not need to care which one is
+available on the host.
+
+The engine only runs "svn cleanup" when the working copy actually needs it,
+reports every path touched by an update, and can map those paths back onto the
+python modules currently imported by the service. That lets the caller decide
+whether a restart is really required, and lets the dashboard ask "what would
+change" (dry run) before rolling an update out across the fleet.
+'''
+import os
+import re
+import subprocess
+import sys
+
+# Suffixes of compiled files which map back onto a .py source file
+COMPILED_SUFFIXES = ['.pyc', '.pyo', '$py.class']
+
+class SvnUpdateError(Exception): pass
+
+#http://pysvn.tigris.org/docs/pysvn_prog_ref.html#pysvn_client_callback_ssl_server_trust_prompt
+def _ssl_server_trust_prompt(trust_dict):
+    return True, 1, True
+
+def _svn_credentials(realm, username, may_save):
+    return True, "<user name>", "<password>", False
+
+class SvnUpdater(object):
+    '''
+    Updates a working copy and reports what changed.
+
+        path      - the root of the working copy to update
+        use_pysvn - use the pysvn bindings if they can be imported. If False,
+                    or pysvn is missing, the svn command line client is used.
+    '''
+
+    def __init__(this, path, use_pysvn=True):
+        this.path   = os.path.abspath(path)
+        this.pysvn  = None
+        this.client = None
+        if use_pysvn:
+            try:
+                import pysvn
+                this.pysvn  = pysvn
+                this.client = pysvn.Client()
+                # Assigning callback asked by pysvn.
+                this.client.callback_ssl_server_trust_prompt = \
+                        _ssl_server_trust_prompt
+                this.client.callback_get_login = _svn_credentials
+            except ImportError:
+                this.pysvn  = None
+                this.client = None
+
+    def needs_cleanup(this):
+        """Returns True if the working copy is locked or left in an
+        inconsistent state by an interrupted operation."""
+        if this.client is not None:
+            try:
+                for entry in this.client.status(this.path):
+                    if entry.is_locked:
+                        return True
+            except this.pysvn.ClientError:
+                return True
+            return False
+
+        p = subprocess.Popen(['svn', 'status', this.path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = p.communicate()
+        if p.returncode != 0 or 'svn cleanup' in err:
+            return True
+        # The third column of "svn status" is 'L' for locked directories
+        for line in out.splitlines():
+            if len(line) > 2 and line[2] == 'L':
+                return True
+        return False
+
+    def cleanup(this):
+        """Run an svn cleanup on the working copy."""
+        if this.client is not None:
+            this.client.cleanup(this.path)
+        else:
+            subprocess.check_output(['svn', 'cleanup', this.path])
+
+    def update(this, revision=None):
+        """Update the working copy to the given revision (HEAD if None).
+        Returns a tuple of (revision, changed_paths). A cleanup is only
+        performed first when needs_cleanup() says it is required."""
+        if this.needs_cleanup():
+            this.cleanup()
+
+        if this.client is not None:
+            return this.__pysvn_update(revision)
+        return this.__cli_update(revision)
+
+    def pending_changes(this, revision=None):
+        """Dry run: return a tuple of (revision, changed_paths) describing
+        what update() would change, without touching the working copy."""
+        if this.client is not None:
+            to_revision = this.__pysvn_revision(revision)
+            target = this.client.info2(this.path, revision=to_revision,
+                                       recurse=False)[0][1].rev.number
+            summary = this.client.diff_summarize(this.path,
+                    revision1=this.pysvn.Revision(
+                            this.pysvn.opt_revision_kind.base),
+                    url_or_path2=this.path,
+                    revision2=to_revision)
+            paths = [os.path.join(this.path, str(item['path']))
+                     for item in summary]
+            return target, sorted(paths)
+
+        rev = revision or 'HEAD'
+        output = subprocess.check_output(
+                ['svn', 'info', '-r', str(rev), this.path])
+        target = int(re.search('Revision:\s(\d+)', output).group(1))
+        output = subprocess.check_output(['svn', 'diff', '--summarize',
+                '-r', 'BASE:%s' % rev, this.path])
+        paths = []
+        for line in output.splitlines():
+            fields = line.split(None, 1)
+            if len(fields) == 2:
+                paths.append(fields[1].strip())
+        return target, sorted(paths)
+
+    def changed_modules(this, paths, modules=None):
+        """Returns a sorted list of the names of the imported modules (taken
+        from sys.modules unless given) whose source is in paths."""
+        if modules is None:
+            modules = sys.modules
+
+        changed = set([os.path.normcase(os.path.abspath(p)) for p in paths])
+        names = []
+        for name, module in modules.items():
+            filename = getattr(module, '__file__', None)
+            if not filename:
+                continue
+            for suffix in COMPILED_SUFFIXES:
+                if filename.endswith(suffix):
+                    filename = filename[:-len(suffix)] + '.py'
+                    break
+            if os.path.normcase(os.path.abspath(filename)) in changed:
+                names.append(name)
+        names.sort()
+        return names
+
+    def __pysvn_revision(this, revision):
+        # If a revision has not been specified update to HEAD.
+        if revision is None:
+            return this.pysvn.Revision(this.pysvn.opt_revision_kind.head)
+        return this.pysvn.Revision(this.pysvn.opt_revision_kind.number,
+                                   int(revision))
+
+    def __pysvn_update(this, revision):
+        actions = [this.pysvn.wc_notify_action.update_add,
+                   this.pysvn.wc_notify_action.update_delete,
+                   this.pysvn.wc_notify_action.update_update]
+        paths = []
+        def notify(event):
+            if event['action'] in actions and event['path']:
+                paths.append(str(event['path']))
+
+        this.client.callback_notify = notify
+        try:
+            revision = this.client.update(this.path,
+                    revision=this.__pysvn_revision(revision))[0].number
+        finally:
+            this.client.callback_notify = None
+
+        # Negative numbers indicate an SVN update error code.
+        if revision < 0:
+            raise SvnUpdateError('Error(%d) during SVN update.' % revision)
+        return revision, sorted(set(paths))
+
+    def __cli_update(this, revision):
+        cmd = ['svn', 'update', this.path]
+        if revision is not None:
+            cmd += ['-r', str(revision)]
+        output = subprocess.check_output(cmd)
+
+        paths = []
+        for line in output.splitlines():
+            # Changed items are reported as up to four status columns
+            # (eg "U    path", " U   path", "UU   path") followed by the path
+            match = re.match('^[ADUCGE ][ADUCGE ]{0,3}\s+(\S.*)$', line)
+            if match and line.strip()[0] in 'ADUCGE':
+                paths.append(match.group(1).strip())
+
+        match = re.search('revision\s(\d+).', output)
+        if match is None:
+            raise SvnUpdateError('Unable to parse svn output: %s' % output)
+        return int(match.group(1)), sorted(set(paths))
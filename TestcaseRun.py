@@ -0,0 +1,64 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the execution of a single testcase, for the
+parallel executor and the process isolated workers, which run testcases one
+by one rather than through the runner core's suite loop.
+
+A testcase is run by calling its setUp() (if it has one), its run() and its
+tearDown() (if it has one). run() either returns the result ('pass',
+'fail', 'block', ...) or sets testcase.result itself, and a testcase which
+does neither passed. An AssertionError fails the testcase, any other
+exception makes it an error, and its traceback goes to the testcase log.
+startTime and finishTime are set around the whole run.
+'''
+import time
+import traceback
+import logging
+
+LOGGER = logging.getLogger("automation")
+
+PASS  = 'pass'
+FAIL  = 'fail'
+ERROR = 'error'
+
+def _log(testcase, message):
+    log = getattr(testcase, 'log', None)
+    if log is None:
+        log = testcase.log = []
+    log.append((time.time(), message))
+
+def run_testcase(testcase):
+    """Run a single testcase, recording its result, start and finish time"""
+    testcase.result     = None
+    testcase.startTime  = time.time()
+    testcase.finishTime = 0
+    try:
+        try:
+            setup = getattr(testcase, 'setUp', None)
+            if setup is not None:
+                setup()
+            result = testcase.run()
+            if result is not None:
+                testcase.result = result
+            elif testcase.result is None:
+                testcase.result = PASS
+        except AssertionError, exc:
+            _log(testcase, 'Assertion failed: %s' % exc)
+            testcase.result = FAIL
+        except Exception:
+            _log(testcase, traceback.format_exc())
+            testcase.result = ERROR
+    finally:
+        teardown = getattr(testcase, 'tearDown', None)
+        if teardown is not None:
+            try:
+                teardown()
+            except Exception:
+                _log(testcase, traceback.format_exc())
+                if testcase.result in [None, PASS]:
+                    testcase.result = ERROR
+        testcase.finishTime = time.time()
+    LOGGER.info('Testcase %s: %s' %(getattr(testcase, 'friendlyName',
+                                            testcase.__class__.__name__),
+                                    testcase.result))
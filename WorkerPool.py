@@ -0,0 +1,303 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the pool of process isolated testcase workers.
+
+Each worker is a separate python process which imports config, NetDevice,
+HostInfo and the suite module once when it starts, then runs testcases one
+at a time on request. A suite given as a path rather than a module name is
+loaded from its source file. The runner talks to a worker over a pipe:
+
+    runner -> worker    ('run', module name, class name, attributes)
+                        ('quit',)
+    worker -> runner    ('ready', pid)
+                        ('done', record)    the TESTCASE_FIELDS of the run
+                        ('error', traceback)
+
+A testcase that takes its worker down (a crash in an extension, os._exit,
+a segfault, ...) is reported as a crash, and the worker is replaced by a
+freshly started one in the background, so the service itself stays up and
+the next testcase does not pay for the imports. Workers are started in the
+background as well, a testcase waits for the first one to be ready.
+
+The testcase object is rebuilt in the worker from its module and class, so
+only the attributes passed along (see WorkerPool.run) and the results of
+the run cross the process boundary. By default those are the attributes
+the suite set up on the testcase (see testcase_attributes).
+
+Testcases are run with TestcaseRun.run_testcase, unless another function is
+named (cfg.WORKER_RUN_TESTCASE in the service).
+
+multiprocessing is not available on every interpreter (jython), available()
+tells whether a pool can be used at all.
+'''
+import cPickle
+import imp
+import os
+import sys
+import threading
+import time
+import traceback
+import Queue
+import logging
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from Checkpoint import TESTCASE_FIELDS
+
+LOGGER = logging.getLogger("automation")
+
+# Modules every worker imports before it reports as ready
+PRELOAD_MODULES = ['config', 'NetDevice', 'HostInfo']
+
+# The function testcases are run with, unless another one is named
+RUN_TESTCASE = 'TestcaseRun.run_testcase'
+
+class WorkerError(Exception): pass
+
+def available():
+    """Returns True if process isolated workers can be used here"""
+    return multiprocessing is not None and not sys.platform.startswith('java')
+
+def _resolve(name):
+    """Returns the object a dotted module.attribute name refers to"""
+    (module_name, attribute) = name.rsplit('.', 1)
+    __import__(module_name)
+    return getattr(sys.modules[module_name], attribute)
+
+def testcase_attributes(testcase):
+    """Returns the attributes of a testcase to pass to its worker: the plain
+    (picklable) values the suite set on it, without the results"""
+    testcase = getattr(testcase, '_testcase', None) or testcase
+    values = {}
+    for name, value in vars(testcase).items():
+        if name.startswith('_') or name in TESTCASE_FIELDS:
+            continue
+        try:
+            cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            continue
+        values[name] = value
+    return values
+
+def is_path(module):
+    """Returns True if a suite module is given as a path to its source"""
+    return module.endswith('.py') or '/' in module or os.sep in module
+
+def _preload(name, source):
+    """Import a module, or load it from its source file if it has one"""
+    if source is None:
+        __import__(name)
+        return
+    module_name = os.path.splitext(os.path.basename(source))[0]
+    if module_name not in sys.modules:
+        imp.load_source(module_name, source)
+
+def _worker_main(conn, path, modules, run_name):
+    """The main loop of a worker process"""
+    sys.path[:] = path
+    for (name, source) in modules:
+        _preload(name, source)
+    run = _resolve(run_name)
+    conn.send(('ready', multiprocessing.current_process().pid))
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request[0] == 'quit':
+            return
+        (kind, module_name, class_name, attributes) = request
+        try:
+            __import__(module_name)
+            testcase = getattr(sys.modules[module_name], class_name)()
+            for name, value in attributes.items():
+                setattr(testcase, name, value)
+            run(testcase)
+            conn.send(('done', dict([(field, getattr(testcase, field, None))
+                                     for field in TESTCASE_FIELDS])))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+class Worker(object):
+    '''A single worker process and the runner's end of its pipe'''
+
+    def __init__(this, modules, run_name):
+        (this.conn, child_conn) = multiprocessing.Pipe()
+        this.process = multiprocessing.Process(target=_worker_main,
+                args=(child_conn, list(sys.path), modules, run_name),
+                name='TestcaseWorker')
+        this.process.daemon = True
+        this.process.start()
+        child_conn.close()
+        this.pid = None
+
+    def wait_ready(this, timeout):
+        """Wait for the worker to finish its imports"""
+        if not this.conn.poll(timeout):
+            raise WorkerError('Worker did not start within %ds' % timeout)
+        (kind, this.pid) = this.conn.recv()
+
+    def call(this, request, timeout=None):
+        """Send a request and return the reply. Raises EOFError if the
+        worker died, or WorkerError if it did not reply within timeout."""
+        this.conn.send(request)
+        if timeout is not None and not this.conn.poll(timeout):
+            raise WorkerError('Worker %s timed out after %ds'
+                              %(this.pid, timeout))
+        return this.conn.recv()
+
+    def alive(this):
+        return this.process.is_alive()
+
+    def close(this, timeout=5):
+        try:
+            this.conn.send(('quit',))
+        except (IOError, EOFError):
+            pass
+        this.process.join(timeout)
+        if this.process.is_alive():
+            this.process.terminate()
+        this.conn.close()
+
+class WorkerPool(object):
+    '''
+    A pool of pre-started testcase worker processes.
+
+        size          - the number of worker processes
+        suite_module  - the suite module, preloaded by every worker
+        run_name      - the dotted name of the function the workers run a
+                        testcase with, called with the testcase
+        start_timeout - seconds to wait for a new worker to be ready
+        suite_source  - the suite source file, if suite_module is a path
+                        that cannot be imported as it is
+    '''
+
+    def __init__(this, size, suite_module, run_name=RUN_TESTCASE,
+                 start_timeout=120, suite_source=None):
+        if not available():
+            raise WorkerError('Process isolated workers are not supported '
+                              'on this platform')
+        this.size          = size
+        this.suite_module  = suite_module
+        this.run_name      = run_name
+        this.start_timeout = start_timeout
+        this.modules       = [(name, None) for name in PRELOAD_MODULES] + \
+                             [(suite_module, suite_source)]
+        this.idle          = Queue.Queue()
+        this.workers       = []
+        this.lock          = threading.Lock()
+        this.closed        = False
+        this.starting      = 0
+        this.crashes       = 0
+        for i in range(size):
+            this.__spawn()
+
+    def run(this, testcase, attributes=None, timeout=None):
+        """Run testcase on the next idle worker, and copy the results of the
+        run onto it. The worker's testcase gets the given attributes, or the
+        ones of testcase_attributes(). A worker that dies during the run
+        marks the testcase as crashed, and is replaced."""
+        if attributes is None:
+            attributes = testcase_attributes(testcase)
+        manifest = getattr(testcase, '_manifest', None)
+        if manifest is not None:
+            (module_name, class_name) = (manifest.module_name,
+                                         manifest.class_name)
+        else:
+            (module_name, class_name) = (testcase.__class__.__module__,
+                                         testcase.__class__.__name__)
+
+        worker = this.__next_idle()
+        start = time.time()
+        try:
+            (kind, value) = worker.call(('run', module_name, class_name,
+                                         attributes), timeout)
+        except (EOFError, IOError, WorkerError), exc:
+            LOGGER.error('Worker %s lost running %s: %s'
+                         %(worker.pid, testcase.friendlyName, exc))
+            with this.lock:
+                this.crashes += 1
+            this.__replace(worker)
+            testcase.startTime  = start
+            testcase.finishTime = time.time()
+            testcase.result     = 'crash'
+            return
+        this.idle.put(worker)
+
+        if kind == 'error':
+            LOGGER.error('Testcase %s failed in worker %s:\n%s'
+                         %(testcase.friendlyName, worker.pid, value))
+            testcase.startTime  = start
+            testcase.finishTime = time.time()
+            testcase.result     = 'error'
+            return
+        for field, field_value in value.items():
+            setattr(testcase, field, field_value)
+
+    def close(this):
+        """Stop every worker"""
+        with this.lock:
+            this.closed = True
+            workers = list(this.workers)
+            this.workers = []
+        for worker in workers:
+            worker.close()
+
+    def __next_idle(this):
+        while True:
+            try:
+                return this.idle.get(True, 1)
+            except Queue.Empty:
+                with this.lock:
+                    if not this.workers and not this.starting:
+                        raise WorkerError('No testcase workers left')
+
+    def __start_worker(this):
+        worker = Worker(this.modules, this.run_name)
+        with this.lock:
+            this.workers.append(worker)
+        try:
+            worker.wait_ready(this.start_timeout)
+        except Exception:
+            with this.lock:
+                this.workers.remove(worker)
+            worker.close(timeout=0)
+            raise
+        with this.lock:
+            closed = this.closed
+            if closed and worker in this.workers:
+                this.workers.remove(worker)
+        if closed:
+            worker.close()
+        else:
+            this.idle.put(worker)
+
+    def __replace(this, worker):
+        """Drop a dead worker, and start a new one in the background"""
+        with this.lock:
+            if worker in this.workers:
+                this.workers.remove(worker)
+        worker.close(timeout=0)
+        this.__spawn()
+
+    def __spawn(this):
+        """Start a new worker in the background, it is handed out once it
+        finished its imports"""
+        def start():
+            try:
+                this.__start_worker()
+            except Exception, exc:
+                LOGGER.exception(exc)
+            with this.lock:
+                this.starting -= 1
+        with this.lock:
+            if this.closed:
+                return
+            this.starting += 1
+        thread = threading.Thread(target=start, name='WorkerStart')
+        thread.setDaemon(True)
+        thread.start()
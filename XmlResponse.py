@@ -0,0 +1,82 @@
+'''
+Created on Oct 19, 2026
+
+@note: This file contains the XML response builder shared by the commands.
+
+A response is built by appending its pieces to a list, and joined once at
+the end, so building it takes linear time however many testcases or log
+messages it holds. Building a response out of repeated string concatenation
+is quadratic.
+
+Text is escaped (unicode text is encoded to utf-8 first), and CDATA sections are split wherever the text contains
+"]]>" (which would otherwise end the section early and break the whole
+response), eg a log message quoting another XML document.
+'''
+
+def escape(text):
+    """Escape text for use as XML character data"""
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return str(text).replace('&', '&amp;').replace('<', '&lt;') \
+                    .replace('>', '&gt;')
+
+def escape_attr(text):
+    """Escape text for use as a (double quoted) XML attribute value"""
+    return escape(text).replace('"', '&quot;')
+
+def cdata(text):
+    """Wrap text in a CDATA section, splitting it around any "]]>" """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return '<![CDATA[%s]]>' % str(text).replace(']]>', ']]]]><![CDATA[>')
+
+class XmlResponse(object):
+    '''
+    An XML document built from a list of chunks.
+
+    The methods return the builder, so calls can be chained. Every element
+    ends its line, and is prefixed by the given indent.
+    '''
+
+    def __init__(this):
+        this.parts = []
+
+    def open(this, tag, indent='', **attrs):
+        this.parts.append('%s<%s%s>\n' %(indent, tag, this.__attrs(attrs)))
+        return this
+
+    def close(this, tag, indent=''):
+        this.parts.append('%s</%s>\n' %(indent, tag))
+        return this
+
+    def element(this, tag, value, indent='', **attrs):
+        """Add <tag>value</tag>, with value escaped"""
+        this.parts.append('%s<%s%s>%s</%s>\n' %(indent, tag,
+                          this.__attrs(attrs), escape(value), tag))
+        return this
+
+    def cdata(this, tag, value, indent='', **attrs):
+        """Add <tag><![CDATA[value]]></tag>"""
+        this.parts.append('%s<%s%s>%s</%s>\n' %(indent, tag,
+                          this.__attrs(attrs), cdata(value), tag))
+        return this
+
+    def raw(this, text):
+        """Add text which is already XML"""
+        this.parts.append(text)
+        return this
+
+    def extend(this, chunks):
+        """Add every chunk yielded by a generator of XML text"""
+        this.parts.extend(chunks)
+        return this
+
+    def getvalue(this):
+        return ''.join(this.parts)
+
+    def __str__(this):
+        return this.getvalue()
+
+    def __attrs(this, attrs):
+        return ''.join([' %s="%s"' %(name, escape_attr(value))
+                        for (name, value) in sorted(attrs.items())])
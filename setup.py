@@ -24,6 +24,14 @@ if not (sys.version_info[0] == 2 and sys.version_info[1] >= 5):
     """
     sys.exit(1)
 
+# With --non-interactive (or -y) the script never waits for return to be
+# pressed, so it can be driven remotely (see FleetSetup.py)
+INTERACTIVE = True
+for flag in ['--non-interactive', '-y']:
+    while flag in sys.argv:
+        sys.argv.remove(flag)
+        INTERACTIVE = False
+
 # Figure out the base directory
 BASEDIR = sys.path[-1] # Best guess
 LIBDIR  = BASEDIR + os.sep + 'lib'
@@ -38,12 +46,29 @@ sys.path.append(LIBDIR)
 os.chdir(LIBDIR)
 
 import getpass
-import HostInfo
+import time
+import HostInfoCache
+import HostRegistry
+import NetworkTable
 import subprocess
 import ServerConnection
 SERVICE_NAME = 'CiscoAutomationRunner'
 
-HOST_INFO = HostInfo.HostInfo()
+# The hosts registry requests are only in ServerConnection_old so far, lend
+# them to the ServerConnection in use (both classes are named the same, so
+# they reach its private __request)
+try:
+    import ServerConnection_old
+except ImportError:
+    ServerConnection_old = None
+for _request in ['register_machine_request', 'unregister_machine_request']:
+    if ServerConnection_old is not None and \
+       not hasattr(ServerConnection.ServerConnection, _request):
+        setattr(ServerConnection.ServerConnection, _request,
+                getattr(ServerConnection_old.ServerConnection,
+                        _request).im_func)
+
+HOST_INFO = HostInfoCache.get_host_info()
 
 # This is the init script that will be used on Linux systems
 REDHAT_INIT_SCRIPT = """#!/bin/bash
@@ -262,92 +287,202 @@ else:
 
 def run_cmd(cmd):
     """Fetches the ip address of the machine
-       Calls function to establish connection to deathstar
        Parameter : cmd for mac and linux: ifconfig
                    cmd for widnows: ipconfig
-       returns host_ip,sftp,lines """
-    prefix = W_config.NETWORKS.Management.Prefix
+       returns host_ip """
     s = subprocess.Popen(cmd, shell = 'True', stdout = subprocess.PIPE)
     output = s.communicate()[0]
-    data = output.split()
-    for i in data:
-        if i.startswith(prefix):
-            index_i = data.index(i)
-            break
-    host_ip=data[index_i]
-    sftp,lines = ssh_to_deathstar()
-    return host_ip,sftp,lines
-
-def check(lines,host_ip,host_name=''):
-    """Checks if the host ip address or the host name is already registered in deathstar
-       parameters : lines from /etc/hosts file, host ip, host name
-       return True if a match is found, else returns false """
-    flag = False
-    for line in lines:
-        ip_address = line.split()[0]
-        machine_name = line.split()[1]
-        if host_ip == ip_address: 
-            print("IP address {} already registered in deathstar".format(host_ip))
-            flag = True
-            break
-        elif host_name == machine_name:
-            print("Host name {} already registererd in deathstar".format(host_name))
-            flag = True
-            break
-    return flag
-
-def ssh_to_deathstar():
-    #Establishes SSH Connection to deathstar, opens /etc/hosts and stores the lines of the file
-    ip = W_config.DEATHSTAR_IP
-    username = W_config.DEATHSTAR_USERNAME
-    password = W_config.DEATHSTAR_PASSWORD
-    try:
+    host_ip = NetworkTable.get_table().address_on('Management', output)
+    if host_ip is None:
+        print "ERROR: no address on the Management network in %s output" % cmd
+        sys.exit(1)
+    return host_ip
+
+class SetupSession(object):
+    """The connections used by one install or removal.
+
+    The SSH/SFTP session to deathstar is opened the first time it is needed,
+    and then used for every read and write of the hosts file, which is read
+    and parsed only once. The dashboard requests all go through the one
+    ServerConnection (which still opens a socket per request). close()
+    (or leaving a with block) closes the SSH session, whatever happened.
+    The time taken by each step is recorded in timings, with how deeply it
+    is nested in other steps (a step's time includes the time of the steps
+    nested in it, so only the top level steps add up), and the steps which
+    only warned about a failure record it in failures, so the script can
+    still exit with an error."""
+
+    def __init__(this):
+        this.ssh     = None
+        this.sftp    = None
+        this.hosts   = None
+        this.server  = ServerConnection.ServerConnection()
+        this.timings = []   # (name, seconds, depth) in the order started
+        this.depth   = 0
+        this.failures = []
+
+    def __enter__(this):
+        return this
+
+    def __exit__(this, exc_type, exc_value, traceback):
+        this.close()
+        return False
+
+    def step(this, name, function, *args):
+        """Run function(*args) as a named step, and record how long it took"""
+        # a step is listed before the steps nested in it
+        index = len(this.timings)
+        this.timings.append((name, 0.0, this.depth))
+        start = time.time()
+        this.depth += 1
+        try:
+            return function(*args)
+        finally:
+            this.depth -= 1
+            this.timings[index] = (name, time.time() - start, this.depth)
+
+    def failed(this, what):
+        """Record a failure the setup carried on after"""
+        this.failures.append(what)
+
+    def open_sftp(this):
+        """Returns the SFTP session to deathstar, connecting the first time"""
+        if this.sftp is None:
+            this.step('connect to deathstar', this.__connect)
+        return this.sftp
+
+    def __connect(this):
         print ("Connecting to deathstar..............")
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(ip,22,username,password)
-        sftp=ssh.open_sftp()
-        f = sftp.open(file_path,'r')
-        lines = f.readlines()
+        this.ssh = paramiko.SSHClient()
+        this.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        this.ssh.connect(W_config.DEATHSTAR_IP,22,
+                         W_config.DEATHSTAR_USERNAME,
+                         W_config.DEATHSTAR_PASSWORD)
+        this.sftp = this.ssh.open_sftp()
         print ("Successfully connected to deathstar")
-    except:
-        e = sys.exc_info()[0]
-        print e
-        print ("Failed to establish SSH connection")
-    return sftp,lines
 
-def register_machine(host_ip,sftp,lines):
+    def hosts_file(this):
+        """Returns deathstar's /etc/hosts file (a HostRegistry.HostsFile),
+        reading it the first time"""
+        if this.hosts is None:
+            f = this.open_sftp().open(file_path,'r')
+            try:
+                this.hosts = HostRegistry.HostsFile(f.readlines())
+            finally:
+                f.close()
+        return this.hosts
+
+    def close(this):
+        if this.sftp is not None:
+            this.sftp.close()
+            this.sftp = None
+        if this.ssh is not None:
+            this.ssh.close()
+            this.ssh = None
+
+    def report(this):
+        """Print the time taken by each step, the nested steps indented
+        under the step they are part of"""
+        print "\n>> Timings"
+        total = 0.0
+        for (name, seconds, depth) in this.timings:
+            print "   %-30s %7.2fs" %('  ' * depth + name, seconds)
+            if depth == 0:
+                total += seconds
+        print "   %-30s %7.2fs" %('total', total)
+        if this.failures:
+            print "\n>> Failures"
+            for what in this.failures:
+                print "   %s" % what
+
+def register_machine(host_ip,session):
     """ Registers the machine in deathstar
-        Parameters : host ip, sftp,lines of the /etc/hosts file
-        Checks if the machine is already registered, if it is not registered, writes the machine info to /etc/hosts file"""
+        Parameters : host ip, setup session
+        Asks the dashboard service to register the machine (replacing any old
+        entry of its name or address), and falls back to editing deathstar's
+        /etc/hosts file over SFTP if the service does not support it"""
     host_name = socket.gethostname()
-    machine_info = host_ip+"   "+host_name+"\n"
-    print ("Machine's ip address and hostname is {}".format(machine_info))
-    if (check(lines,host_ip,host_name)):
-        print ("Cannot register the machine in deathstar")
+    print ("Machine's ip address and hostname is {}   {}".format(host_ip,host_name))
+    # older ServerConnection modules do not have the request at all
+    request = getattr(session.server,'register_machine_request',None)
+    if request is None:
+        print ("Registration service not supported, editing the hosts file")
     else:
-        try:
-            f = sftp.open(file_path,'a')
-            f.write(machine_info)
-            f.close()
+        msg = request(host_ip,host_name)
+        if msg.code == 'ack':
             print ("Machine registered successfully")
-        except:
-            print ("Unable to open \etc\host file")
+            return
+        print ("Registration service unavailable ({}), editing the hosts file".format(msg.error))
+    try:
+        session.hosts_file()
+    except Exception, e:
+        print e
+        print ("Failed to establish SSH connection")
+        session.failed("machine not registered in deathstar")
+        return
+    register_machine_sftp(host_ip,host_name,session)
+
+def register_machine_sftp(host_ip,host_name,session):
+    """ Registers the machine in deathstar's /etc/hosts file
+        Parameters : host ip, host name, setup session
+        Like the hosts registry, replaces any entry of the machine's address
+        or name (a re-imaged machine keeps its name, gets a new address), and
+        writes the file back"""
+    hosts = session.hosts_file()
+    if hosts.lookup_ip(host_ip) == [host_name]:
+        print ("Machine already registered in deathstar")
+        return
+    try:
+        replaced = hosts.apply(add=[(host_ip,host_name)])
+        f = session.sftp.open(file_path,'w')
+        f.write(hosts.text())
+        f.close()
+        for (ip_address,names) in replaced:
+            print("Replaced {}   {}".format(ip_address," ".join(names)))
+        print ("Machine registered successfully")
+    except:
+        print ("Unable to open \etc\host file")
+        session.failed("machine not registered in deathstar")
+
+def remove_machine_registration(host_ip,session):
+    """ Removes a machine entry from deathstar's hosts registry
+        Parameters : host ip, setup session
+        Asks the dashboard service to remove the machine, and falls back to
+        rewriting deathstar's /etc/hosts file over SFTP if the service does
+        not support it"""
+    request = getattr(session.server,'unregister_machine_request',None)
+    if request is None:
+        print ("Registration service not supported, editing the hosts file")
+    else:
+        msg = request(host_ip)
+        if msg.code == 'ack':
+            print ("Removed the machine entry from deathstar successfully")
+            return
+        print ("Registration service unavailable ({}), editing the hosts file".format(msg.error))
+    try:
+        session.hosts_file()
+    except Exception, e:
+        print e
+        print ("Failed to establish SSH connection")
+        session.failed("machine entry not removed from deathstar")
+        return
+    remove_machine_registration_sftp(host_ip,session)
 
-def remove_machine_registration(host_ip,sftp,lines):
+def remove_machine_registration_sftp(host_ip,session):
     """ Removes a machine entry from deathstar's /etc/hosts file
-        Parameters : host ip, lines
+        Parameters : host ip, setup session
         Checks if the machine is registered, if it is, it is removed from /etc/hosts"""
-    if (check(lines,host_ip)):
+    hosts = session.hosts_file()
+    if hosts.lookup_ip(host_ip):
         try:
-            new_file = sftp.open(file_path,'w')
-            for line in lines:
-                if line.split()[0]!= host_ip:
-                    new_file.write(line)
+            hosts.apply(remove=[host_ip])
+            new_file = session.sftp.open(file_path,'w')
+            new_file.write(hosts.text())
             new_file.close()
             print ("Removed the machine entry from deathstar successfully")
         except:
             print("Unable to open \etc\host file")
+            session.failed("machine entry not removed from deathstar")
     else:
         print("Machine is not registered under deathstar")
 
@@ -365,7 +500,7 @@ if HOST_INFO.isWindows():
     import _winreg
     import win32api, win32pdhutil, win32con
 
-    def __install_automation_win32():
+    def __install_automation_win32(session):
         # Try to stop and remove any old service first
         try: win32serviceutil.StopService(SERVICE_NAME)
         except pywintypes.error, err: pass
@@ -396,12 +531,12 @@ if HOST_INFO.isWindows():
         print "success!"
 
         #Register machine in deathstar
-        host_ip,sftp,lines = run_cmd('ipconfig')
-        register_machine(host_ip,sftp,lines)
+        host_ip = run_cmd('ipconfig')
+        session.step('register machine', register_machine, host_ip, session)
         
         
 
-    def __remove_automation_win32():
+    def __remove_automation_win32(session):
         # remove any old service
         try: win32serviceutil.StopService(SERVICE_NAME)
         except pywintypes.error, err: pass
@@ -435,8 +570,8 @@ if HOST_INFO.isWindows():
                 win32api.CloseHandle(handle) #close api
             print "success!"
             #Remove the machine entry from deathstar
-            host_ip,sftp,lines = run_cmd('ipconfig')
-            remove_machine_registration(host_ip,sftp,lines)
+            host_ip = run_cmd('ipconfig')
+            session.step('unregister machine', remove_machine_registration, host_ip, session)
         except:
             print "failed to remove tray icon"
 
@@ -447,7 +582,7 @@ if HOST_INFO.isWindows():
 #
 ################################################################################
 elif HOST_INFO.isLinux():
-    def __install_automation_linux():
+    def __install_automation_linux(session):
         # ensure permissions
         check_user()
 
@@ -490,11 +625,11 @@ elif HOST_INFO.isLinux():
         print "success!"
 
         #Register machine in deathstar
-        host_ip,sftp,lines = run_cmd('ifconfig')
-        register_machine(host_ip,sftp,lines)
+        host_ip = run_cmd('ifconfig')
+        session.step('register machine', register_machine, host_ip, session)
         
 
-    def __remove_automation_linux():
+    def __remove_automation_linux(session):
         # ensure permissions
         check_user()
 
@@ -523,8 +658,8 @@ elif HOST_INFO.isLinux():
         os.unlink('/etc/init.d/%s' %SERVICE_NAME)
         print "success!"
         #Remove machine entry from deathstar
-        host_ip,sftp,lines = run_cmd('ifconfig')
-        remove_machine_registration(host_ip,sftp,lines)
+        host_ip = run_cmd('ifconfig')
+        session.step('unregister machine', remove_machine_registration, host_ip, session)
 
 
 ################################################################################
@@ -533,7 +668,7 @@ elif HOST_INFO.isLinux():
 #
 ################################################################################
 elif HOST_INFO.isMac():
-    def __install_automation_mac():
+    def __install_automation_mac(session):
         # put init script in place
         plist_file = '/Library/LaunchDaemons/%s.plist'%SERVICE_NAME
         fp = open(plist_file, 'w')
@@ -555,11 +690,11 @@ elif HOST_INFO.isMac():
         print "success!"
 
         #Register machine in deathstar
-        host_ip,sftp,lines = run_cmd('ifconfig')
-        register_machine(host_ip,sftp,lines)
+        host_ip = run_cmd('ifconfig')
+        session.step('register machine', register_machine, host_ip, session)
         
 
-    def __remove_automation_mac():
+    def __remove_automation_mac(session):
         # stop service
         rc = subprocess.call('launchctl stop %s' %SERVICE_NAME, shell=True)
 
@@ -575,8 +710,8 @@ elif HOST_INFO.isMac():
         os.unlink(plist_file)
         print "success!"
         #Remove machine entry from deathstar
-        host_ip,sftp,lines = run_cmd('ifconfig')
-        remove_machine_registration(host_ip,sftp,lines)
+        host_ip = run_cmd('ifconfig')
+        session.step('unregister machine', remove_machine_registration, host_ip, session)
 
 
 ################################################################################
@@ -600,10 +735,10 @@ def check_user():
             print "ERROR: You must be root to install automation!"
             exit(1)
 
-def register_host(module,testbed_id):
+def register_host(module,testbed_id,session):
     """request that this machine get added to the automation database"""
     print "\n>> Sending request to automation server to be added to database"
-    sc = ServerConnection.ServerConnection()
+    sc = session.server
     msg = sc.add_host_request()
     
 
@@ -615,19 +750,23 @@ def register_host(module,testbed_id):
             if testbed_id:
                 msg = sc.add_host_resourcepool_request()
                 print msg.code
+                if msg.code != 'ack':
+                    session.failed("host not added to the resource pool")
         else:
             print "WARNING: could not add this host to the database: " + \
                 str(msg.error)
+            session.failed("host capability not mapped in the database")
         
             
     else:
         print "WARNING: could not add this host to the database: " + \
                 str(msg.error)
+        session.failed("host not added to the database")
 
-def unregister_host():
+def unregister_host(session):
     """request that this machine get removed from the automation database"""
     print "\n>> Sending request to automation server to be removed from database"
-    sc = ServerConnection.ServerConnection()
+    sc = session.server
     msg = sc.remove_host_request()
 
     if msg.code == 'ack':
@@ -635,20 +774,28 @@ def unregister_host():
     else:
         print "WARNING: could not remove this host from the database: " + \
                 str(msg.error)
+        session.failed("host not removed from the database")
 
 def install_automation(module,resource_pool_flag=False):
-    """Installs the automation and adds the host to the DB"""
+    """Installs the automation and adds the host to the DB. Returns the
+    failures the install carried on after."""
     print ">> Installing Cisco Automation Service ... "
-    if HOST_INFO.isWindows():
-        __install_automation_win32()
-    elif HOST_INFO.isLinux():
-        __install_automation_linux()
-    elif HOST_INFO.isMac():
-        __install_automation_mac()
-    else:
-        raise NotImplementedError('platform %s not yet supported' %
-                                  HOST_INFO.system)
-    register_host(module,resource_pool_flag)
+    with SetupSession() as session:
+        try:
+            if HOST_INFO.isWindows():
+                session.step('install', __install_automation_win32, session)
+            elif HOST_INFO.isLinux():
+                session.step('install', __install_automation_linux, session)
+            elif HOST_INFO.isMac():
+                session.step('install', __install_automation_mac, session)
+            else:
+                raise NotImplementedError('platform %s not yet supported' %
+                                          HOST_INFO.system)
+            session.step('register host', register_host, module,
+                         resource_pool_flag, session)
+        finally:
+            session.report()
+    return session.failures
     # if resource_pool_flag:
         # register_host(module,'resource-pool')
     # else:
@@ -657,33 +804,42 @@ def install_automation(module,resource_pool_flag=False):
     
 
 def remove_automation():
-    """removes the automation and remove the host from the DB"""
+    """removes the automation and remove the host from the DB. Returns the
+    failures the removal carried on after."""
     print ">> Removing Cisco Automation Service ... "
-    if HOST_INFO.isWindows():
-        __remove_automation_win32()
-    elif HOST_INFO.isLinux():
-        __remove_automation_linux()
-    elif HOST_INFO.isMac():
-        __remove_automation_mac()
-    else:
-        raise NotImplementedError('platform %s not yet supported' %
-                                  HOST_INFO.system)
-
-    unregister_host()
+    with SetupSession() as session:
+        try:
+            if HOST_INFO.isWindows():
+                session.step('remove', __remove_automation_win32, session)
+            elif HOST_INFO.isLinux():
+                session.step('remove', __remove_automation_linux, session)
+            elif HOST_INFO.isMac():
+                session.step('remove', __remove_automation_mac, session)
+            else:
+                raise NotImplementedError('platform %s not yet supported' %
+                                          HOST_INFO.system)
+
+            session.step('unregister host', unregister_host, session)
+        finally:
+            session.report()
+    return session.failures
 
 
 def usage():
-    print "setup.py [-h, -r]"
+    print "setup.py [-h, -r] [--non-interactive]"
     print ""
     print "Automation setup script:"
     print "Run without arguments to install automation"
     print "Run with --remove or -r to remove automation and"\
             + " remove host from DB"
+    print "Run with --non-interactive or -y to exit without waiting for"\
+            + " return to be pressed"
     exit()
 
 def exit(rc=0):
-    sys.stdout.write("\n\nPress return to exit...")
-    sys.stdin.readline()
+    if INTERACTIVE and sys.stdin.isatty():
+        sys.stdout.write("\n\nPress return to exit...")
+        sys.stdin.readline()
     sys.exit(rc)
 
 if __name__ == "__main__":
@@ -695,13 +851,14 @@ if __name__ == "__main__":
         #print type(sys.argv[3])
         if 'resource-pool' in sys.argv[3]:
             resource_pool_flag = True
-            install_automation(module,resource_pool_flag)
+            failures = install_automation(module,resource_pool_flag)
         else:
-            install_automation(module)
+            failures = install_automation(module)
         
     elif '-r' in sys.argv[1]:
-        remove_automation()
+        failures = remove_automation()
     else:
         usage()
 
-    exit()
+    # the steps which only warned still fail the setup (eg for FleetSetup)
+    exit(failures and 1 or 0)